@@ -1,15 +1,18 @@
 # SPDX-License-Identifier: Apache-2.0
 # app/adapters/hmip_adapter.py – Homematic IP Adapter (wrappt websocket_handler + utils)
 
-import json
 import logging
+import os
 import threading
 from typing import Any, Dict, List, Optional
 
 import app.state as state
 from app.adapters.base import BaseAdapter, Device, DeviceCapability, DeviceChannel
-from app.utils import _locate_devices_container
-from app.adapters.hmip_websocket import ws_loop
+from app.adapters.hmip_store import HmIPStateStore
+from app.adapters.hmip_websocket import stop_processing, ws_loop
+from app.adapters.hmip_writer import WsWriter
+from app.change_feed import get_change_feed
+from app.loxone_udp import PushWorker, start_resync, stop_resync
 
 log = logging.getLogger("bridge-ws")
 
@@ -56,6 +59,42 @@ class HmIPAdapter(BaseAdapter):
     def __init__(self, config: Dict[str, Any]) -> None:
         self._config = config
         self._ws_thread: Optional[threading.Thread] = None
+        # Der Adapter besitzt den In-Memory-Zustand; Routes/Views lesen über state.hmip_store
+        cfg = state.config_internal
+        path = cfg.get("system_state_path", "data/system_state.json")
+        journal_path = os.path.splitext(path)[0] + ".journal" if cfg.get("snapshot_journal", True) else None
+        self._store = HmIPStateStore(
+            path,
+            journal_path=journal_path,
+            journal_max_bytes=int(cfg.get("journal_max_bytes", 1_000_000)),
+            journal_compact_interval_s=float(cfg.get("journal_compact_interval_s", 600)),
+            fsync=bool(cfg.get("snapshot_fsync", False)),
+            feed=get_change_feed(),
+        )
+        state.hmip_store = self._store
+        # Einziger Schreiber auf die HCU-Verbindung; HTTP-Threads stellen nur ein
+        self._writer = WsWriter(
+            maxsize=int(cfg.get("ws_send_queue_size", 500)),
+            coalesce_window_ms=float(cfg.get("command_coalesce_window_ms", 200)),
+            rate=float(cfg.get("ws_send_rate", 10)),
+            burst=float(cfg.get("ws_send_burst", 10)),
+            duty_soft_pct=float(cfg.get("duty_cycle_soft_pct", 50)),
+            duty_hard_pct=float(cfg.get("duty_cycle_hard_pct", 90)),
+            duty_min_factor=float(cfg.get("duty_cycle_min_rate_factor", 0.1)),
+            offline_buffer_size=int(cfg.get("ws_offline_buffer_size", 0)),
+            offline_ttl_s=float(cfg.get("ws_offline_command_ttl_s", 30)),
+        )
+        state.ws_writer = self._writer
+        # Loxone-Push im eigenen Thread: UDP/DNS bremsen nie die HCU-Eventverarbeitung
+        self._loxone = PushWorker(
+            maxsize=int(cfg.get("loxone_push_queue_size", 1000)),
+            resolve_interval_s=float(cfg.get("loxone_resolve_interval_s", 300)),
+        )
+        state.loxone_push = self._loxone
+
+    @property
+    def store(self) -> HmIPStateStore:
+        return self._store
 
     @property
     def name(self) -> str:
@@ -66,6 +105,15 @@ class HmIPAdapter(BaseAdapter):
         return "Homematic IP"
 
     def start(self) -> None:
+        cfg = state.config_internal
+        self._store.start_flusher(
+            interval_ms=float(cfg.get("snapshot_flush_interval_ms", 2000)),
+            max_dirty=int(cfg.get("snapshot_flush_max_dirty", 200)),
+            fsync=bool(cfg.get("snapshot_fsync", False)),
+        )
+        self._writer.start()
+        self._loxone.start()
+        start_resync(self._resync_devices)
         self._ws_thread = threading.Thread(target=ws_loop, daemon=True)
         self._ws_thread.start()
         log.info("HmIP-Adapter: WebSocket-Thread gestartet")
@@ -77,85 +125,66 @@ class HmIPAdapter(BaseAdapter):
             except Exception:
                 pass
             state.conn = None
+        # Erst die Event-Verarbeitung beenden, dann den letzten Snapshot schreiben
+        stop_processing()
+        self._writer.stop()
+        self._loxone.stop()
+        stop_resync()
+        # Ausstehende Änderungen beim Herunterfahren immer persistieren
+        self._store.stop_flusher()
+
+    def _resync_devices(self) -> Optional[Dict[str, Any]]:
+        # Nur bestätigte Werte an Loxone – ein später zurückgerolltes Overlay korrigiert dort niemand
+        return self._store.confirmed_devices()
 
     def is_connected(self) -> bool:
         return state.conn is not None
 
     def get_devices(self) -> List[Device]:
-        snap = self._load_snapshot()
-        if not snap:
-            return []
-        container, _ = _locate_devices_container(snap)
-        if container is None:
+        view = self._store.view()
+        if view is None:
             return []
-
-        devices: List[Device] = []
-        if isinstance(container, dict):
-            for dev_id, dev_data in container.items():
-                if isinstance(dev_data, dict):
-                    devices.append(self._to_device(str(dev_id), dev_data))
-        elif isinstance(container, list):
-            for dev_data in container:
-                if isinstance(dev_data, dict):
-                    dev_id = dev_data.get("id", "")
-                    devices.append(self._to_device(str(dev_id), dev_data))
-        return devices
+        return [self._to_device(str(dev_id), dev_data)
+                for dev_id, dev_data in view.devices.items() if isinstance(dev_data, dict)]
 
     def get_device(self, device_id: str) -> Optional[Device]:
-        snap = self._load_snapshot()
-        if not snap:
-            return None
-        container, _ = _locate_devices_container(snap)
-        if container is None:
+        dev = self._store.get_device(device_id)
+        if dev is None:
             return None
-
-        if isinstance(container, dict):
-            dev = container.get(device_id)
-            if isinstance(dev, dict):
-                return self._to_device(device_id, dev)
-        elif isinstance(container, list):
-            for d in container:
-                if isinstance(d, dict) and d.get("id") == device_id:
-                    return self._to_device(device_id, d)
-        return None
+        return self._to_device(device_id, dev)
 
     def control(self, device_id: str, action: str, params: Optional[Dict[str, Any]] = None) -> bool:
         from app.adapters.hmip_messages import send_hmip_set_switch, send_hmip_set_dim_level
+        from app.adapters.hmip_scheduler import SendQueueFull
         from app.adapters.hmip_websocket import _register_pending
 
         params = params or {}
         if not state.conn:
             log.warning("HmIP: Kein WebSocket verbunden, kann %s nicht ausführen", action)
             return False
-
-        if action == "switch":
-            on = params.get("on", True)
-            channel = params.get("channel", 0)
-            with state.send_lock:
-                rid = send_hmip_set_switch(state.conn, device_id, on, channel_index=channel)
-            _register_pending(rid, "/hmip/device/control/setSwitchState")
-            return True
-
-        if action == "dim":
-            level = params.get("level", 1.0)
-            channel = params.get("channel", 1)
-            with state.send_lock:
-                rid = send_hmip_set_dim_level(state.conn, device_id, level, channel_index=channel)
-            _register_pending(rid, "/hmip/device/control/setDimLevel")
-            return True
+        try:
+            if action == "switch":
+                on = params.get("on", True)
+                channel = params.get("channel", 0)
+                with state.pending_lock:
+                    rid = send_hmip_set_switch(self._writer, device_id, on, channel_index=channel)
+                    _register_pending(rid, "/hmip/device/control/setSwitchState")
+                return True
+
+            if action == "dim":
+                level = params.get("level", 1.0)
+                channel = params.get("channel", 1)
+                with state.pending_lock:
+                    rid = send_hmip_set_dim_level(self._writer, device_id, level, channel_index=channel)
+                    _register_pending(rid, "/hmip/device/control/setDimLevel")
+                return True
+        except SendQueueFull:
+            log.warning("HmIP: Sendewarteschlange voll, %s für %s verworfen", action, device_id)
+            return False
 
         log.warning("HmIP: Unbekannte Action '%s' für %s", action, device_id)
         return False
 
-    @staticmethod
-    def _load_snapshot() -> Optional[Dict[str, Any]]:
-        try:
-            path = state.config_internal.get("system_state_path", "data/system_state.json")
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
-
     @staticmethod
     def _to_device(dev_id: str, raw: Dict[str, Any]) -> Device:
         """Konvertiert ein HmIP-Device-Dict in ein einheitliches Device."""
@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_coalesce.py – Last-write-wins für schnell wiederholte Stellbefehle
+
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import app.state as state
+from app.adapters.hmip_scheduler import OutboundMessage
+from app.adapters.hmip_websocket import _complete_pending
+
+log = logging.getLogger("bridge-ws")
+
+# Befehle mit absolutem Zielwert – ein späterer Wert ersetzt einen früheren vollständig.
+# setSwitchState gehört bewusst nicht dazu (EIN/AUS-Impulse dürfen nicht verschluckt werden).
+COALESCE_PATHS = frozenset({
+    "/hmip/device/control/setDimLevel",
+    "/hmip/device/control/setHueSaturationDimLevel",
+    "/hmip/device/control/setSetPointTemperature",
+    "/hmip/device/control/setShutterLevel",
+    "/hmip/device/control/setSlatsLevel",
+})
+
+Key = Tuple[str, str, int]
+
+
+class _Held:
+    __slots__ = ("rid", "msg", "due", "aliases")
+
+    def __init__(self, rid: str, msg: OutboundMessage, due: float) -> None:
+        self.rid = rid
+        self.msg = msg
+        self.due = due
+        self.aliases: List[str] = []
+
+
+class CommandCoalescer:
+    """Fasst Befehle je (path, deviceId, channelIndex) innerhalb eines Fensters zusammen.
+
+    Der erste Befehl eines Schlüssels geht sofort raus (keine zusätzliche Latenz).
+    Kommen innerhalb von ``window_ms`` weitere, wird nur der jeweils letzte gehalten
+    und am Fensterende weitergegeben. Die Request-IDs ersetzter Befehle werden im
+    Pending-Eintrag des gesendeten Befehls als ``aliases`` vermerkt, damit deren
+    Aufrufer dasselbe ACK erhalten. Lässt sich ein gehaltener Befehl nicht einstellen
+    (Schlange voll), werden er und seine Aliase mit ``dropped`` beendet. Nach
+    ``flush_all`` wird nichts mehr gehalten.
+    """
+
+    def __init__(self, window_ms: float, forward: Callable[[OutboundMessage], None]) -> None:
+        self._window = max(0.0, float(window_ms)) / 1000.0
+        self._forward = forward
+        self._cond = threading.Condition()
+        self._held: Dict[Key, _Held] = {}
+        self._last_sent: Dict[Key, float] = {}
+        self._heap: List[Tuple[float, Key]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.forwarded = 0
+        self.coalesced = 0
+
+    def offer(self, msg: OutboundMessage) -> bool:
+        """True: Befehl wurde übernommen und wird später gesendet. False: sofort selbst senden.
+
+        Gehaltene Befehle anderer Pfade für denselben Kanal werden vorher weitergegeben,
+        damit z.B. ein gehaltenes Dimmen nicht nach einem späteren „Aus“ gesendet wird.
+        """
+        if msg.path is None or msg.target is None or not msg.rid:
+            return False
+        # (path, deviceId, channelIndex) – für jeden Gerätebefehl, nicht nur COALESCE_PATHS
+        key, rid = (msg.path, *msg.target), msg.rid
+        now = time.monotonic()
+        with self._cond:
+            earlier = self._take_channel(key)
+        for held in earlier:
+            self._release(held)
+        if key[0] not in COALESCE_PATHS:
+            return False
+        with self._cond:
+            if self._stopping:
+                return False  # Timer-Thread beendet – niemand würde gehaltene Befehle freigeben
+            held = self._held.get(key)
+            if held is not None:
+                held.aliases.append(held.rid)
+                held.rid, held.msg = rid, msg
+                self.coalesced += 1
+                return True
+            last = self._last_sent.get(key)
+            if last is None or now - last >= self._window:
+                self._last_sent[key] = now
+                self.forwarded += 1
+                return False
+            due = last + self._window
+            self._held[key] = _Held(rid, msg, due)
+            heapq.heappush(self._heap, (due, key))
+            self._ensure_thread()
+            self._cond.notify_all()
+            return True
+
+    def _take_channel(self, key: Key) -> List[_Held]:
+        """Entnimmt gehaltene Befehle anderer Pfade für denselben Kanal. Aufruf nur unter self._cond."""
+        out = []
+        for other in [k for k in self._held if k[1:] == key[1:] and k != key]:
+            out.append(self._held.pop(other))
+            self._last_sent[other] = time.monotonic()
+        return out
+
+    def held_count(self) -> int:
+        return len(self._held)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ws-coalescer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+                due = self._pop_due(time.monotonic())
+            for held in due:
+                self._release(held)
+
+    def _pop_due(self, now: float) -> List[_Held]:
+        """Entnimmt alle fälligen Einträge. Aufruf nur unter self._cond."""
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            _, key = heapq.heappop(self._heap)
+            held = self._held.get(key)
+            if held is not None and held.due <= now:  # veraltete Heap-Einträge (vorzeitig entnommen) überspringen
+                del self._held[key]
+                self._last_sent[key] = now
+                out.append(held)
+        if len(self._last_sent) > 1000:
+            cutoff = now - self._window
+            self._last_sent = {k: t for k, t in self._last_sent.items() if t >= cutoff or k in self._held}
+        return out
+
+    def _release(self, held: _Held) -> None:
+        if held.aliases:
+            with state.pending_lock:
+                meta = state.pending.get(held.rid)
+                if meta is not None:
+                    meta["aliases"] = held.aliases
+        self.forwarded += 1
+        try:
+            self._forward(held.msg)
+        except Exception as e:
+            log.warning("Zusammengefasster Befehl konnte nicht eingestellt werden: %s", e)
+            self._fail(held)
+
+    @staticmethod
+    def _fail(held: _Held) -> None:
+        """Beendet die Pending-Einträge eines verworfenen Befehls samt Aliasen (ACK kommt nie)."""
+        with state.pending_lock:
+            metas = [m for m in (state.pending.pop(rid, None) for rid in [held.rid, *held.aliases])
+                     if m is not None]
+            state.pending_stats["dropped"] += len(metas)
+        for meta in metas:
+            _complete_pending(meta, None, "dropped")
+
+    def flush_all(self) -> None:
+        """Gibt alle gehaltenen Befehle sofort weiter und beendet den Timer-Thread."""
+        with self._cond:
+            self._stopping = True
+            held = list(self._held.values())
+            self._held.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+        for h in held:
+            self._release(h)
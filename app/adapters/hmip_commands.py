@@ -0,0 +1,64 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_commands.py – Gemeinsamer Befehlsweg zur HCU (HTTP-Routen und Loxone-Empfänger)
+
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import app.state as state
+from app.adapters.hmip_websocket import _register_pending
+from app.utils import get_state_store
+
+
+def commands_unavailable() -> Optional[str]:
+    """Grund, warum gerade keine Befehle angenommen werden (sonst None).
+
+    Eine volle Sendewarteschlange wird hier bewusst nicht geprüft (wäre ein Rennen mit
+    anderen Threads) – ``send_command`` meldet sie beim Einstellen als ``SendQueueFull``.
+    """
+    if state.ws_writer is None:
+        return "WS-Writer nicht gestartet"
+    if state.conn is None and not state.ws_writer.buffering:
+        return "WebSocket nicht verbunden"
+    return None
+
+
+def send_command(send_fn: Callable[..., str], path: str, *args: Any,
+                 wait: bool = False) -> Tuple[str, Optional[Future]]:
+    """Stellt einen Befehl über den WS-Writer ein und registriert ihn als pending.
+
+    Beides passiert unter pending_lock, damit ein sehr schnelles ACK nicht vor der
+    Registrierung verarbeitet wird. Mit wait=True kommt eine Future für das ACK zurück.
+    Ist die Schlange voll, fliegt ``SendQueueFull`` (nichts registriert).
+    """
+    with state.pending_lock:
+        rid = send_fn(state.ws_writer, *args)
+        future = _register_pending(rid, path, with_future=wait)
+        apply_optimistic(rid, path, args)
+    return rid, (future if wait else None)
+
+
+# Kanalfelder, die ein Befehl setzt: path → args → (deviceId, channelIndex, {Feld: Wert})
+_OPTIMISTIC_FIELDS: Dict[str, Callable[[tuple], Tuple[str, Any, Dict[str, Any]]]] = {
+    "/hmip/device/control/setSwitchState":
+        lambda a: (a[0], a[2], {"on": a[1]}),
+    "/hmip/device/control/setDimLevel":
+        lambda a: (a[0], a[2], {"dimLevel": a[1]}),
+    "/hmip/device/control/setHueSaturationDimLevel":
+        lambda a: (a[0], a[4], {"hue": a[1], "saturationLevel": a[2], "dimLevel": a[3]}),
+    "/hmip/device/control/setSetPointTemperature":
+        lambda a: (a[0], a[2], {"setPointTemperature": a[1]}),
+}
+
+
+def apply_optimistic(rid: str, path: str, args: tuple) -> None:
+    """Übernimmt den kommandierten Wert sofort in den Store (pending bis zum HCU-Event).
+
+    Aufruf unter pending_lock nach ``_register_pending``, damit ein schnelles
+    Fehler-ACK das Update sicher wieder zurücksetzt.
+    """
+    fields = _OPTIMISTIC_FIELDS.get(path)
+    if fields is None or not rid or not state.config_internal.get("optimistic_updates", True):
+        return
+    device_id, channel, values = fields(args)
+    if get_state_store().apply_optimistic(rid, device_id, channel, values) is not None:
+        state.pending[rid]["optimistic"] = True
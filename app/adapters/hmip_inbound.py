@@ -0,0 +1,107 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_inbound.py – Begrenzte Warteschlange zwischen WS-Empfang und Verarbeitung
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+log = logging.getLogger("bridge-ws")
+
+
+class FrameQueue:
+    """FIFO für empfangene WebSocket-Frames mit Rückstau und Kennzahlen.
+
+    Der Empfangs-Thread stellt nur ein; ist die Schlange voll, blockiert ``put``
+    (echter Rückstau statt verworfener Events – die HCU puffert dann auf ihrer
+    Seite). ``stats`` liefert Tiefe und Alter des ältesten Frames, damit man
+    sieht, wann die Verarbeitung hinterherhinkt. Nach ``close`` werden neue Frames
+    verworfen; ``get`` liefert noch den Rest und danach None.
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self._maxsize = max(1, int(maxsize))
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.received = 0
+        self.processed = 0
+        self.full_waits = 0
+        self.max_depth = 0
+        self._last_wait_ms = 0.0
+        self._max_wait_ms = 0.0
+
+    def put(self, frame: Any) -> None:
+        """Stellt einen Frame ein; blockiert, solange die Schlange voll ist."""
+        with self._cond:
+            if len(self._items) >= self._maxsize and not self._closed:
+                self.full_waits += 1
+                log.warning("Event-Warteschlange voll (%d) – Empfang wartet auf Verarbeitung", self._maxsize)
+                while len(self._items) >= self._maxsize and not self._closed:
+                    self._cond.wait()
+            if self._closed:
+                return
+            self._items.append((time.monotonic(), frame))
+            self.received += 1
+            if len(self._items) > self.max_depth:
+                self.max_depth = len(self._items)
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Tuple[float, Any]]:
+        """Nächster Frame als (Empfangszeit monotonic, Frame) oder None nach timeout bzw. close."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self) -> None:
+        """Nimmt keine Frames mehr an; wartende ``put``/``get`` kehren zurück."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def done(self, enqueued_at: float) -> None:
+        """Meldet einen fertig verarbeiteten Frame (für Durchsatz/Latenz)."""
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        with self._cond:
+            self.processed += 1
+            self._last_wait_ms = wait_ms
+            if wait_ms > self._max_wait_ms:
+                self._max_wait_ms = wait_ms
+
+    def depth(self) -> int:
+        return len(self._items)
+
+    def oldest_age_ms(self) -> int:
+        with self._cond:
+            if not self._items:
+                return 0
+            return int((time.monotonic() - self._items[0][0]) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            oldest = int((time.monotonic() - self._items[0][0]) * 1000) if self._items else 0
+            return {
+                "depth":          len(self._items),
+                "max_depth":      self.max_depth,
+                "capacity":       self._maxsize,
+                "oldest_age_ms":  oldest,
+                "received":       self.received,
+                "processed":      self.processed,
+                "full_waits":     self.full_waits,
+                "last_latency_ms": round(self._last_wait_ms, 1),
+                "max_latency_ms": round(self._max_wait_ms, 1),
+            }
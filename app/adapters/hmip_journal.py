@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_journal.py – Append-only Journal für HMIP_SYSTEM_EVENT-Transaktionen
+
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+log = logging.getLogger("bridge-ws")
+
+
+class EventJournal:
+    """Hängt jede eventTransaction als kompakte JSON-Zeile an eine Datei an.
+
+    Zusammen mit dem Basis-Snapshot ergibt das einen absturzsicheren Zustand:
+    beim Start wird der Snapshot geladen und das Journal darüber abgespielt.
+    Für die Kompaktierung wird das Journal mit ``rotate`` in ein zweites Segment
+    (``<path>.1``) verschoben; neue Events landen sofort wieder im frischen Journal,
+    während der Snapshot geschrieben wird. Erst nach erfolgreichem Schreiben wird das
+    alte Segment mit ``discard_rotated`` gelöscht. Das erneute Abspielen bereits
+    enthaltener Events ist unkritisch, weil der Merge die Felder nur überlagert.
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self._path = path
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        self._rotated_path = path + ".1"
+        self._fh: Optional[Any] = None
+        try:
+            self._size = os.path.getsize(path)
+        except OSError:
+            self._size = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        """True, wenn weder das Journal noch ein rotiertes Segment Einträge enthält."""
+        return self._size == 0 and not os.path.exists(self._rotated_path)
+
+    def _open(self) -> Any:
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            self._fh = open(self._path, "a", encoding="utf-8")
+        return self._fh
+
+    def append(self, tx: Dict[str, Any]) -> None:
+        """Schreibt eine eventTransaction als eigene Zeile (sequentieller Append)."""
+        line = json.dumps(tx, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            fh = self._open()
+            fh.write(line)
+            fh.flush()
+            if self._fsync:
+                os.fsync(fh.fileno())
+            self._size += len(line.encode("utf-8"))
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Liefert alle gespeicherten Transaktionen in Schreibreihenfolge
+        (erst ein rotiertes Segment aus einer abgebrochenen Kompaktierung, dann das Journal).
+
+        Eine abgeschnittene letzte Zeile (Absturz während des Schreibens) wird übersprungen.
+        """
+        for path in (self._rotated_path, self._path):
+            yield from self._replay_file(path)
+
+    @staticmethod
+    def _replay_file(path: str) -> Iterator[Dict[str, Any]]:
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with f:
+            for lineno, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    tx = json.loads(line)
+                except ValueError:
+                    log.warning("Journal %s: Zeile %d unlesbar – übersprungen", path, lineno)
+                    continue
+                if isinstance(tx, dict):
+                    yield tx
+
+    def rotate(self) -> None:
+        """Schließt das aktuelle Segment ab und beginnt ein leeres Journal (Beginn der Kompaktierung).
+
+        Liegt noch ein Segment einer fehlgeschlagenen Kompaktierung vor, wird das aktuelle
+        Journal daran angehängt, damit beim Abspielen die Reihenfolge erhalten bleibt.
+        """
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            if self._size == 0:
+                return
+            if os.path.exists(self._rotated_path):
+                with open(self._path, "r", encoding="utf-8") as src, \
+                        open(self._rotated_path, "a", encoding="utf-8") as dst:
+                    shutil.copyfileobj(src, dst)
+                    if self._fsync:
+                        dst.flush()
+                        os.fsync(dst.fileno())
+                os.remove(self._path)
+            else:
+                os.replace(self._path, self._rotated_path)
+            self._size = 0
+
+    def discard_rotated(self) -> None:
+        """Löscht das rotierte Segment (nach erfolgreicher Kompaktierung in den Snapshot)."""
+        try:
+            os.remove(self._rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def truncate(self) -> None:
+        """Verwirft Journal und rotiertes Segment vollständig."""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            try:
+                with open(self._path, "w", encoding="utf-8") as f:
+                    if self._fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            except FileNotFoundError:
+                pass
+            self._size = 0
+        self.discard_rotated()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
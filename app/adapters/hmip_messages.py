@@ -8,6 +8,7 @@ from typing import Any, Dict, Optional, Tuple
 
 from websocket import WebSocket
 
+from app.adapters.hmip_scheduler import SendQueueFull
 from config.loader import load_config
 
 # Konfiguration laden (inkl. Token sicherstellen)
@@ -48,6 +49,20 @@ def _build_hmip_request(path: str, body: Optional[Dict[str, Any]] = None) -> Tup
     }
     return rid, payload
 
+def _send_request(ws: WebSocket, payload: Dict[str, Any]) -> bool:
+    """Sendet eine HMIP_SYSTEM_REQUEST; Sendefehler werden geloggt (False).
+
+    ``SendQueueFull`` des WS-Writers geht dagegen an den Aufrufer (HTTP → 503).
+    """
+    try:
+        ws.send(json.dumps(payload))
+        return True
+    except SendQueueFull:
+        raise
+    except Exception:
+        log.exception("Fehler beim Senden von HMIP_SYSTEM_REQUEST (%s)", payload["body"]["path"])
+        return False
+
 def send_get_system_state(ws: WebSocket) -> str:
     rid, payload = _build_hmip_request("/hmip/home/getSystemState", {})
     try:
@@ -108,13 +123,9 @@ def send_hmip_set_dim_level(ws: WebSocket, device_id: str, dim_level: float, cha
         "deviceId": device_id
     }
     rid, payload = _build_hmip_request("/hmip/device/control/setDimLevel", body)
-    try:
-        ws.send(json.dumps(payload))
+    if _send_request(ws, payload):
         log.info(f"HMIP_SYSTEM_REQUEST gesendet für device {device_id} → dimLevel={dim_level} (id={rid})")
-        return rid
-    except Exception as e:
-        log.exception("Fehler beim Senden von HMIP_SYSTEM_REQUEST (setDimLevel)")
-        return rid
+    return rid
 
 
 def send_hmip_set_hue_saturation_dim_level(ws: WebSocket, device_id: str, hue: int, saturation_level: float, dim_level: float, channel_index: int = 1) -> str:
@@ -126,13 +137,9 @@ def send_hmip_set_hue_saturation_dim_level(ws: WebSocket, device_id: str, hue: i
         "deviceId": device_id,
     }
     rid, payload = _build_hmip_request("/hmip/device/control/setHueSaturationDimLevel", body)
-    try:
-        ws.send(json.dumps(payload))
+    if _send_request(ws, payload):
         log.info(f"HMIP_SYSTEM_REQUEST gesendet für device {device_id} → hue={hue}° sat={saturation_level:.2f} dim={dim_level:.2f} (id={rid})")
-        return rid
-    except Exception as e:
-        log.exception("Fehler beim Senden von HMIP_SYSTEM_REQUEST (setHueSaturationDimLevel)")
-        return rid
+    return rid
 
 
 def send_hmip_set_switch(ws: WebSocket, device_id: str, state: bool, channel_index: int = 0) -> str:
@@ -142,13 +149,9 @@ def send_hmip_set_switch(ws: WebSocket, device_id: str, state: bool, channel_ind
         "deviceId": device_id
     }
     rid, payload = _build_hmip_request("/hmip/device/control/setSwitchState", body)
-    try:
-        ws.send(json.dumps(payload))
+    if _send_request(ws, payload):
         log.info(f"HMIP_SYSTEM_REQUEST gesendet für device {device_id} → {'ON' if state else 'OFF'} (id={rid})")
-        return rid
-    except Exception as e:
-        log.exception("Fehler beim Senden von HMIP_SYSTEM_REQUEST")
-        return rid
+    return rid
 
 
 def send_hmip_set_alarm_signal_optical(ws: WebSocket, device_id: str, signal: str, channel_index: int = 2) -> str:
@@ -162,13 +165,9 @@ def send_hmip_set_alarm_signal_optical(ws: WebSocket, device_id: str, signal: st
         "deviceId": device_id,
     }
     rid, payload = _build_hmip_request("/hmip/device/control/setAlarmSignalOptical", body)
-    try:
-        ws.send(json.dumps(payload))
+    if _send_request(ws, payload):
         log.info("HMIP_SYSTEM_REQUEST → setAlarmSignalOptical device=%s signal=%s (id=%s)", device_id, signal, rid)
-        return rid
-    except Exception:
-        log.exception("Fehler beim Senden von setAlarmSignalOptical")
-        return rid
+    return rid
 
 
 def send_hmip_set_alarm_signal_acoustic(ws: WebSocket, device_id: str, signal: str, channel_index: int = 2) -> str:
@@ -182,13 +181,9 @@ def send_hmip_set_alarm_signal_acoustic(ws: WebSocket, device_id: str, signal: s
         "deviceId": device_id,
     }
     rid, payload = _build_hmip_request("/hmip/device/control/setAlarmSignalAcoustic", body)
-    try:
-        ws.send(json.dumps(payload))
+    if _send_request(ws, payload):
         log.info("HMIP_SYSTEM_REQUEST → setAlarmSignalAcoustic device=%s signal=%s (id=%s)", device_id, signal, rid)
-        return rid
-    except Exception:
-        log.exception("Fehler beim Senden von setAlarmSignalAcoustic")
-        return rid
+    return rid
 
 
 def send_hmip_set_point_temperature(ws: WebSocket, device_id: str, temperature: float, channel_index: int = 1) -> str:
@@ -199,10 +194,6 @@ def send_hmip_set_point_temperature(ws: WebSocket, device_id: str, temperature:
         "deviceId": device_id,
     }
     rid, payload = _build_hmip_request("/hmip/device/control/setSetPointTemperature", body)
-    try:
-        ws.send(json.dumps(payload))
+    if _send_request(ws, payload):
         log.info("HMIP_SYSTEM_REQUEST → setSetPointTemperature device=%s temp=%.1f (id=%s)", device_id, temperature, rid)
-        return rid
-    except Exception:
-        log.exception("Fehler beim Senden von setSetPointTemperature")
-        return rid
\ No newline at end of file
+    return rid
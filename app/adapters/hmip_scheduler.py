@@ -0,0 +1,254 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_scheduler.py – Prioritäts-Warteschlange und Duty-Cycle-Token-Bucket für HCU-Befehle
+
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Kleinere Zahl = höhere Priorität. Alarme umgehen den Token-Bucket komplett.
+PRIO_CONTROL = -1   # Keepalive-Ping
+PRIO_ALARM = 0
+PRIO_SWITCH = 1
+PRIO_DIM = 2
+PRIO_THERMOSTAT = 3
+PRIO_DEFAULT = 2
+PRIO_STOP = 99      # Stop-Signal erst nach allem anderen
+
+
+class SendQueueFull(Exception):
+    """Die Sendewarteschlange ist voll – Nachricht wurde nicht angenommen."""
+
+
+_PATH_PRIORITY = {
+    "/hmip/device/control/setAlarmSignalOptical":    PRIO_ALARM,
+    "/hmip/device/control/setAlarmSignalAcoustic":   PRIO_ALARM,
+    "/hmip/device/control/setSwitchState":           PRIO_SWITCH,
+    "/hmip/device/control/setDimLevel":              PRIO_DIM,
+    "/hmip/device/control/setHueSaturationDimLevel": PRIO_DIM,
+    "/hmip/device/control/setShutterLevel":          PRIO_DIM,
+    "/hmip/device/control/setSlatsLevel":            PRIO_DIM,
+    "/hmip/device/control/setSetPointTemperature":   PRIO_THERMOSTAT,
+}
+
+
+Target = Tuple[str, int]
+
+
+@dataclass(frozen=True)
+class OutboundMessage:
+    """Ausgehende HCU-Nachricht, beim Einstellen einmal geparst.
+
+    ``data`` geht unverändert über die Leitung; Request-ID, Pfad, Ziel und Priorität
+    brauchen Coalescer, Warteschlange, Token-Bucket und Pending-Verwaltung – so
+    wird jede Nachricht nur einmal statt an jeder Stelle erneut mit json.loads gelesen.
+    """
+    data: str
+    rid: Optional[str] = None
+    path: Optional[str] = None
+    target: Optional[Target] = None  # (deviceId, channelIndex); None z.B. bei Home-Befehlen
+    priority: int = PRIO_DEFAULT
+
+    @classmethod
+    def parse(cls, data: str) -> "OutboundMessage":
+        try:
+            msg = json.loads(data)
+            body = msg.get("body") or {}
+        except (ValueError, AttributeError):
+            return cls(data)
+        if not isinstance(body, dict):
+            return cls(data, msg.get("id"))
+        path = body.get("path") if isinstance(body.get("path"), str) else None
+        inner = body.get("body")
+        try:
+            target = (str(inner["deviceId"]), int(inner.get("channelIndex", 0)))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            target = None
+        return cls(data, msg.get("id"), path, target, _PATH_PRIORITY.get(path, PRIO_DEFAULT))
+
+
+class TokenBucket:
+    """Token-Bucket mit zur Laufzeit anpassbarer Rate (Befehle pro Sekunde).
+
+    ``rate <= 0`` schaltet die Begrenzung ab. Ein Eintrag darf gesendet werden,
+    sobald mindestens ein Token da ist; Batches ziehen alle Tokens auf einmal ab
+    und dürfen den Bucket ins Minus bringen (sie gehen lückenlos raus, danach
+    wird entsprechend länger gewartet).
+    """
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.base_rate = max(0.0, float(rate))
+        self.rate = self.base_rate
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()  # Writer-Thread zieht ab, /healthz liest mit
+
+    @property
+    def enabled(self) -> bool:
+        return self.base_rate > 0
+
+    def _refill(self, now: float) -> None:
+        """Aufruf nur unter self._lock."""
+        self._tokens = min(self.burst, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def wait_time(self) -> float:
+        """Sekunden bis zum nächsten verfügbaren Token (0 = sofort)."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1.0:
+                return 0.0
+            return (1.0 - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+    def take(self, cost: float) -> None:
+        if self.enabled:
+            with self._lock:
+                self._refill(time.monotonic())
+                self._tokens -= cost
+
+    def set_factor(self, factor: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = self.base_rate * factor
+
+
+def duty_cycle_factor(duty_pct: Optional[float], soft_pct: float, hard_pct: float, min_factor: float) -> float:
+    """Ratenfaktor zum Duty Cycle: 1 bis ``soft_pct``, linear fallend bis ``min_factor`` bei ``hard_pct``."""
+    if not isinstance(duty_pct, (int, float)) or isinstance(duty_pct, bool) or duty_pct <= soft_pct:
+        return 1.0
+    if duty_pct >= hard_pct or hard_pct <= soft_pct:
+        return min_factor
+    span = (duty_pct - soft_pct) / (hard_pct - soft_pct)
+    return 1.0 - span * (1.0 - min_factor)
+
+
+class OutboundQueue:
+    """Begrenzte Prioritäts-Warteschlange mit ``queue.Queue``-ähnlicher Schnittstelle.
+
+    Einträge gleicher Priorität bleiben in Einstellreihenfolge. ``get_ready``
+    liefert den vordersten Eintrag erst, wenn ``ready(prio)`` ihn freigibt, und
+    wacht bei jedem neuen Eintrag auf – ein später eingestellter Alarm überholt
+    so einen Dimmer, der noch auf Tokens wartet.
+
+    Je Ziel (``targets``, z.B. deviceId/channelIndex) bleibt die Reihenfolge FIFO:
+    ein Eintrag erbt die niedrigste Priorität der noch wartenden Einträge desselben
+    Ziels, sonst würde etwa ein späteres „Aus“ vor einem früheren „Dimmen“ gesendet.
+    Nur Alarme und Steuereinträge (Priorität ≤ ``PRIO_ALARM``) dürfen überholen.
+    """
+
+    def __init__(self, maxsize: int, priority: Callable[[Any], int],
+                 targets: Optional[Callable[[Any], Iterable[Target]]] = None) -> None:
+        self.maxsize = max(1, int(maxsize))
+        self._priority = priority
+        self._targets = targets
+        self._heap: List[Tuple[int, int, Any, Tuple[Target, ...]]] = []
+        self._queued: Dict[Target, Dict[int, int]] = {}  # Ziel → {Priorität: Anzahl wartender Einträge}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _push(self, item: Any) -> None:
+        prio = self._priority(item)
+        targets = tuple(self._targets(item)) if self._targets is not None else ()
+        if prio > PRIO_ALARM:
+            for target in targets:
+                waiting = self._queued.get(target)
+                if waiting:
+                    prio = max(prio, max(waiting))
+        for target in targets:
+            waiting = self._queued.setdefault(target, {})
+            waiting[prio] = waiting.get(prio, 0) + 1
+        heapq.heappush(self._heap, (prio, next(self._seq), item, targets))
+        self._cond.notify_all()
+
+    def _pop(self) -> Any:
+        prio, _, item, targets = heapq.heappop(self._heap)
+        for target in targets:
+            waiting = self._queued[target]
+            waiting[prio] -= 1
+            if not waiting[prio]:
+                del waiting[prio]
+                if not waiting:
+                    del self._queued[target]
+        self._cond.notify_all()
+        return item
+
+    def put_nowait(self, item: Any) -> None:
+        with self._cond:
+            if len(self._heap) >= self.maxsize:
+                raise queue.Full
+            self._push(item)
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while len(self._heap) >= self.maxsize:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Full
+                self._cond.wait(remaining)
+            self._push(item)
+
+    def put_control(self, item: Any) -> None:
+        """Stellt Steuereinträge (Stop) auch bei voller Schlange ein."""
+        with self._cond:
+            self._push(item)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        return self.get_ready(lambda prio: 0.0, timeout)
+
+    def get_nowait(self) -> Any:
+        with self._cond:
+            if not self._heap:
+                raise queue.Empty
+            return self._pop()
+
+    def get_ready(self, ready: Callable[[int], float], timeout: Optional[float] = None) -> Any:
+        """Wartet auf einen Eintrag, dessen Priorität ``ready`` freigibt (Rückgabe 0 = sofort,
+        sonst Sekunden bis zum nächsten Versuch). Wirft ``queue.Empty`` nach ``timeout``."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                delay = None
+                if self._heap:
+                    delay = ready(self._heap[0][0])
+                    if delay <= 0:
+                        return self._pop()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                if delay is not None:
+                    remaining = delay if remaining is None else min(delay, remaining)
+                self._cond.wait(remaining)
+
+    def items(self) -> List[Any]:
+        """Momentaufnahme aller Einträge (Reihenfolge unbestimmt)."""
+        with self._cond:
+            return [entry[2] for entry in self._heap]
+
+    def qsize(self) -> int:
+        return len(self._heap)
+
+    def empty(self) -> bool:
+        return not self._heap
+
+    def full(self) -> bool:
+        return len(self._heap) >= self.maxsize
+
+    def depth_by_priority(self) -> dict:
+        with self._cond:
+            out: dict = {}
+            for prio, _, _, _ in self._heap:
+                out[prio] = out.get(prio, 0) + 1
+            return out
@@ -0,0 +1,764 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_store.py – In-Memory-Systemzustand der HCU (Quelle der Wahrheit für Merges und Lesezugriffe)
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, replace as dc_replace
+from typing import Any, Dict, List, Optional
+
+from app.adapters.hmip_journal import EventJournal
+from app.change_feed import ChangeFeed, diff_channels, diff_fields
+from app.utils import _atomic_write, _merge_device, _merge_group, normalize_snapshot
+
+log = logging.getLogger("bridge-ws")
+
+
+@dataclass(frozen=True)
+class SystemView:
+    """Direkte Referenzen auf die kanonischen Container des Systemzustands (nur lesen!)."""
+    home: Dict[str, Any]
+    devices: Dict[str, Dict[str, Any]]
+    groups: Dict[str, Dict[str, Any]]
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict[str, Any]) -> "SystemView":
+        """Normalisiert einen beliebig geformten Snapshot und liefert die Sicht darauf."""
+        inner = normalize_snapshot(snapshot)["body"]["body"]
+        return cls(home=inner["home"], devices=inner["devices"], groups=inner["groups"])
+
+
+class HmIPStateStore:
+    """Hält den letzten Vollsnapshot der HCU im Speicher und merged Events direkt hinein.
+
+    Die JSON-Datei unter ``path`` ist nur noch ein Persistenz-Artefakt: sie wird beim
+    ersten Zugriff geladen (Warmstart) und nie mehr pro Event gelesen. Geschrieben
+    wird write-behind durch einen Flusher-Thread (``start_flusher``), der Event-Bursts
+    zusammenfasst; ohne laufenden Flusher wird synchron nach jeder Änderung geschrieben.
+
+    Mit ``journal_path`` wird jede eventTransaction sofort an ein Append-only-Journal
+    angehängt (damit sofort dauerhaft) und der Vollsnapshot nur noch bei Kompaktierung
+    geschrieben – wenn das Journal ``journal_max_bytes`` erreicht oder die älteste
+    Journal-Zeile ``journal_compact_interval_s`` alt ist. Beim Start wird der
+    Snapshot geladen und das Journal darüber abgespielt.
+
+    Jeder Vollsnapshot wird beim Übernehmen einmalig normalisiert
+    (``normalize_snapshot``) und auch so geschrieben; eine Datei im alten Layout wird
+    beim Laden migriert (sofort neu geschrieben). Leser holen sich über ``view()`` direkte Referenzen auf
+    home/devices/groups statt pro Zugriff mehrere Pfade abzusuchen. Sie dürfen die
+    Container nicht verändern. Der Merge ersetzt Device-/Group-Dicts statt sie zu
+    mutieren und kopiert einen Container, bevor ein neuer Key hinzukommt – parallele
+    Iteration in den HTTP-Threads bleibt dadurch ohne Lock sicher.
+
+    Jede tatsächliche Änderung erhöht eine globale Revision; Devices und Groups
+    merken sich die Revision ihrer letzten Änderung. Zusammen mit ``epoch``
+    (ändert sich pro Prozessstart) taugen sie als ETag für bedingte GETs. Jedes
+    Device-Event der HCU erhöht zusätzlich – auch ohne Änderung – die globale Revision
+    und die Event-Revision des Devices, damit auch idempotente Befehle (z. B. Einschalten
+    eines bereits eingeschalteten Aktors) für ``min_revision`` als bestätigt gelten.
+
+    Mit ``feed`` wird jede gemergte Änderung feldgenau (Device, Kanal, Feld, Wert)
+    an den ChangeFeed gemeldet; ein Vollsnapshot erzeugt einen ``snapshot``-Eintrag.
+
+    ``apply_optimistic`` setzt kommandierte Werte sofort lokal (als "pending"
+    markiert). Sie liegen nur in einem Overlay über dem bestätigten Zustand, das
+    ausschließlich ``view()``/``get_device()`` einblenden – Snapshot-Datei, Journal und
+    Kompaktierung sehen nur HCU-Werte. Das nächste Event des Devices bestätigt oder
+    überschreibt sie; Fehler-ACK oder Ablauf entfernen sie über ``rollback_optimistic``
+    bzw. ``expire_optimistic`` wieder aus dem Overlay.
+    """
+
+    def __init__(self, path: str, journal_path: Optional[str] = None,
+                 journal_max_bytes: int = 1_000_000, journal_compact_interval_s: float = 600.0,
+                 fsync: bool = False, feed: Optional[ChangeFeed] = None) -> None:
+        self._path = path
+        self._feed = feed
+        self._lock = threading.RLock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._base: Optional[SystemView] = None  # bestätigter Zustand (= Snapshot-Container)
+        self._view: Optional[SystemView] = None  # Lesesicht: _base plus optimistisches Overlay
+        self._loaded = False
+        self._updated_ts: Optional[float] = None
+
+        # Revisionen (nicht persistiert – epoch trennt Prozessläufe)
+        self._epoch = "%x" % int(time.time() * 1000)
+        self._revision = 0
+        self._device_revs: Dict[str, int] = {}
+        self._group_revs: Dict[str, int] = {}
+        self._device_event_revs: Dict[str, int] = {}  # letzte von der HCU stammende Änderung
+
+        # Optimistische Updates (Overlay): Request-ID → {device, channel, values, ts}
+        self._optimistic: Dict[str, Dict[str, Any]] = {}
+        self._optimistic_by_device: Dict[str, List[str]] = {}
+        self.optimistic_counts = {"applied": 0, "confirmed": 0, "overridden": 0,
+                                  "rolled_back": 0, "expired": 0}
+        self._confirm_latency: Dict[str, List[float]] = {}  # Device-Typ → [Anzahl, Summe ms, Max ms]
+
+        # Write-behind
+        self._cond = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()
+        self._dirty_count = 0
+        self._dirty_since: Optional[float] = None  # monotonic
+        self._inflight_since: Optional[float] = None  # Änderungen, die gerade geschrieben werden
+        self._urgent = False
+        self._flush_needed = False  # ohne Flusher: nach Freigabe des Locks synchron schreiben
+        self._last_flush_ts: Optional[float] = None
+        self._flush_interval = 2.0
+        self._flush_max_dirty = 200
+        self._fsync = fsync
+        self._flusher: Optional[threading.Thread] = None
+        self._stopping = False
+
+        # Journal (optional)
+        self._journal = EventJournal(journal_path, fsync=fsync) if journal_path else None
+        self._journal_max_bytes = max(1, int(journal_max_bytes))
+        self._journal_compact_interval = max(0.0, float(journal_compact_interval_s))
+        self._changes_since: Optional[float] = None  # älteste nicht kompaktierte Änderung (monotonic)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    # ── Laden / Lesen ─────────────────────────────────────────────────────────
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            migrate = False
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    raw = json.load(f)
+                self._adopt(raw)
+                migrate = raw != self._snapshot
+                log.info("Systemzustand aus %s geladen.", self._path)
+            except FileNotFoundError:
+                pass
+            except Exception:
+                log.exception("Snapshot lesen fehlgeschlagen")
+            self._loaded = True
+            self._replay_journal()
+            if migrate:
+                # Datei aus einer älteren Version: einmalig im kanonischen Layout neu schreiben
+                log.info("Systemzustand in %s hat altes Layout – wird nach body.body.{home,devices,groups} migriert.",
+                         self._path)
+                self._mark_dirty(urgent=True)
+        self._flush_if_needed()
+
+    def _replay_journal(self) -> None:
+        """Spielt das Journal über den geladenen Basis-Snapshot (Warmstart nach Absturz)."""
+        if self._journal is None or self._journal.empty():
+            return
+        if self._snapshot is None:
+            log.warning("Journal %s ohne Basis-Snapshot – wird verworfen.", self._journal.path)
+            self._journal.truncate()
+            return
+        count = 0
+        for tx in self._journal.replay():
+            if self._merge_transaction(tx):
+                count += 1
+        if count:
+            self._updated_ts = time.time()
+            self._dirty_count += count
+            self._changes_since = time.monotonic()
+        log.info("Journal %s: %d Transaktion(en) nachgespielt.", self._journal.path, count)
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Aktueller Snapshot (nur lesen!) oder None, solange keiner vorliegt."""
+        self._ensure_loaded()
+        return self._snapshot
+
+    def view(self) -> Optional[SystemView]:
+        """Kanonische Sicht auf home/devices/groups oder None, solange kein Snapshot vorliegt."""
+        self._ensure_loaded()
+        return self._view
+
+    def confirmed_devices(self) -> Optional[Dict[str, Any]]:
+        """Devices ohne optimistisches Overlay – nur von der HCU bestätigte Werte (nur lesen!)."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._base.devices if self._base is not None else None
+
+    def get_device(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Einzelnes Device in O(1)."""
+        view = self.view()
+        if view is None:
+            return None
+        dev = view.devices.get(device_id)
+        return dev if isinstance(dev, dict) else None
+
+    @property
+    def epoch(self) -> str:
+        return self._epoch
+
+    def revision(self) -> int:
+        """Globale Revision; steigt bei jeder Änderung an Devices, Groups oder Home und bei jedem Device-Event."""
+        self._ensure_loaded()
+        return self._revision
+
+    def device_revision(self, device_id: str) -> Optional[int]:
+        """Revision der letzten Änderung eines Devices (None = unbekannt)."""
+        self._ensure_loaded()
+        return self._device_revs.get(device_id)
+
+    def device_event_revision(self, device_id: str) -> Optional[int]:
+        """Revision des letzten HCU-Events (oder Snapshots mit Änderung) für ein Device.
+
+        Anders als ``device_revision`` zählen optimistische lokale Updates hier nicht,
+        dafür aber auch Events, die nichts ändern.
+        """
+        self._ensure_loaded()
+        return self._device_event_revs.get(device_id)
+
+    def group_revision(self, group_id: str) -> Optional[int]:
+        self._ensure_loaded()
+        return self._group_revs.get(group_id)
+
+    def age_ms(self) -> Optional[int]:
+        """Millisekunden seit der letzten Zustandsänderung (None = noch keine)."""
+        if self._updated_ts is None:
+            return None
+        return int((time.time() - self._updated_ts) * 1000)
+
+    def flush_lag_ms(self) -> int:
+        """Wie lange die älteste noch nicht geschriebene Änderung schon wartet (0 = alles persistiert)."""
+        pending = [t for t in (self._dirty_since, self._inflight_since) if t is not None]
+        if not pending:
+            return 0
+        return int((time.monotonic() - min(pending)) * 1000)
+
+    def last_flush_ts(self) -> Optional[float]:
+        return self._last_flush_ts
+
+    def journal_bytes(self) -> Optional[int]:
+        """Größe des noch nicht kompaktierten Journals (None = Journal deaktiviert)."""
+        return self._journal.size_bytes if self._journal is not None else None
+
+    # ── Schreiben ─────────────────────────────────────────────────────────────
+
+    def replace(self, msg: Dict[str, Any]) -> None:
+        """Ersetzt den Zustand durch einen Vollsnapshot (HMIP_SYSTEM_RESPONSE)."""
+        with self._lock:
+            overlaid = list(self._optimistic_by_device)
+            self._optimistic.clear()
+            self._optimistic_by_device.clear()
+            self._adopt(msg)
+            # Verworfene optimistische Werte ändern die Lesesicht – Caches entwerten
+            for dev_id in overlaid:
+                if dev_id in self._device_revs:
+                    self._device_revs[dev_id] = self._revision
+            self._loaded = True
+            self._updated_ts = time.time()
+            self._mark_dirty(urgent=True)
+            if self._feed is not None:
+                self._feed.publish([{"source": "hmip", "kind": "snapshot", "revision": self._revision,
+                                     "ts": self._updated_ts}])
+        self._flush_if_needed()
+
+    def apply_event(self, msg: Dict[str, Any]) -> bool:
+        """Merged ein HMIP_SYSTEM_EVENT. Gibt False zurück, wenn nicht gemerged werden konnte."""
+        self._ensure_loaded()
+        with self._lock:
+            merged = self._apply_event_locked(msg)
+        self._flush_if_needed()
+        return merged
+
+    def _apply_event_locked(self, msg: Dict[str, Any]) -> bool:
+        if self._snapshot is None:
+            log.warning("Kein vorhandener Snapshot – HMIP_SYSTEM_EVENT wird ignoriert (warte auf Vollsnapshot).")
+            return False
+        tx = (msg.get("body") or {}).get("eventTransaction") or {}
+        changes: Optional[List[Dict[str, Any]]] = [] if self._feed is not None else None
+        if not self._merge_transaction(tx, changes):
+            return False
+        self._updated_ts = time.time()
+        if changes:
+            for change in changes:
+                change["ts"] = self._updated_ts
+            self._feed.publish(changes)
+        elif self._feed is not None:
+            self._feed.notify()  # nur Revisionen gezählt – Revision-Waiter trotzdem wecken
+        if self._journal is not None:
+            try:
+                self._journal.append(tx)
+            except Exception:
+                log.exception("Journal-Append fehlgeschlagen (%s)", self._journal.path)
+                self._mark_dirty(urgent=True)
+                return True
+            self._mark_dirty(durable=True, urgent=self._journal.size_bytes >= self._journal_max_bytes)
+        else:
+            self._mark_dirty()
+        return True
+
+    def _adopt(self, snapshot: Dict[str, Any]) -> None:
+        """Übernimmt einen Vollsnapshot in kanonischer Form. Aufruf nur unter self._lock.
+
+        Unveränderte Devices/Groups behalten ihre Revision, damit ein erneuter
+        Vollsnapshot (z. B. nach Reconnect) nicht alle Client-Caches entwertet.
+        """
+        old = self._base
+        self._snapshot = normalize_snapshot(snapshot)
+        inner = self._snapshot["body"]["body"]
+        self._base = SystemView(home=inner["home"], devices=inner["devices"], groups=inner["groups"])
+        rev = self._revision + 1
+        self._device_revs = self._carry_revisions(
+            self._device_revs, old.devices if old else {}, self._base.devices, rev)
+        self._group_revs = self._carry_revisions(
+            self._group_revs, old.groups if old else {}, self._base.groups, rev)
+        # Eigene Übernahme: _device_revs enthält auch Revisionen optimistischer Updates
+        self._device_event_revs = self._carry_revisions(
+            self._device_event_revs, old.devices if old else {}, self._base.devices, rev)
+        self._revision = rev
+        self._view = self._base
+        self._sync_view(list(self._optimistic_by_device))
+
+    @staticmethod
+    def _carry_revisions(revs: Dict[str, int], old: Dict[str, Any], new: Dict[str, Any],
+                         rev: int) -> Dict[str, int]:
+        result = {}
+        for key, obj in new.items():
+            prev = revs.get(key)
+            result[key] = prev if prev is not None and old.get(key) == obj else rev
+        return result
+
+    def _merge_transaction(self, tx: Dict[str, Any], changes: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Merged die Events einer eventTransaction in den Snapshot. Aufruf nur unter self._lock.
+
+        changes: falls übergeben, werden die feldgenauen Änderungen daran angehängt.
+        """
+        base = self._base
+        inner = self._snapshot["body"]["body"]
+        devices, groups = base.devices, base.groups
+        touched: List[str] = []
+
+        rev = self._revision + 1
+        changed = False
+
+        events = tx.get("events") or {}
+        for _, ev in sorted(events.items(), key=lambda kv: kv[0]):
+            if not isinstance(ev, dict):
+                continue
+
+            # ── Device-Event ──
+            dev = ev.get("device")
+            if isinstance(dev, dict):
+                dev_id = dev.get("id")
+                if dev_id:
+                    cur = devices.get(dev_id)
+                    merged = _merge_device(cur or {}, dev)
+                    touched.append(dev_id)
+                    # Die HCU hat das Device gemeldet – auch ein unverändertes Event bestätigt es
+                    self._device_event_revs[dev_id] = rev
+                    changed = True
+                    if dev_id in self._optimistic_by_device and self._settle_optimistic(dev_id, dev, rev, changes):
+                        # Pending-Markierung fällt weg – auch bei gleichem Wert neue Revision
+                        self._device_revs[dev_id] = rev
+                    if merged != cur and changes is not None:
+                        changes.extend(self._device_changes(dev_id, cur, merged, rev))
+                    if merged == cur:
+                        log.debug("Device unverändert: %s", dev_id)
+                    elif cur is None:
+                        # Copy-on-write: laufende Iterationen sehen den alten Container
+                        devices = {**devices, dev_id: merged}
+                        inner["devices"] = devices
+                        self._device_revs[dev_id] = rev
+                        log.debug("Neues Device angelegt: %s", dev_id)
+                    else:
+                        devices[dev_id] = merged
+                        self._device_revs[dev_id] = rev
+                        log.debug("Device gemerged: %s", dev_id)
+
+            # ── Group-Event ──
+            grp = ev.get("group")
+            if isinstance(grp, dict):
+                grp_id = grp.get("id")
+                if grp_id:
+                    cur = groups.get(grp_id)
+                    merged = _merge_group(cur or {}, grp)
+                    if merged == cur:
+                        continue
+                    if changes is not None:
+                        changes.extend(
+                            {"source": "hmip", "kind": "group", "id": grp_id, "channel": None,
+                             "field": field, "value": value, "revision": rev}
+                            for field, value in diff_fields(cur, merged))
+                    if cur is None:
+                        groups = {**groups, grp_id: merged}
+                        inner["groups"] = groups
+                    else:
+                        groups[grp_id] = merged
+                    self._group_revs[grp_id] = rev
+                    changed = True
+                    log.debug("Group gemerged: %s (%s)", grp_id, grp.get("label", "–"))
+
+        if devices is not base.devices or groups is not base.groups:
+            self._base = dc_replace(base, devices=devices, groups=groups)
+        self._sync_view(touched)
+        if changed:
+            self._revision = rev
+        return True
+
+    @staticmethod
+    def _device_changes(dev_id: str, before: Optional[Dict[str, Any]], after: Dict[str, Any],
+                        rev: int) -> List[Dict[str, Any]]:
+        out = [{"source": "hmip", "kind": "device", "id": dev_id, "channel": None,
+                "field": field, "value": value, "revision": rev}
+               for field, value in diff_fields(before, after, skip=("functionalChannels",))]
+        out.extend({"source": "hmip", "kind": "device", "id": dev_id, "channel": ch,
+                    "field": field, "value": value, "revision": rev}
+                   for ch, field, value in diff_channels((before or {}).get("functionalChannels"),
+                                                         after.get("functionalChannels")))
+        return out
+
+    # ── Optimistische Updates ─────────────────────────────────────────────────
+
+    def apply_optimistic(self, request_id: str, device_id: str, channel: Any,
+                         values: Dict[str, Any]) -> Optional[int]:
+        """Übernimmt kommandierte Kanalwerte sofort (pending). Gibt die neue Revision zurück,
+        oder None, wenn Device/Kanal unbekannt sind oder sich nichts ändert."""
+        self._ensure_loaded()
+        with self._lock:
+            view = self._view
+            dev = view.devices.get(device_id) if view is not None else None
+            if not isinstance(dev, dict):
+                return None
+            ch_key = str(channel)
+            channels = dev.get("functionalChannels") or {}
+            ch = channels.get(ch_key)
+            if not isinstance(ch, dict):
+                return None
+            diff = {k: v for k, v in values.items() if k in ch and ch[k] != v}
+            if not diff:
+                return None
+            self._optimistic[request_id] = {"device": device_id, "channel": ch_key, "values": diff,
+                                            "ts": time.monotonic()}
+            self._optimistic_by_device.setdefault(device_id, []).append(request_id)
+            self.optimistic_counts["applied"] += 1
+            return self._publish_overlay(device_id, ch_key, diff, pending=True)
+
+    def ack_optimistic(self, request_id: str) -> None:
+        """Merkt das positive ACK der HCU zu einem optimistischen Update vor.
+
+        Ab dann gilt ein abweichender Wert im nächsten Event als maßgeblich.
+        """
+        with self._lock:
+            entry = self._optimistic.get(request_id)
+            if entry is not None:
+                entry["acked"] = True
+
+    def rollback_optimistic(self, request_id: str, reason: str = "rolled_back") -> bool:
+        """Nimmt ein optimistisches Update aus dem Overlay (Fehler-ACK, Ablauf).
+        Sichtbar wird wieder der bestätigte Wert bzw. ein neueres offenes Kommando."""
+        with self._lock:
+            entry = self._optimistic.pop(request_id, None)
+            if entry is None:
+                return False
+            dev_id, ch_key = entry["device"], entry["channel"]
+            rids = self._optimistic_by_device.get(dev_id, [])
+            if request_id in rids:
+                rids.remove(request_id)
+            if not rids:
+                self._optimistic_by_device.pop(dev_id, None)
+            self.optimistic_counts[reason] += 1
+            before = self._channel(self._view, dev_id, ch_key)
+            self._sync_view([dev_id])
+            after = self._channel(self._view, dev_id, ch_key)
+            if before is None or after is None:
+                return False
+            restore = {k: after.get(k) for k in entry["values"] if after.get(k) != before.get(k)}
+            if restore:
+                self._publish_overlay(dev_id, ch_key, restore, pending=False)
+            log.info("Optimistisches Update %s zurückgesetzt (%s): %s", request_id, reason, entry["device"])
+            return True
+
+    def expire_optimistic(self, ttl_s: float) -> int:
+        """Setzt optimistische Updates zurück, die nach ``ttl_s`` noch nicht bestätigt sind."""
+        if not self._optimistic:
+            return 0
+        cutoff = time.monotonic() - ttl_s
+        with self._lock:
+            stale = [rid for rid, e in self._optimistic.items() if e["ts"] < cutoff]
+        for rid in stale:
+            self.rollback_optimistic(rid, "expired")
+        return len(stale)
+
+    def pending_fields(self, device_id: str, channel: Any) -> List[str]:
+        """Felder eines Kanals, die nur optimistisch gesetzt und noch nicht bestätigt sind."""
+        if device_id not in self._optimistic_by_device:
+            return []
+        ch_key = str(channel)
+        fields = set()
+        with self._lock:
+            for rid in self._optimistic_by_device.get(device_id, ()):
+                entry = self._optimistic[rid]
+                if entry["channel"] == ch_key:
+                    fields.update(entry["values"])
+        return sorted(fields)
+
+    def optimistic_stats(self) -> Dict[str, int]:
+        return {"pending": len(self._optimistic), **self.optimistic_counts}
+
+    def confirm_latency(self) -> Dict[str, Dict[str, float]]:
+        """Zeit vom Befehl bis zum bestätigenden HCU-Event, je Device-Typ."""
+        with self._lock:
+            return {t: {"count": int(n), "avg_ms": round(total / n, 1), "max_ms": round(peak, 1)}
+                    for t, (n, total, peak) in self._confirm_latency.items()}
+
+    def _settle_optimistic(self, dev_id: str, incoming: Dict[str, Any], rev: int,
+                           changes: Optional[List[Dict[str, Any]]]) -> bool:
+        """Gleicht ein Device-Event der HCU mit den offenen optimistischen Updates ab.
+        Aufruf nur unter self._lock.
+
+        Bestätigt ist ein Update erst, wenn das Event alle seine Felder mit genau den
+        kommandierten Werten enthält. Abweichende Werte verwerfen es nur, wenn die HCU
+        das Kommando schon quittiert hat (``ack_optimistic``) oder ein neueres Kommando
+        dieselben Felder setzt – ein Event, das vor dem eigenen ACK mit altem Wert
+        eintrifft, ist meist ein Zwischenstand und lässt das neueste Update stehen.
+        Events ohne die Felder des Updates lassen es unangetastet.
+
+        Bestätigte Werte ändern sich beim Merge nicht; damit Feed-Leser (SSE, Long-Poll)
+        die Bestätigung trotzdem sehen, wird je Feld ein Eintrag mit ``pending: False`` angehängt.
+        """
+        channels = incoming.get("functionalChannels") or {}
+        settled = False
+        now = time.monotonic()
+        dev_type = str((self._base.devices.get(dev_id) or {}).get("type") or incoming.get("type") or "–")
+        rids = list(self._optimistic_by_device.get(dev_id, ()))
+        for pos, rid in enumerate(rids):
+            entry = self._optimistic[rid]
+            ch = channels.get(entry["channel"])
+            if not isinstance(ch, dict):
+                continue
+            reported = {k: ch[k] for k in entry["values"] if k in ch}
+            if not reported:
+                continue
+            confirmed = len(reported) == len(entry["values"]) and all(
+                reported[k] == v for k, v in entry["values"].items())
+            if not confirmed:
+                if any(reported[k] == v for k, v in entry["values"].items() if k in reported):
+                    continue  # teilweise bestätigt – auf die übrigen Felder warten
+                superseded = any(self._optimistic[newer]["channel"] == entry["channel"]
+                                 and not self._optimistic[newer]["values"].keys().isdisjoint(entry["values"])
+                                 for newer in rids[pos + 1:])
+                if not entry.get("acked") and not superseded:
+                    continue
+            self.optimistic_counts["confirmed" if confirmed else "overridden"] += 1
+            latency_ms = (now - entry["ts"]) * 1000
+            stats = self._confirm_latency.setdefault(dev_type, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += latency_ms
+            stats[2] = max(stats[2], latency_ms)
+            if confirmed and changes is not None:
+                changes.extend({"source": "hmip", "kind": "device", "id": dev_id, "channel": entry["channel"],
+                                "field": field, "value": value, "revision": rev, "pending": False}
+                               for field, value in entry["values"].items())
+            del self._optimistic[rid]
+            self._optimistic_by_device[dev_id].remove(rid)
+            settled = True
+        if not self._optimistic_by_device.get(dev_id):
+            self._optimistic_by_device.pop(dev_id, None)
+        return settled
+
+    @staticmethod
+    def _channel(view: Optional[SystemView], device_id: str, ch_key: str) -> Optional[Dict[str, Any]]:
+        dev = view.devices.get(device_id) if view is not None else None
+        ch = ((dev or {}).get("functionalChannels") or {}).get(ch_key)
+        return ch if isinstance(ch, dict) else None
+
+    def _overlaid(self, device_id: str, dev: Dict[str, Any]) -> Dict[str, Any]:
+        """Bestätigtes Device mit den offenen optimistischen Werten (neuestes Kommando gewinnt)."""
+        rids = self._optimistic_by_device.get(device_id)
+        if not rids:
+            return dev
+        channels = dict(dev.get("functionalChannels") or {})
+        for rid in rids:
+            entry = self._optimistic[rid]
+            ch = channels.get(entry["channel"])
+            if isinstance(ch, dict):
+                channels[entry["channel"]] = {**ch, **entry["values"]}
+        return {**dev, "functionalChannels": channels}
+
+    def _sync_view(self, device_ids) -> None:
+        """Aktualisiert die Lesesicht für die genannten Devices. Aufruf nur unter self._lock.
+
+        Ohne offene optimistische Updates ist die Lesesicht der bestätigte Zustand selbst;
+        sonst ein eigener devices-Container, der wie der Merge Copy-on-write arbeitet.
+        """
+        base = self._base
+        if base is None:
+            return
+        if not self._optimistic_by_device:
+            self._view = base
+            return
+        view = self._view
+        devices = view.devices if view is not None and view.devices is not base.devices else dict(base.devices)
+        for dev_id in device_ids:
+            dev = base.devices.get(dev_id)
+            if not isinstance(dev, dict):
+                continue
+            if dev_id not in devices:
+                devices = {**devices, dev_id: self._overlaid(dev_id, dev)}
+            else:
+                devices[dev_id] = self._overlaid(dev_id, dev)
+        self._view = SystemView(home=base.home, devices=devices, groups=base.groups)
+
+    def _publish_overlay(self, device_id: str, ch_key: str, values: Dict[str, Any], pending: bool) -> int:
+        """Übernimmt eine Overlay-Änderung in die Lesesicht, mit Revision und Feed. Aufruf nur unter self._lock."""
+        self._sync_view([device_id])
+        rev = self._revision + 1
+        self._revision = rev
+        self._device_revs[device_id] = rev
+        self._updated_ts = time.time()
+        if self._feed is not None:
+            self._feed.publish({"source": "hmip", "kind": "device", "id": device_id, "channel": ch_key,
+                                "field": field, "value": value, "revision": rev,
+                                "ts": self._updated_ts, "pending": pending}
+                               for field, value in values.items())
+        return rev
+
+    # ── Persistenz (write-behind) ─────────────────────────────────────────────
+
+    def _mark_dirty(self, urgent: bool = False, durable: bool = False) -> None:
+        """Merkt eine Änderung zum Schreiben vor. Aufruf nur unter self._lock.
+
+        durable: Änderung steht bereits im Journal und zählt nicht zum Flush-Lag.
+        Ohne Flusher wird nur ``_flush_needed`` gesetzt – der Aufrufer schreibt nach
+        Freigabe des Locks über ``_flush_if_needed`` (flush nimmt _write_lock vor _lock).
+        """
+        self._dirty_count += 1
+        now = time.monotonic()
+        if self._changes_since is None:
+            self._changes_since = now
+        if not durable and self._dirty_since is None:
+            self._dirty_since = now
+        if urgent:
+            self._urgent = True
+        if self._flusher is None:
+            if urgent or not durable:
+                self._flush_needed = True
+        else:
+            self._cond.notify_all()
+
+    def _flush_if_needed(self) -> None:
+        """Führt einen von ``_mark_dirty`` vorgemerkten Flush aus. Nie unter self._lock aufrufen."""
+        with self._lock:
+            needed, self._flush_needed = self._flush_needed, False
+        if needed:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Schreibt den Snapshot sofort, falls ungespeicherte Änderungen vorliegen.
+
+        Unter dem Store-Lock werden nur eine Referenz auf den Snapshot gezogen und – mit
+        Journal – das Journal rotiert; Serialisieren und Schreiben laufen außerhalb, damit
+        Events und Leser währenddessen nicht blockiert werden. Events, die in der Zeit
+        eintreffen, landen im frischen Journal-Segment und gehen nicht verloren.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._dirty_count == 0 or self._snapshot is None:
+                    return False
+                snapshot = self._frozen_snapshot()
+                count, since, changes_since = self._dirty_count, self._dirty_since, self._changes_since
+                if self._journal is not None:
+                    try:
+                        self._journal.rotate()
+                    except Exception:
+                        log.exception("Journal-Rotation fehlgeschlagen (%s)", self._journal.path)
+                        return False
+                self._dirty_count = 0
+                self._dirty_since = None
+                self._changes_since = None
+                self._inflight_since = since
+                self._urgent = False
+            try:
+                data = json.dumps(snapshot, ensure_ascii=False, indent=2)
+                _atomic_write(self._path, data, fsync=self._fsync)
+            except Exception:
+                log.exception("Snapshot konnte nicht geschrieben werden (%s)", self._path)
+                with self._lock:
+                    self._inflight_since = None
+                    # Beim nächsten Durchlauf erneut versuchen (rotiertes Segment bleibt erhalten)
+                    self._dirty_count += count
+                    if since is not None and (self._dirty_since is None or since < self._dirty_since):
+                        self._dirty_since = since
+                    if changes_since is not None and (self._changes_since is None
+                                                      or changes_since < self._changes_since):
+                        self._changes_since = changes_since
+                return False
+            if self._journal is not None:
+                self._journal.discard_rotated()
+            self._inflight_since = None
+            self._last_flush_ts = time.time()
+            log.debug("Snapshot geschrieben (%d Änderung(en) zusammengefasst) → %s", count, self._path)
+            return True
+
+    def _frozen_snapshot(self) -> Dict[str, Any]:
+        """Stabile Kopie des Snapshots zum Schreiben außerhalb des Locks. Aufruf nur unter self._lock.
+
+        Devices/Groups werden nur ersetzt, nie verändert (Copy-on-write) – flache Kopien
+        der Container genügen.
+        """
+        snap = self._snapshot
+        outer = snap["body"]
+        inner = outer["body"]
+        return {**snap, "body": {**outer, "body": {**inner, "devices": dict(inner["devices"]),
+                                                   "groups": dict(inner["groups"])}}}
+
+    def start_flusher(self, interval_ms: float = 2000, max_dirty: int = 200, fsync: bool = False) -> None:
+        """Startet den Hintergrund-Flusher.
+
+        interval_ms: höchstens ein Schreibvorgang pro Intervall
+        max_dirty:   so viele gesammelte Änderungen erzwingen sofortiges Schreiben
+        fsync:       Datei vor dem os.replace auf das Medium zwingen
+        Mit Journal gelten stattdessen journal_compact_interval_s / journal_max_bytes.
+        """
+        with self._lock:
+            self._flush_interval = max(0.0, float(interval_ms) / 1000.0)
+            self._flush_max_dirty = max(1, int(max_dirty))
+            self._fsync = bool(fsync)
+            if self._flusher is not None:
+                return
+            self._stopping = False
+            self._flusher = threading.Thread(target=self._flush_loop, name="snapshot-flusher", daemon=True)
+            self._flusher.start()
+        log.info("Snapshot-Flusher gestartet (Intervall %.0f ms, max. %d Änderungen, fsync=%s)",
+                 self._flush_interval * 1000, self._flush_max_dirty, self._fsync)
+
+    def stop_flusher(self) -> None:
+        """Beendet den Flusher und schreibt ausstehende Änderungen."""
+        with self._lock:
+            thread = self._flusher
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout=10)
+        with self._lock:
+            self._flusher = None
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping and self._dirty_count == 0:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                # Debounce: Änderungen bis zum Intervall-Ende sammeln
+                if self._journal is not None:
+                    interval, max_dirty = self._journal_compact_interval, float("inf")
+                else:
+                    interval, max_dirty = self._flush_interval, self._flush_max_dirty
+                deadline = (self._changes_since or time.monotonic()) + interval
+                while (not self._stopping and not self._urgent
+                       and self._dirty_count < max_dirty):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
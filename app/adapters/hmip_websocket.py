@@ -6,50 +6,110 @@ import logging
 import os
 import random
 import ssl
+import threading
 import time
-from typing import Any, Dict, Optional
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Set
 
 import certifi
 import websocket
 import yaml
 
 import app.state as state
+from app.adapters.hmip_inbound import FrameQueue
 from app.adapters.hmip_messages import (send_config_template_response, send_config_update_response,
                                        send_get_system_state, send_plugin_state)
 from app.utils import save_system_state
-from app.loxone_udp import push_event_devices
+from app.loxone_udp import push_event, trigger_resync
 
 log = logging.getLogger("bridge-ws")
 
+_processor: Optional[threading.Thread] = None  # ws-processor (arbeitet die FrameQueue ab)
+_HOUSEKEEPING_INTERVAL_S = 1.0  # Bereinigung abgelaufener Pending-/Optimistic-Einträge
+
 
 # ── Pending-Registry ──────────────────────────────────────────────────────────
 
-def _register_pending(req_id: str, path: str) -> None:
+def _register_pending(req_id: str, path: str, with_future: bool = False) -> Optional[Future]:
+    """Merkt einen gesendeten Request vor. Mit with_future wird das ACK als Future geliefert:
+    Ergebnis {"code": int|None, "latency_ms": float, "error": str (nur bei Ablauf/Abbruch)}."""
     if not req_id:
-        return
+        return None
+    future: Optional[Future] = Future() if with_future else None
     with state.pending_lock:
-        state.pending[req_id] = {"path": path, "ts": time.time()}
+        meta: Dict[str, Any] = {"id": req_id, "path": path, "ts": time.time()}
+        if future is not None:
+            meta["future"] = future
+        state.pending[req_id] = meta
+        state.pending.move_to_end(req_id)
+        state.pending_stats["registered"] += 1
+    return future
+
+
+def _complete_pending(meta: Dict[str, Any], code: Optional[int], error: Optional[str] = None) -> None:
+    """Löst die Future eines Pending-Eintrags auf (falls ein HTTP-Aufrufer darauf wartet).
+    Bei Fehler, Ablauf oder Abbruch wird ein optimistisches Update zurückgesetzt, ein
+    positives ACK wird am optimistischen Update vermerkt."""
+    if meta.get("optimistic") and state.hmip_store is not None:
+        if code == 200:
+            state.hmip_store.ack_optimistic(meta.get("id"))
+        else:
+            state.hmip_store.rollback_optimistic(meta.get("id"))
+    future = meta.get("future")
+    if future is None or future.done():
+        return
+    result: Dict[str, Any] = {"code": code, "latency_ms": round((time.time() - meta.get("ts", 0)) * 1000, 1)}
+    if error:
+        result["error"] = error
+    future.set_result(result)
 
 
 def _resolve_pending(req_id: Optional[str]) -> Optional[Dict[str, Any]]:
     if not req_id:
         return None
     with state.pending_lock:
-        return state.pending.pop(req_id, None)
+        meta = state.pending.pop(req_id, None)
+        state.pending_stats["resolved" if meta is not None else "uncorrelated"] += 1
+        return meta
 
 
 def _cleanup_pending() -> None:
+    """Entfernt abgelaufene Einträge. Die Registry ist nach Registrierungszeit sortiert,
+    daher wird nur vorne geprüft und beim ersten noch gültigen Eintrag abgebrochen."""
     now = time.time()
+    expired = []
     with state.pending_lock:
-        to_del = [rid for rid, meta in state.pending.items()
-                  if now - meta.get("ts", 0) > state.PENDING_TTL]
-        for rid in to_del:
-            meta = state.pending.pop(rid, None)
-            if meta:
-                log.warning("Pending-Request abgelaufen: %s (path=%s, age=%.0fs)",
-                            rid, meta.get("path"), now - meta.get("ts", 0))
-    if to_del:
-        log.info("Pending-Requests bereinigt: %d orphans entfernt", len(to_del))
+        while state.pending:
+            rid, meta = next(iter(state.pending.items()))
+            if now - meta.get("ts", 0) <= state.PENDING_TTL:
+                break
+            state.pending.popitem(last=False)
+            expired.append((rid, meta))
+        state.pending_stats["expired"] += len(expired)
+    for rid, meta in expired:
+        _complete_pending(meta, None, "expired")
+        log.warning("Pending-Request abgelaufen: %s (path=%s, age=%.0fs)",
+                    rid, meta.get("path"), now - meta.get("ts", 0))
+    if expired:
+        log.info("Pending-Requests bereinigt: %d orphans entfernt", len(expired))
+
+
+def _expire_optimistic() -> None:
+    """Setzt optimistische Updates zurück, die die HCU nicht rechtzeitig per Event bestätigt hat."""
+    if state.hmip_store is not None:
+        state.hmip_store.expire_optimistic(float(state.config_internal.get("optimistic_ttl_s", 10)))
+
+
+def _drop_pending(keep: Optional[Set[str]] = None) -> None:
+    """Verwirft alle offenen Requests (Verbindungsabbruch – ACKs kommen nicht mehr).
+    IDs in ``keep`` (noch ungesendete, gepufferte Befehle) bleiben registriert."""
+    keep = keep or set()
+    with state.pending_lock:
+        dropped = [rid for rid in state.pending if rid not in keep]
+        dropped = [state.pending.pop(rid) for rid in dropped]
+        state.pending_stats["dropped"] += len(dropped)
+    for meta in dropped:
+        _complete_pending(meta, None, "disconnected")
 
 
 # ── Log-Level zur Laufzeit ändern ─────────────────────────────────────────────
@@ -75,7 +135,116 @@ def _apply_log_level(new_level: str) -> bool:
     return True
 
 
-# ── WebSocket-Loop ────────────────────────────────────────────────────────────
+# ── Verarbeitung (Processor-Thread) ───────────────────────────────────────────
+
+def _handle_frame(msg: str) -> None:
+    """Verarbeitet einen empfangenen Frame: Parsen, Merge, Loxone-Push, Antworten."""
+    log.debug("Nachricht empfangen: %s", msg)
+    try:
+        msg_data = json.loads(msg)
+        msg_type = msg_data.get("type")
+
+        if msg_type == "PLUGIN_STATE_REQUEST":
+            with state.send_lock:
+                send_plugin_state(state.conn, msg_id=msg_data.get("id"))
+
+        elif msg_type == "HMIP_SYSTEM_RESPONSE":
+            rid  = msg_data.get("id")
+            meta = _resolve_pending(rid)
+            code = (msg_data.get("body") or {}).get("code")
+            if meta:
+                path = meta.get("path")
+                _complete_pending(meta, code)
+                # Durch Coalescing ersetzte Befehle teilen sich das ACK des gesendeten
+                for alias in meta.get("aliases") or ():
+                    alias_meta = _resolve_pending(alias)
+                    if alias_meta:
+                        _complete_pending(alias_meta, code)
+                if path == "/hmip/home/getSystemState":
+                    save_system_state(msg_data)
+                    log.info("getSystemState → Snapshot gespeichert (code=%s)", code)
+                    # Frischer Gesamtzustand (Start/Reconnect) → auch an Loxone vollständig übertragen
+                    trigger_resync("snapshot")
+                elif code == 200:
+                    log.info("ACK %s OK (id=%s)", path, rid)
+                else:
+                    log.warning("ACK %s Fehler (code=%s, id=%s)", path, code, rid)
+            else:
+                log.debug("Unkorrelierte HMIP_SYSTEM_RESPONSE (id=%s, code=%s) ignoriert.", rid, code)
+
+        elif msg_type == "CONFIG_TEMPLATE_REQUEST":
+            with state.send_lock:
+                send_config_template_response(
+                    state.conn, msg_data.get("id"),
+                    state.config_internal.get("log_level", "info"),
+                )
+
+        elif msg_type == "CONFIG_UPDATE_REQUEST":
+            props     = (msg_data.get("body") or {}).get("properties") or {}
+            new_level = props.get("log_level")
+            if new_level and new_level in ("debug", "info", "warning", "error"):
+                _apply_log_level(new_level)
+                feedback = f"Log-Level auf '{new_level}' gesetzt."
+                log.info(feedback)
+            else:
+                feedback = None
+            with state.send_lock:
+                send_config_update_response(state.conn, msg_data.get("id"), "APPLIED", feedback)
+
+        elif msg_type == "HMIP_SYSTEM_EVENT":
+            save_system_state(msg_data)
+            if state.loxone_push is not None:
+                state.loxone_push.submit(msg_data)
+            else:
+                push_event(msg_data)
+
+        else:
+            log.debug("Unbehandelter Nachrichtentyp: %r", msg_type)
+
+    except Exception:
+        log.exception("Fehler beim Verarbeiten der Nachricht")
+
+
+def _process_loop(frames: FrameQueue) -> None:
+    """Arbeitet die Event-Warteschlange ab; Disk-Writes und UDP-Push bremsen so nie den Empfang.
+
+    Abgelaufene Pending-Requests und optimistische Updates werden höchstens alle
+    ``_HOUSEKEEPING_INTERVAL_S`` bereinigt (auch ohne eintreffende Frames). Ein Fehler
+    beendet nie den Thread – sonst liefe die Warteschlange voll und der Empfang stünde.
+    """
+    next_housekeeping = time.monotonic() + _HOUSEKEEPING_INTERVAL_S
+    while True:
+        item = frames.get(timeout=_HOUSEKEEPING_INTERVAL_S)
+        if item is None and frames.closed:
+            return  # Warteschlange geschlossen und leer
+        try:
+            if item is not None:
+                enqueued_at, msg = item
+                try:
+                    _handle_frame(msg)
+                finally:
+                    frames.done(enqueued_at)
+            now = time.monotonic()
+            if now >= next_housekeeping:
+                next_housekeeping = now + _HOUSEKEEPING_INTERVAL_S
+                _cleanup_pending()
+                _expire_optimistic()
+        except Exception:
+            log.exception("Fehler in der Event-Verarbeitung")
+
+
+def stop_processing(timeout: float = 5.0) -> None:
+    """Schließt die Event-Warteschlange und wartet, bis der Verarbeiter den Rest abgearbeitet hat.
+
+    Vor dem letzten Snapshot-Flush aufrufen, damit danach keine Events mehr gemerged werden.
+    """
+    if state.ws_inbound is not None:
+        state.ws_inbound.close()
+    if _processor is not None:
+        _processor.join(timeout)
+
+
+# ── WebSocket-Loop (Empfangs-Thread) ──────────────────────────────────────────
 
 def ws_loop() -> None:
     headers = {
@@ -98,6 +267,13 @@ def ws_loop() -> None:
         sslopt = {"cert_reqs": ssl.CERT_NONE}
         log.warning("[SSL] Verbindung ohne Zertifikatsprüfung (unsicher)")
 
+    # Empfang und Verarbeitung entkoppeln: dieser Thread liest nur Frames
+    frames = FrameQueue(maxsize=int(state.config_internal.get("ws_event_queue_size", 1000)))
+    state.ws_inbound = frames
+    global _processor
+    _processor = threading.Thread(target=_process_loop, args=(frames,), name="ws-processor", daemon=True)
+    _processor.start()
+
     backoff = 1.0
     while True:
         try:
@@ -111,76 +287,17 @@ def ws_loop() -> None:
                 send_plugin_state(state.conn)
                 rid = send_get_system_state(state.conn)
             _register_pending(rid, "/hmip/home/getSystemState")
+            # Während der Trennung gepufferte Befehle erst nach dem Handshake senden
+            state.ws_writer.resume()
 
             while True:
                 try:
                     msg = state.conn.recv()
                 except websocket.WebSocketTimeoutException:
-                    try:
-                        with state.send_lock:
-                            state.conn.ping()
-                        log.debug("Keepalive-Ping gesendet.")
-                    except Exception as ping_err:
-                        log.warning("Keepalive-Ping fehlgeschlagen: %s", ping_err)
-                        raise
-                    _cleanup_pending()
+                    # Ping über den WS-Writer; schlägt er fehl, bricht der Writer die Verbindung ab
+                    state.ws_writer.ping()
                     continue
-
-                log.debug("Nachricht empfangen: %s", msg)
-                try:
-                    msg_data = json.loads(msg)
-                    msg_type = msg_data.get("type")
-
-                    if msg_type == "PLUGIN_STATE_REQUEST":
-                        with state.send_lock:
-                            send_plugin_state(state.conn, msg_id=msg_data.get("id"))
-
-                    elif msg_type == "HMIP_SYSTEM_RESPONSE":
-                        rid  = msg_data.get("id")
-                        meta = _resolve_pending(rid)
-                        code = (msg_data.get("body") or {}).get("code")
-                        if meta:
-                            path = meta.get("path")
-                            if path == "/hmip/home/getSystemState":
-                                save_system_state(msg_data)
-                                log.info("getSystemState → Snapshot gespeichert (code=%s)", code)
-                            elif code == 200:
-                                log.info("ACK %s OK (id=%s)", path, rid)
-                            else:
-                                log.warning("ACK %s Fehler (code=%s, id=%s)", path, code, rid)
-                        else:
-                            log.debug("Unkorrelierte HMIP_SYSTEM_RESPONSE (id=%s, code=%s) ignoriert.", rid, code)
-
-                    elif msg_type == "CONFIG_TEMPLATE_REQUEST":
-                        with state.send_lock:
-                            send_config_template_response(
-                                state.conn, msg_data.get("id"),
-                                state.config_internal.get("log_level", "info"),
-                            )
-
-                    elif msg_type == "CONFIG_UPDATE_REQUEST":
-                        props     = (msg_data.get("body") or {}).get("properties") or {}
-                        new_level = props.get("log_level")
-                        if new_level and new_level in ("debug", "info", "warning", "error"):
-                            _apply_log_level(new_level)
-                            feedback = f"Log-Level auf '{new_level}' gesetzt."
-                            log.info(feedback)
-                        else:
-                            feedback = None
-                        with state.send_lock:
-                            send_config_update_response(state.conn, msg_data.get("id"), "APPLIED", feedback)
-
-                    elif msg_type == "HMIP_SYSTEM_EVENT":
-                        save_system_state(msg_data)
-                        push_event_devices(state.LOXONE_HOST, state.LOXONE_UDP_PORT, msg_data)
-
-                    else:
-                        log.debug("Unbehandelter Nachrichtentyp: %r", msg_type)
-
-                except Exception:
-                    log.exception("Fehler beim Verarbeiten der Nachricht")
-
-                _cleanup_pending()
+                frames.put(msg)
 
         except Exception:
             log.exception("WebSocket Fehler")
@@ -191,8 +308,7 @@ def ws_loop() -> None:
                 pass
             finally:
                 state.conn = None
-            with state.pending_lock:
-                state.pending.clear()
+            _drop_pending(state.ws_writer.unsent_ids() if state.ws_writer.buffering else None)
             sleep_for = backoff + random.uniform(0, 0.3 * backoff)
             log.info("Reconnect in %.1fs (Backoff: %.1fs)", sleep_for, backoff)
             time.sleep(sleep_for)
@@ -0,0 +1,415 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/adapters/hmip_writer.py – Schreib-Thread für ausgehende WebSocket-Nachrichten
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import app.state as state
+from app.adapters.hmip_coalesce import CommandCoalescer
+from app.adapters.hmip_scheduler import (PRIO_ALARM, PRIO_CONTROL, PRIO_STOP, OutboundMessage, OutboundQueue,
+                                         SendQueueFull, Target, TokenBucket, duty_cycle_factor)
+from app.adapters.hmip_websocket import _complete_pending
+
+log = logging.getLogger("bridge-ws")
+
+_PING = object()
+_STOP = object()
+_RESUME = object()
+_MAX_BURST = 64  # so viele Einträge werden pro send_lock-Erwerb gesendet
+_DUTY_REFRESH_S = 1.0
+_OFFLINE_EXPIRE_S = 1.0  # so oft prüft der Writer ohne Verbindung die TTL des Puffers
+
+
+class BatchSink:
+    """Sammelt die von ``send_hmip_*`` erzeugten Nachrichten, statt sie zu senden.
+
+    Damit lassen sich mehrere Befehle bauen und anschließend mit
+    ``WsWriter.send_batch`` als ein Eintrag in die Sendewarteschlange stellen.
+    """
+
+    def __init__(self) -> None:
+        self.messages: List[str] = []
+
+    def send(self, data: str) -> None:
+        self.messages.append(data)
+
+
+def _item_priority(item: Any) -> int:
+    if item is _PING or item is _RESUME:
+        return PRIO_CONTROL
+    if item is _STOP:
+        return PRIO_STOP
+    if isinstance(item, list):
+        return min((m.priority for m in item), default=PRIO_STOP)
+    return item.priority
+
+
+def _item_targets(item: Any) -> List[Target]:
+    if isinstance(item, list):
+        return [m.target for m in item if m.target is not None]
+    if isinstance(item, OutboundMessage) and item.target is not None:
+        return [item.target]
+    return []
+
+
+def _home_duty_cycle() -> Optional[float]:
+    """Duty Cycle der HCU in Prozent aus dem home-Objekt des State-Stores."""
+    store = state.hmip_store
+    view = store.view() if store is not None else None
+    return view.home.get("dutyCycle") if view is not None else None
+
+
+class WsWriter:
+    """Einziger Schreiber auf ``state.conn``.
+
+    Verhält sich nach außen wie ein WebSocket mit ``send(text)``, damit die
+    ``send_hmip_*``-Helfer unverändert Payload und Request-ID bauen können –
+    ``send`` stellt aber nur in die Warteschlange und kehrt sofort zurück.
+    Ein Thread arbeitet die Schlange in Reihenfolge ab; langsame TLS-Writes
+    blockieren damit keine HTTP-Threads mehr. Auch der Keepalive-Ping aus
+    ``ws_loop`` läuft hier durch. Schlägt ein Write fehl, wird die Verbindung
+    abgebrochen, damit ``ws_loop`` neu verbindet. Liegen mehrere Einträge an,
+    werden sie unter einem einzigen ``send_lock``-Erwerb hintereinander gesendet.
+    Mit ``coalesce_window_ms > 0`` laufen Einzelbefehle mit absolutem Zielwert
+    (Dimmen, Farbe, Solltemperatur, Rollladen) durch einen ``CommandCoalescer``.
+
+    Die Schlange ist nach Priorität sortiert (Alarm > Schalten > Dimmen >
+    Thermostat, innerhalb einer Priorität FIFO). Mit ``rate > 0`` begrenzt ein
+    Token-Bucket die Befehle pro Sekunde; die Rate sinkt mit dem von der HCU
+    gemeldeten Duty Cycle ab ``duty_soft_pct`` linear bis auf
+    ``duty_min_factor`` bei ``duty_hard_pct``. Alarme und Pings sind nie gedrosselt.
+
+    Mit ``offline_buffer_size > 0`` werden Befehle ohne Verbindung nicht verworfen,
+    sondern bis zu ``offline_ttl_s`` gepuffert und nach dem Reconnect-Handshake
+    (``resume``) in Reihenfolge gesendet. Abgelaufene oder verdrängte Befehle
+    werden gezählt, geloggt und ihre Pending-Einträge mit ``expired`` beendet –
+    die TTL prüft der Writer-Thread auch, solange die Verbindung fehlt.
+    """
+
+    def __init__(self, maxsize: int = 500, coalesce_window_ms: float = 0,
+                 rate: float = 0, burst: float = 10, duty_soft_pct: float = 50,
+                 duty_hard_pct: float = 90, duty_min_factor: float = 0.1,
+                 duty_source: Callable[[], Optional[float]] = _home_duty_cycle,
+                 offline_buffer_size: int = 0, offline_ttl_s: float = 30) -> None:
+        self._queue = OutboundQueue(maxsize, _item_priority, _item_targets)
+        self._thread: Optional[threading.Thread] = None
+        self._coalescer: Optional[CommandCoalescer] = (
+            CommandCoalescer(coalesce_window_ms, self._enqueue_coalesced) if coalesce_window_ms > 0 else None
+        )
+        self._bucket = TokenBucket(rate, burst)
+        self._duty_soft = float(duty_soft_pct)
+        self._duty_hard = float(duty_hard_pct)
+        self._duty_min_factor = max(0.01, min(1.0, float(duty_min_factor)))
+        self._duty_source = duty_source
+        self._duty: Optional[float] = None
+        self._duty_checked = 0.0
+        self._offline_max = max(0, int(offline_buffer_size))
+        self._offline_ttl = max(0.0, float(offline_ttl_s))
+        self._offline: deque = deque()  # (eingestellt monotonic, Nachricht) – nur der Writer-Thread hängt an
+        self._offline_lock = threading.Lock()
+        self._inflight: List[OutboundMessage] = []
+        self._expired_log: deque = deque(maxlen=20)
+        self.sent = 0
+        self.dropped = 0
+        self.throttled = 0
+        self.buffered = 0
+        self.flushed = 0
+        self.expired = 0
+
+    # ── Producer-Seite ────────────────────────────────────────────────────────
+
+    def send(self, data: str) -> None:
+        """Stellt eine fertig serialisierte Nachricht zum Senden ein (nicht blockierend)."""
+        msg = OutboundMessage.parse(data)
+        if self._coalescer is not None and self._coalescer.offer(msg):
+            return
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped += 1
+            raise SendQueueFull("Sendewarteschlange voll") from None
+
+    def _enqueue_coalesced(self, msg: OutboundMessage) -> None:
+        """Ziel des Coalescers – der ursprüngliche Aufrufer ist schon zurückgekehrt.
+
+        Bei voller Schlange fliegt ``SendQueueFull``; der Coalescer beendet dann die
+        Pending-Einträge (samt optimistischem Update) des verworfenen Befehls.
+        """
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            self.dropped += 1
+            raise SendQueueFull("Sendewarteschlange voll – zusammengefasster Befehl verworfen") from None
+
+    def send_batch(self, messages: List[str]) -> None:
+        """Stellt mehrere Nachrichten als einen Eintrag ein; sie gehen lückenlos hintereinander raus."""
+        if not messages:
+            return
+        try:
+            self._queue.put_nowait([OutboundMessage.parse(data) for data in messages])
+        except queue.Full:
+            self.dropped += len(messages)
+            raise SendQueueFull("Sendewarteschlange voll") from None
+
+    def ping(self) -> None:
+        """Keepalive-Ping über den Schreib-Thread (ersetzt conn.ping() im Empfangs-Thread)."""
+        try:
+            self._queue.put_nowait(_PING)
+        except queue.Full:
+            log.debug("Sendewarteschlange voll – Keepalive-Ping übersprungen")
+
+    def resume(self) -> None:
+        """Nach dem Reconnect-Handshake: gepufferte Befehle vor allen neuen senden."""
+        if self._offline_max:
+            self._queue.put_control(_RESUME)
+
+    @property
+    def buffering(self) -> bool:
+        """True, wenn Befehle auch ohne Verbindung angenommen werden."""
+        return self._offline_max > 0
+
+    def unsent_ids(self) -> Set[str]:
+        """Request-IDs aller noch nicht gesendeten Befehle (Schlange, Puffer, laufender Burst)."""
+        messages: List[OutboundMessage] = list(self._inflight)
+        with self._offline_lock:
+            messages.extend(msg for _, msg in self._offline)
+        for item in self._queue.items():
+            if isinstance(item, list):
+                messages.extend(item)
+            elif isinstance(item, OutboundMessage):
+                messages.append(item)
+        return {m.rid for m in messages if m.rid}
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        return {
+            "rate":        round(self._bucket.rate, 2) if self._bucket.enabled else None,
+            "duty_cycle":  self._duty,
+            "tokens":      round(self._bucket.tokens(), 2) if self._bucket.enabled else None,
+            "throttled":   self.throttled,
+            "queued_by_priority": {str(k): v for k, v in sorted(self._queue.depth_by_priority().items())},
+        }
+
+    def offline_stats(self) -> Optional[Dict[str, Any]]:
+        if not self._offline_max:
+            return None
+        with self._offline_lock:
+            depth = len(self._offline)
+            oldest = time.monotonic() - self._offline[0][0] if self._offline else 0.0
+        return {
+            "depth":         depth,
+            "capacity":      self._offline_max,
+            "oldest_age_ms": int(oldest * 1000),
+            "buffered":      self.buffered,
+            "flushed":       self.flushed,
+            "expired":       self.expired,
+            "last_expired":  list(self._expired_log),
+        }
+
+    def coalesce_stats(self) -> Optional[dict]:
+        c = self._coalescer
+        if c is None:
+            return None
+        return {"held": c.held_count(), "forwarded": c.forwarded, "coalesced": c.coalesced}
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ws-writer", daemon=True)
+        self._thread.start()
+        log.info("WS-Writer gestartet (Warteschlange max. %d)", self._queue.maxsize)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        if self._coalescer is not None:
+            self._coalescer.flush_all()
+        self._queue.put_control(_STOP)
+        thread.join(timeout=timeout)
+        self._thread = None
+
+    # ── Consumer-Seite ────────────────────────────────────────────────────────
+
+    def _ready(self, prio: int) -> float:
+        """Freigabe für den vordersten Eintrag: 0 = sofort senden, sonst Wartezeit in Sekunden."""
+        if prio <= PRIO_ALARM or prio == PRIO_STOP or not self._bucket.enabled:
+            return 0.0
+        now = time.monotonic()
+        if now - self._duty_checked >= _DUTY_REFRESH_S:
+            self._duty_checked = now
+            self._refresh_duty_cycle()
+        wait = self._bucket.wait_time()
+        if wait > 0:
+            self.throttled += 1
+        return wait
+
+    def _refresh_duty_cycle(self) -> None:
+        try:
+            duty = self._duty_source()
+        except Exception:
+            return
+        if duty != self._duty:
+            factor = duty_cycle_factor(duty, self._duty_soft, self._duty_hard, self._duty_min_factor)
+            if factor < 1.0:
+                log.info("WS-Writer: Duty Cycle %s%% – Senderate auf %.1f/s gedrosselt",
+                         duty, self._bucket.base_rate * factor)
+            self._duty = duty
+            self._bucket.set_factor(factor)
+
+    def _take_tokens(self, item: Any) -> None:
+        if item is _PING:
+            return
+        messages = item if isinstance(item, list) else [item]
+        cost = sum(1 for m in messages if m.priority > PRIO_ALARM)
+        if cost:
+            self._bucket.take(cost)
+
+    def _run(self) -> None:
+        expire_every = _OFFLINE_EXPIRE_S if self._offline_max else None
+        while True:
+            try:
+                item = self._queue.get_ready(self._ready, timeout=expire_every)
+            except queue.Empty:
+                self._expire_offline()
+                continue
+            burst = []
+            while item is not _STOP:
+                if item is _RESUME:
+                    if burst:
+                        self._send_burst(burst)
+                        burst = []
+                    self._flush_offline()
+                else:
+                    self._take_tokens(item)
+                    burst.append(item)
+                    if len(burst) >= _MAX_BURST:
+                        break
+                try:
+                    item = self._queue.get_ready(self._ready, timeout=0)
+                except queue.Empty:
+                    break
+            if burst:
+                self._send_burst(burst)
+            if item is _STOP:
+                return
+
+    def _send_burst(self, burst: list) -> None:
+        conn = state.conn
+        messages = [msg for item in burst if item is not _PING
+                    for msg in (item if isinstance(item, list) else (item,))]
+        if self._offline_max and messages and (conn is None or self._offline):
+            # Ohne Verbindung (oder solange der Puffer nicht geleert ist) hinten anhängen
+            self._buffer(messages)
+            return
+        if conn is None:
+            if messages:
+                self.dropped += len(messages)
+                log.warning("WS-Writer: keine Verbindung – %d Nachricht(en) verworfen", len(messages))
+            return
+        start = time.monotonic()
+        done = 0
+        self._inflight = messages
+        try:
+            with state.send_lock:
+                for item in burst:
+                    if item is _PING:
+                        conn.ping()
+                        log.debug("Keepalive-Ping gesendet.")
+                        continue
+                    for msg in (item if isinstance(item, list) else (item,)):
+                        conn.send(msg.data)
+                        done += 1
+                        self.sent += 1
+        except Exception as e:
+            log.warning("WS-Writer: Senden fehlgeschlagen (%s) – Verbindung wird abgebrochen", e)
+            if self._offline_max:
+                self._buffer(messages[done:])
+            self._abort(conn)
+            return
+        finally:
+            self._inflight = []
+        elapsed_ms = (time.monotonic() - start) * 1000
+        if elapsed_ms > 500:
+            log.warning("WS-Writer: langsamer Write (%.0f ms für %d Nachricht(en))", elapsed_ms, len(messages))
+
+    # ── Offline-Puffer ────────────────────────────────────────────────────────
+
+    def _buffer(self, messages: List[OutboundMessage]) -> None:
+        self._expire_offline()
+        now = time.monotonic()
+        evicted = []
+        with self._offline_lock:
+            if not self._offline:
+                log.info("WS-Writer: keine Verbindung – Befehle werden gepuffert (max. %d, TTL %.0fs)",
+                         self._offline_max, self._offline_ttl)
+            for msg in messages:
+                if len(self._offline) >= self._offline_max:
+                    evicted.append(self._offline.popleft())
+                self._offline.append((now, msg))
+            self.buffered += len(messages)
+        if evicted:
+            self._report_expired(evicted, "overflow")
+
+    def _flush_offline(self) -> None:
+        if state.conn is None:
+            return  # schon wieder getrennt – Puffer bleibt samt Zeitstempeln bis zum nächsten resume
+        self._expire_offline()
+        with self._offline_lock:
+            live = [msg for _, msg in self._offline]
+            self._offline.clear()
+        if live:
+            log.info("WS-Writer: %d gepufferte(n) Befehl(e) nach Reconnect gesendet", len(live))
+            self.flushed += len(live)
+            self._bucket.take(len(live))
+            self._send_burst([live])
+
+    def _expire_offline(self) -> None:
+        """Verwirft gepufferte Befehle, deren TTL abgelaufen ist (Puffer ist nach Alter sortiert)."""
+        if not self._offline_max:
+            return
+        cutoff = time.monotonic() - self._offline_ttl
+        expired = []
+        with self._offline_lock:
+            while self._offline and self._offline[0][0] < cutoff:
+                expired.append(self._offline.popleft())
+        if expired:
+            self._report_expired(expired, "ttl")
+
+    def _report_expired(self, entries: List[Tuple[float, OutboundMessage]], reason: str) -> None:
+        """Beendet die Pending-Einträge verworfener Befehle mit ``expired`` und vermerkt sie."""
+        now = time.monotonic()
+        for ts, msg in entries:
+            rid, path = msg.rid, msg.path
+            with state.pending_lock:
+                meta = state.pending.pop(rid, None) if rid else None
+                if meta is not None:
+                    state.pending_stats["expired"] += 1
+            if meta is not None:
+                _complete_pending(meta, None, "expired")
+            self._expired_log.append({"id": rid, "path": path, "age_s": round(now - ts, 1), "reason": reason})
+        self.expired += len(entries)
+        log.warning("WS-Writer: %d gepufferte(n) Befehl(e) verworfen (%s)", len(entries), reason)
+
+    @staticmethod
+    def _abort(conn) -> None:
+        """Bricht die Verbindung ab; recv() in ws_loop wirft dann und löst den Reconnect aus."""
+        try:
+            abort = getattr(conn, "abort", None)
+            if abort is not None:
+                abort()
+            else:
+                conn.close()
+        except Exception:
+            pass
@@ -15,6 +15,7 @@ import requests
 
 import app.state as state
 from app.adapters.base import BaseAdapter, Device, DeviceCapability, DeviceChannel
+from app.change_feed import diff_channels, diff_fields, get_change_feed
 
 log = logging.getLogger("bridge-ws")
 
@@ -358,6 +359,7 @@ def refresh_device(ip: str, gen: int) -> Optional[Dict]:
         status = _get_status_gen1(ip, timeout=3.0)
 
     if ip in cached:
+        before = dict(cached[ip])
         # Gerät nicht erreichbar wenn keine Channel/Emeter-Daten zurückkamen
         reachable = bool(status.get("channels") or status.get("emeters") or status.get("rssi") is not None)
         cached[ip].update({
@@ -370,10 +372,27 @@ def refresh_device(ip: str, gen: int) -> Optional[Dict]:
             "last_seen":       int(time.time()) if reachable else cached[ip].get("last_seen"),
         })
         save_cache(list(cached.values()))
+        _publish_changes(ip, before, cached[ip])
         return cached[ip]
     return None
 
 
+def _publish_changes(ip: str, before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    """Meldet geänderte Felder eines Refreshs an den ChangeFeed (/events)."""
+    ts = time.time()
+    changes = [{"source": "shelly", "kind": "device", "id": ip, "channel": None,
+                "field": f, "value": v, "ts": ts}
+               for f, v in diff_fields(before, after, skip=("channels", "emeters", "last_seen"))]
+    changes += [{"source": "shelly", "kind": "device", "id": ip, "channel": ch,
+                 "field": f, "value": v, "ts": ts}
+                for ch, f, v in diff_channels(before.get("channels"), after.get("channels"))]
+    changes += [{"source": "shelly", "kind": "device", "id": ip, "channel": f"em{ch}",
+                 "field": f, "value": v, "ts": ts}
+                for ch, f, v in diff_channels(before.get("emeters"), after.get("emeters"))]
+    if changes:
+        get_change_feed().publish(changes)
+
+
 def refresh_all_devices() -> int:
     """Aktualisiert Status aller gecachten Geräte parallel. Gibt Anzahl zurück."""
     devices = load_cached()
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: Apache-2.0
+# app/change_feed.py – Prozessweiter Strom feldgenauer Zustandsänderungen (für /events)
+
+import logging
+import threading
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import app.state as state
+
+log = logging.getLogger("bridge-ws")
+
+_FEED_SIZE = 10000
+
+
+class ChangeFeed:
+    """Ringpuffer nummerierter Änderungen mit Warte-Funktion.
+
+    Produzenten (HmIP-Store, Shelly-Refresh) rufen ``publish`` auf und blockieren
+    nie auf Konsumenten. Konsumenten merken sich nur die letzte gelesene
+    Sequenznummer und holen mit ``read`` alles Neuere ab; wer zu weit zurückliegt
+    (aus dem Ring gefallen), bekommt ``gap=True`` und muss neu synchronisieren.
+    ``notify`` weckt Leser mit ``wake_on_notify`` ohne neuen Eintrag (z. B. wenn ein
+    HCU-Event nichts ändert, aber Revisionen weiterzählt).
+    """
+
+    def __init__(self, maxlen: int = _FEED_SIZE) -> None:
+        self._cond = threading.Condition()
+        self._buf: deque = deque(maxlen=max(1, int(maxlen)))
+        self._seq = 0
+        self._notified = 0
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, changes: Iterable[Dict[str, Any]]) -> int:
+        """Hängt Änderungen an und weckt wartende Leser. Gibt die letzte Sequenznummer zurück."""
+        with self._cond:
+            added = False
+            for change in changes:
+                self._seq += 1
+                self._buf.append((self._seq, change))
+                added = True
+            if added:
+                self._cond.notify_all()
+            return self._seq
+
+    def notify(self) -> None:
+        """Weckt Leser, die mit ``wake_on_notify`` warten, ohne einen Eintrag anzuhängen."""
+        with self._cond:
+            self._notified += 1
+            self._cond.notify_all()
+
+    def read(self, after_seq: int, timeout: float = 0.0,
+             wake_on_notify: bool = False) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        """Liefert (Änderungen mit seq > after_seq, gap). Wartet bis zu ``timeout`` Sekunden auf neue."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        with self._cond:
+            if after_seq > self._seq:
+                # Sequenz aus einem früheren Prozesslauf
+                return [], True
+            notified = self._notified
+            while self._seq <= after_seq and not (wake_on_notify and self._notified != notified):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._seq == after_seq or not self._buf:
+                return [], False
+            first = self._buf[0][0]
+            gap = after_seq + 1 < first
+            start = max(0, after_seq + 1 - first)
+            return list(islice(self._buf, start, None)), gap
+
+
+_feed_lock = threading.Lock()
+
+
+def get_change_feed() -> ChangeFeed:
+    """Liefert den prozessweiten ChangeFeed (``state.change_feed``), lazy angelegt."""
+    if state.change_feed is None:
+        with _feed_lock:
+            if state.change_feed is None:
+                state.change_feed = ChangeFeed()
+    return state.change_feed
+
+
+def diff_fields(before: Optional[Dict[str, Any]], after: Dict[str, Any],
+                skip: Tuple[str, ...] = ()) -> List[Tuple[str, Any]]:
+    """Flacher Vergleich: (Feld, neuer Wert) für alle geänderten oder neuen Felder."""
+    before = before if isinstance(before, dict) else {}
+    return [(k, v) for k, v in after.items()
+            if k not in skip and (k not in before or before[k] != v)]
+
+
+def diff_channels(before: Optional[Dict[str, Any]],
+                  after: Optional[Dict[str, Any]]) -> List[Tuple[str, str, Any]]:
+    """(Kanal, Feld, neuer Wert) für alle geänderten Felder in Kanal-Dicts {idx: {feld: wert}}."""
+    before = before if isinstance(before, dict) else {}
+    out = []
+    for idx, ch in (after or {}).items():
+        if not isinstance(ch, dict):
+            continue
+        for field, value in diff_fields(before.get(idx), ch):
+            out.append((str(idx), field, value))
+    return out
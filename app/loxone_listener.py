@@ -0,0 +1,221 @@
+# SPDX-License-Identifier: Apache-2.0
+
+# loxone_listener.py
+# Empfängt Steuerbefehle vom Loxone Miniserver per UDP (Virtueller Ausgang).
+# Format wie beim Push: "hmip_<DEVICE_ID>_ch<N>_<field>@<wert>", mehrere Zeilen pro Datagramm erlaubt.
+# Unterstützt: on (0/1), dimLevel (0.0–1.0), setPointTemperature (4.5–30.5 °C)
+
+import ipaddress
+import logging
+import re
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import app.state as state
+from app.adapters.hmip_commands import commands_unavailable, send_command
+from app.adapters.hmip_messages import send_hmip_set_dim_level, send_hmip_set_point_temperature, send_hmip_set_switch
+from app.adapters.hmip_scheduler import SendQueueFull
+
+log = logging.getLogger("bridge-ws")
+
+# Obergrenze für die Absender-Tabelle (Zähler je IP); weitere Absender nur in den Summen
+_MAX_SENDERS = 256
+
+_LINE_RE = re.compile(r"^hmip_(?P<device>.+)_ch(?P<channel>\d+)_(?P<field>[A-Za-z]+)@(?P<value>.+)$")
+
+
+def _parse_on(raw: str) -> bool:
+    if raw not in ("0", "1"):
+        raise ValueError("on muss 0 oder 1 sein")
+    return raw == "1"
+
+
+def _parse_dim_level(raw: str) -> float:
+    level = float(raw)
+    if not 0 <= level <= 1:
+        raise ValueError("dimLevel muss zwischen 0 und 1 liegen")
+    return round(level, 2)
+
+
+def _parse_temperature(raw: str) -> float:
+    temperature = float(raw)
+    if not 4.5 <= temperature <= 30.5:
+        raise ValueError("setPointTemperature muss zwischen 4.5 und 30.5 °C liegen")
+    return temperature
+
+
+# Feld → (Sendefunktion, HCU-Pfad, Werteparser); dieselben Befehle wie die HTTP-Routen
+_COMMANDS: Dict[str, Tuple[Callable[..., str], str, Callable[[str], Any]]] = {
+    "on":                  (send_hmip_set_switch, "/hmip/device/control/setSwitchState", _parse_on),
+    "dimLevel":            (send_hmip_set_dim_level, "/hmip/device/control/setDimLevel", _parse_dim_level),
+    "setPointTemperature": (send_hmip_set_point_temperature, "/hmip/device/control/setSetPointTemperature",
+                            _parse_temperature),
+}
+
+
+def parse_command(line: str) -> Tuple[Callable[..., str], str, tuple]:
+    """Zerlegt eine Befehlszeile in (Sendefunktion, Pfad, Argumente). ValueError bei ungültiger Zeile."""
+    match = _LINE_RE.match(line.strip())
+    if match is None:
+        raise ValueError(f"Unbekanntes Format: {line.strip()!r}")
+    command = _COMMANDS.get(match["field"])
+    if command is None:
+        raise ValueError(f"Feld nicht steuerbar: {match['field']}")
+    send_fn, path, parse = command
+    return send_fn, path, (match["device"], parse(match["value"].strip()), int(match["channel"]))
+
+
+def _allow_networks(allow: List[str]) -> List[Any]:
+    """Allow-List als Netze; Hostnamen (z.B. miniserver_ip) werden einmalig aufgelöst."""
+    networks = []
+    for entry in allow:
+        try:
+            networks.append(ipaddress.ip_network(str(entry), strict=False))
+            continue
+        except ValueError:
+            pass
+        try:
+            for info in socket.getaddrinfo(str(entry), None, socket.AF_INET, socket.SOCK_DGRAM):
+                networks.append(ipaddress.ip_network(info[4][0]))
+        except OSError as e:
+            log.warning("Loxone-Allow-List: %s nicht auflösbar: %s", entry, e)
+    return networks
+
+
+class CommandListener:
+    """UDP-Empfänger für Loxone-Steuerbefehle mit Absender-Allow-List.
+
+    Datagramme von Adressen außerhalb von ``allow`` (IPs oder Netze in CIDR-Notation)
+    werden verworfen. Gültige Zeilen laufen über ``send_command`` – also mit Pending-
+    Registrierung, Coalescing, Priorisierung und optimistischem Update wie bei HTTP.
+    Zähler gibt es gesamt und je erlaubter Absender-IP; abgewiesene Pakete zählen nur
+    in der Summe.
+    """
+
+    def __init__(self, port: int, allow: List[str], bind: str = "0.0.0.0") -> None:
+        self.port = int(port)
+        self.bind = bind
+        self._allow = _allow_networks(allow)
+        self._sock: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._senders: Dict[str, Dict[str, Any]] = {}
+        self.stats_total: Dict[str, int] = {"received": 0, "commands": 0, "rejected": 0,
+                                            "invalid": 0, "unavailable": 0, "queue_full": 0}
+
+    def allowed(self, ip: str) -> bool:
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        return any(addr in net for net in self._allow)
+
+    def _count(self, ip: str, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats_total[key] += n
+            entry = self._senders.get(ip)
+            if entry is None:
+                if len(self._senders) >= _MAX_SENDERS:
+                    return
+                entry = self._senders[ip] = {"received": 0, "commands": 0, "invalid": 0,
+                                             "unavailable": 0, "queue_full": 0, "last_seen": None}
+            entry[key] += n
+            entry["last_seen"] = int(time.time())
+
+    def handle(self, data: bytes, ip: str) -> int:
+        """Verarbeitet ein Datagramm. Gibt die Anzahl eingestellter Befehle zurück."""
+        if not self.allowed(ip):
+            # Nur in der Summe – fremde Absender sollen die Tabelle nicht füllen können
+            with self._lock:
+                self.stats_total["rejected"] += 1
+            log.debug("Loxone-Befehl von nicht erlaubter Adresse %s verworfen", ip)
+            return 0
+        self._count(ip, "received")
+        sent = 0
+        for line in data.decode("utf-8", errors="replace").splitlines():
+            if not line.strip():
+                continue
+            try:
+                send_fn, path, args = parse_command(line)
+            except ValueError as e:
+                self._count(ip, "invalid")
+                log.warning("Loxone-Befehl von %s ungültig: %s", ip, e)
+                continue
+            reason = commands_unavailable()
+            if reason:
+                self._count(ip, "unavailable")
+                log.warning("Loxone-Befehl von %s verworfen: %s", ip, reason)
+                continue
+            try:
+                rid, _ = send_command(send_fn, path, *args)
+            except SendQueueFull:
+                self._count(ip, "queue_full")
+                log.warning("Loxone-Befehl von %s verworfen: Sendewarteschlange voll", ip)
+                continue
+            self._count(ip, "commands")
+            log.debug("Loxone-Befehl %s von %s → %s (id=%s)", line.strip(), ip, path, rid)
+            sent += 1
+        return sent
+
+    def start(self) -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.bind, self.port))
+        sock.settimeout(1.0)
+        self._sock = sock
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="loxone-listener", daemon=True)
+        self._thread.start()
+        log.info("Loxone-Befehlsempfang auf UDP %s:%s (erlaubt: %s)", self.bind, self.port,
+                 ", ".join(str(n) for n in self._allow) or "niemand")
+
+    def stop(self) -> None:
+        self._running = False
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=2)
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                data, addr = self._sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._running:
+                    log.exception("Loxone-Befehlsempfang fehlgeschlagen")
+                break
+            try:
+                self.handle(data, addr[0])
+            except Exception:
+                log.exception("Fehler beim Verarbeiten eines Loxone-Befehls")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats_total, "port": self.port,
+                    "senders": {ip: dict(entry) for ip, entry in self._senders.items()}}
+
+
+def start_command_listener(loxone_cfg: Optional[Dict[str, Any]]) -> Optional[CommandListener]:
+    """Startet den Empfänger, wenn ``loxone.command_listener.enabled`` gesetzt ist.
+
+    Ohne ``allow`` ist nur miniserver_ip erlaubt.
+    """
+    cfg = (loxone_cfg or {}).get("command_listener") or {}
+    if not cfg.get("enabled"):
+        return None
+    allow = list(cfg.get("allow") or ([loxone_cfg["miniserver_ip"]] if loxone_cfg.get("miniserver_ip") else []))
+    listener = CommandListener(int(cfg.get("port") or 7778), allow, bind=cfg.get("bind") or "0.0.0.0")
+    try:
+        listener.start()
+    except OSError as e:
+        log.error("Loxone-Befehlsempfang konnte nicht starten (UDP %s): %s", listener.port, e)
+        return None
+    state.loxone_listener = listener
+    return listener
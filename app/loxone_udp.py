@@ -1,13 +1,18 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # loxone_udp.py
-# Sendet HmIP-Gerätezustände per UDP an den Loxone Miniserver.
+# Sendet HmIP-Gerätezustände per UDP an den Loxone Miniserver (und weitere UDP/TCP-Ziele).
 # Format: "variablename@wert\r\n" pro Wert (Loxone Virtual Input UDP)
 # Variablenname: hmip_<DEVICE_ID>_ch<N>_<field>
 
 import logging
+import fnmatch
+import math
 import socket
-from typing import Any, Dict, Set, Union
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 log = logging.getLogger("bridge-ws")
 
@@ -34,43 +39,836 @@ _STRING_FIELDS: Set[str] = {
 }
 
 
-def push_channel_state(host: str, port: int, device_id: str, channel_index: Union[str, int], channel: Dict[str, Any]) -> None:
-    """Sendet alle relevanten Werte eines functionalChannel per UDP an Loxone."""
-    if not host or not channel:
-        return
+# Nutzlast pro Datagramm: unter Ethernet-MTU (1500) abzüglich IP-/UDP-Header, mit Reserve
+_MAX_DATAGRAM = 1400
 
-    prefix = f"hmip_{device_id}_ch{channel_index}"
-    lines = []
+# Aufgelöste Zieladressen werden so lange wiederverwendet, bis der Push-Worker sie erneuert
+_RESOLVE_INTERVAL_S = 300.0
+
+
+class UdpSender:
+    """Langlebiger UDP-Socket für ein Ziel (host, port).
+
+    Zeilen werden zu möglichst wenigen Datagrammen bis ``_MAX_DATAGRAM`` Bytes
+    gepackt – eine Zeile wird nie auf zwei Pakete verteilt. Nach einem Sendefehler
+    wird der Socket verworfen und beim nächsten Senden neu angelegt. Der Hostname
+    wird einmal aufgelöst und nur über ``refresh_address`` erneuert, damit
+    ``sendto`` nie auf DNS wartet.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = int(port)
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # ein Sendevorgang je Ziel gleichzeitig (Push, Resync, Rate-Limiter)
+        self._addr: Optional[Tuple[str, int]] = None
+        self._resolved_at = 0.0
+        self.datagrams = 0
+        self.values = 0
+        self.errors = 0
+        self.resolve_errors = 0
+
+    def refresh_address(self, max_age_s: float = 0.0) -> Optional[Tuple[str, int]]:
+        """Löst den Host neu auf, wenn die letzte Auflösung älter als max_age_s ist.
+
+        Schlägt die Auflösung fehl, bleibt die bisherige Adresse in Gebrauch.
+        """
+        if self._addr is not None and time.monotonic() - self._resolved_at < max_age_s:
+            return self._addr
+        try:
+            infos = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_DGRAM)
+            self._addr = infos[0][4][:2]
+            self._resolved_at = time.monotonic()
+        except (OSError, IndexError) as e:
+            self.resolve_errors += 1
+            log.warning("Loxone-Ziel %s nicht auflösbar: %s", self.host, e)
+        return self._addr
+
+    protocol = "udp"
+
+    @property
+    def label(self) -> str:
+        return f"{self.protocol}://{self.host}:{self.port}"
+
+    def _open(self, addr: Tuple[str, int]) -> socket.socket:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _socket(self, addr: Tuple[str, int]) -> socket.socket:
+        sock = self._sock
+        if sock is None:
+            with self._lock:
+                if self._sock is None:
+                    self._sock = self._open(addr)
+                sock = self._sock
+        return sock
+
+    def _transmit(self, sock: socket.socket, addr: Tuple[str, int], lines: List[str]) -> int:
+        sent = 0
+        for payload in pack_datagrams(lines):
+            sock.sendto(payload, addr)
+            sent += 1
+        return sent
+
+    def send_lines(self, lines: List[str]) -> int:
+        """Sendet die Zeilen gebündelt. Gibt die Anzahl gesendeter Pakete zurück."""
+        if not lines:
+            return 0
+        return max(0, self._deliver(lines))
+
+    def _deliver(self, lines: List[str]) -> int:
+        """Überträgt die Zeilen unter dem Sende-Lock. Gibt die Pakete zurück, -1 bei Fehler."""
+        with self._send_lock:
+            try:
+                addr = self._addr or self.refresh_address()
+                if addr is None:
+                    raise OSError(f"Adresse von {self.host} unbekannt")
+                sent = self._transmit(self._socket(addr), addr, lines)
+            except Exception as e:
+                self.errors += 1
+                self._drop_socket()
+                log.warning("Push zu %s fehlgeschlagen: %s", self.label, e)
+                return -1
+            self.datagrams += sent
+            self.values += len(lines)
+            return sent
+
+    def stats(self) -> Dict[str, Any]:
+        return {"target": self.label, "packets": self.datagrams, "values": self.values, "errors": self.errors}
+
+    def _drop_socket(self) -> None:
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self._drop_socket()
+
+
+class TcpSender(UdpSender):
+    """Langlebige TCP-Verbindung für ein Ziel (z.B. Logging-Host), gleiches Zeilenformat.
+
+    Jede TCP-Senke hat eine eigene Warteschlange und einen eigenen Sende-Thread:
+    ``send_lines`` stellt nur ein, ein langsames oder hängendes Ziel hält also weder
+    den Push-Worker noch andere Senken auf. Der Thread fasst wartende Pushs zu einem
+    ``sendall`` zusammen. Nach einem Fehler wird die Verbindung geschlossen und das Ziel
+    mit exponentiell wachsender Pause (``backoff_initial_s`` … ``backoff_max_s``)
+    übersprungen, statt bei jedem Push erneut den Connect-Timeout abzuwarten.
+    """
+
+    protocol = "tcp"
+    connect_timeout_s = 2.0
+    send_timeout_s = 2.0
+    backoff_initial_s = 1.0
+    backoff_max_s = 60.0
+    queue_size = 200
+
+    def __init__(self, host: str, port: int) -> None:
+        super().__init__(host, port)
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._backoff = 0.0
+        self._down_until = 0.0
+        self.skipped = 0
+        self.dropped = 0
+
+    def _open(self, addr: Tuple[str, int]) -> socket.socket:
+        sock = socket.create_connection(addr, timeout=self.connect_timeout_s)
+        sock.settimeout(self.send_timeout_s)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _transmit(self, sock: socket.socket, addr: Tuple[str, int], lines: List[str]) -> int:
+        sock.sendall("".join(lines).encode("utf-8"))
+        return 1
+
+    @property
+    def down(self) -> bool:
+        return time.monotonic() < self._down_until
+
+    def send_lines(self, lines: List[str]) -> int:
+        """Stellt die Zeilen für den Sende-Thread ein. 0, wenn das Ziel gerade pausiert (Backoff)."""
+        if not lines:
+            return 0
+        if self.down:
+            self.skipped += len(lines)
+            return 0
+        with self._cond:
+            if len(self._pending) >= self.queue_size:
+                lost = self._pending.popleft()
+                self.dropped += len(lost)
+                _forget_lines(lost)
+            self._pending.append(list(lines))
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name=f"loxone-tcp-{self.host}:{self.port}",
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                lines = [line for batch in self._pending for line in batch]
+                self._pending.clear()
+            if self._deliver(lines) >= 0:
+                self._backoff = 0.0
+                continue
+            _forget_lines(lines)
+            self._backoff = min(self.backoff_max_s, self._backoff * 2 or self.backoff_initial_s)
+            self._down_until = time.monotonic() + self._backoff
+            log.warning("TCP-Ziel %s pausiert für %.0f s", self.label, self._backoff)
+            with self._cond:
+                # Was während des Fehlversuchs eingestellt wurde, gilt als übersprungen
+                self.skipped += sum(len(batch) for batch in self._pending)
+                for batch in self._pending:
+                    _forget_lines(batch)
+                self._pending.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "skipped": self.skipped, "dropped": self.dropped,
+                "queued": len(self._pending), "down": self.down}
+
+    def close(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.send_timeout_s + 1)
+        self._drop_socket()
+
+
+_SENDER_TYPES = {"udp": UdpSender, "tcp": TcpSender}
+
+_senders: Dict[Tuple[str, str, int], UdpSender] = {}
+_senders_lock = threading.Lock()
+
+
+def get_sender(host: str, port: int, protocol: str = "udp") -> UdpSender:
+    """Liefert den prozessweiten Sender für ein Ziel (protocol, host, port), lazy angelegt."""
+    key = (protocol, host, int(port))
+    sender = _senders.get(key)
+    if sender is None:
+        with _senders_lock:
+            sender = _senders.get(key)
+            if sender is None:
+                sender = _senders[key] = _SENDER_TYPES[protocol](host, port)
+    return sender
+
+
+class PushSink:
+    """Ein Push-Ziel mit optionalen Filtern auf Device-IDs und Feldnamen (fnmatch-Muster).
+
+    Ein Wert geht an die Senke, wenn Gerät und Feld je mindestens ein ``include``-Muster
+    treffen (leer = alles) und kein ``exclude``-Muster. Das Ergebnis wird je
+    (Gerät, Feld) zwischengespeichert, die Muster laufen also nur einmal pro Variable.
+    """
+
+    def __init__(self, sender: UdpSender,
+                 include_devices: Iterable[str] = (), exclude_devices: Iterable[str] = (),
+                 include_fields: Iterable[str] = (), exclude_fields: Iterable[str] = ()) -> None:
+        self.sender = sender
+        self._include_devices = list(include_devices or ())
+        self._exclude_devices = list(exclude_devices or ())
+        self._include_fields = list(include_fields or ())
+        self._exclude_fields = list(exclude_fields or ())
+        self._unfiltered = not (self._include_devices or self._exclude_devices
+                                or self._include_fields or self._exclude_fields)
+        self._cache: Dict[Tuple[str, str], bool] = {}
+
+    @staticmethod
+    def _allowed(value: str, include: List[str], exclude: List[str]) -> bool:
+        if include and not any(fnmatch.fnmatchcase(value, p) for p in include):
+            return False
+        return not any(fnmatch.fnmatchcase(value, p) for p in exclude)
+
+    def matches(self, device_id: str, field: str) -> bool:
+        if self._unfiltered:
+            return True
+        key = (device_id, field)
+        hit = self._cache.get(key)
+        if hit is None:
+            hit = self._cache[key] = (
+                self._allowed(device_id, self._include_devices, self._exclude_devices)
+                and self._allowed(field, self._include_fields, self._exclude_fields))
+        return hit
+
+
+def build_sinks(loxone_cfg: Optional[Dict[str, Any]]) -> List[PushSink]:
+    """Push-Ziele aus der ``loxone``-Sektion: miniserver_ip/udp_port plus Liste ``sinks``."""
+    cfg = loxone_cfg or {}
+    sinks: List[PushSink] = []
+    if cfg.get("miniserver_ip"):
+        sinks.append(PushSink(get_sender(cfg["miniserver_ip"], int(cfg.get("udp_port") or 7777))))
+    for entry in cfg.get("sinks") or ():
+        sender = get_sender(entry["host"], int(entry.get("port") or 7777), entry.get("protocol") or "udp")
+        sinks.append(PushSink(
+            sender,
+            include_devices=entry.get("include_devices") or (),
+            exclude_devices=entry.get("exclude_devices") or (),
+            include_fields=entry.get("include_fields") or (),
+            exclude_fields=entry.get("exclude_fields") or (),
+        ))
+    return sinks
+
+
+def refresh_addresses(max_age_s: float = _RESOLVE_INTERVAL_S) -> None:
+    """Erneuert veraltete Zieladressen aller bekannten Sender (läuft im Push-Worker)."""
+    for sender in list(_senders.values()):
+        sender.refresh_address(max_age_s)
+
+
+def chunk_lines(lines: List[str]) -> List[List[str]]:
+    """Teilt fertige Loxone-Zeilen in Gruppen, die je in ein Datagramm (``_MAX_DATAGRAM``) passen."""
+    out: List[List[str]] = []
+    chunk: List[str] = []
+    size = 0
+    for line in lines:
+        n = len(line.encode("utf-8"))
+        if chunk and size + n > _MAX_DATAGRAM:
+            out.append(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += n
+    if chunk:
+        out.append(chunk)
+    return out
+
+
+def pack_datagrams(lines: List[str]) -> List[bytes]:
+    """Packt fertige Loxone-Zeilen ("name@wert" + CRLF) in möglichst wenige Datagramme."""
+    return ["".join(chunk).encode("utf-8") for chunk in chunk_lines(lines)]
+
+
+class ChangeFilter:
+    """Last-Sent-Cache je Loxone-Variable (``hmip_<id>_ch<N>_<field>``).
+
+    Unveränderte Werte werden unterdrückt. Für numerische Felder kann je Feldname
+    ein Totband gesetzt werden: ``abs`` (absolute Differenz) und/oder ``rel``
+    (Anteil am zuletzt gesendeten Wert) – gesendet wird erst, wenn die Änderung
+    gegenüber dem zuletzt *gesendeten* Wert die größere der beiden Schwellen erreicht.
+    """
+
+    def __init__(self) -> None:
+        self._last: Dict[str, Any] = {}
+        self._deadbands: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self.enabled = True
+        self.sent = 0
+        self.suppressed = 0
+
+    def configure(self, enabled: bool = True, deadbands: Optional[Dict[str, Any]] = None) -> None:
+        parsed: Dict[str, Tuple[float, float]] = {}
+        for field, band in (deadbands or {}).items():
+            if isinstance(band, (int, float)):
+                parsed[field] = (float(band), 0.0)
+            elif isinstance(band, dict):
+                parsed[field] = (float(band.get("abs") or 0.0), float(band.get("rel") or 0.0))
+        with self._lock:
+            self.enabled = bool(enabled)
+            self._deadbands = parsed
+
+    def changed(self, name: str, field: str, value: Any) -> bool:
+        """True, wenn der Wert gesendet werden soll. Merkt ihn nicht vor – das macht ``record``
+        erst nach erfolgreichem Senden, damit ein verlorener Wert beim nächsten Push erneut rausgeht."""
+        with self._lock:
+            if self.enabled and name in self._last:
+                last = self._last[name]
+                if last == value and type(last) is type(value):
+                    self.suppressed += 1
+                    return False
+                band = self._deadbands.get(field)
+                if (band is not None and isinstance(value, (int, float)) and isinstance(last, (int, float))
+                        and abs(value - last) < max(band[0], band[1] * abs(last))):
+                    self.suppressed += 1
+                    return False
+            return True
+
+    def record(self, name: str, value: Any) -> None:
+        """Merkt einen erfolgreich gesendeten (bzw. an eine TCP-Senke übergebenen) Wert."""
+        with self._lock:
+            self._last[name] = value
+            self.sent += 1
+
+    def forget(self, names: Iterable[str]) -> None:
+        """Vergisst Werte, deren Zustellung nachträglich fehlschlug (TCP-Senke)."""
+        with self._lock:
+            for name in names:
+                self._last.pop(name, None)
+
+    def reset(self) -> None:
+        """Vergisst alle gesendeten Werte (nächster Push überträgt wieder alles)."""
+        with self._lock:
+            self._last.clear()
+
+
+_change_filter = ChangeFilter()
+
+
+def _line_name(line: str) -> str:
+    return line.split("@", 1)[0]
+
+
+def _forget_lines(lines: Iterable[str]) -> None:
+    """Nicht zugestellte Zeilen: Werte vergessen, damit der nächste Push sie erneut sendet."""
+    _change_filter.forget(_line_name(line) for line in lines)
+
+
+# Ein zurückgehaltener Wert: (Ziel-Senken, Variablenname, Wert, fertige Loxone-Zeile)
+Outgoing = Tuple[Tuple[PushSink, ...], str, Any, str]
+
+
+class RateLimiter:
+    """Mindestabstand je Loxone-Variable mit Trailing-Edge-Zustellung.
+
+    Der erste Wert einer Variable geht sofort raus. Kommen innerhalb des Intervalls
+    weitere, wird nur der jeweils letzte gehalten und am Intervallende zugestellt.
+    Fälligkeiten liegen in einem Timer-Wheel (``slots`` Fächer à ``tick_s``), das ein
+    einziger Thread weiterdreht – unabhängig von der Zahl der gedrosselten Variablen.
+    Intervalle je Gerät (``devices``) haben Vorrang vor denen je Feldname (``fields``).
+    """
+
+    def __init__(self, deliver: Callable[[List[Outgoing]], None], tick_s: float = 0.1,
+                 slots: int = 512, clock: Callable[[], float] = time.monotonic) -> None:
+        self._deliver = deliver
+        self._tick = tick_s
+        self._clock = clock
+        self._wheel: List[Dict[str, int]] = [{} for _ in range(slots)]
+        self._cursor: Optional[int] = None
+        self._last_sent: Dict[str, float] = {}
+        self._held: Dict[str, Outgoing] = {}
+        self._fields: Dict[str, float] = {}
+        self._devices: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.passed = 0
+        self.deferred = 0
+        self.released = 0
+
+    def configure(self, fields: Optional[Dict[str, float]] = None,
+                  devices: Optional[Dict[str, float]] = None) -> None:
+        with self._lock:
+            self._fields = {k: float(v) for k, v in (fields or {}).items() if v}
+            self._devices = {k: float(v) for k, v in (devices or {}).items() if v}
 
+    @property
+    def enabled(self) -> bool:
+        return bool(self._fields or self._devices)
+
+    def interval(self, device_id: str, field: str) -> float:
+        iv = self._devices.get(device_id)
+        return iv if iv is not None else self._fields.get(field, 0.0)
+
+    def admit(self, name: str, device_id: str, field: str, item: Outgoing) -> bool:
+        """True → sofort senden. False → gehalten (bzw. älteren gehaltenen Wert ersetzt)."""
+        iv = self.interval(device_id, field)
+        if iv <= 0:
+            return True
+        with self._lock:
+            now = self._clock()
+            if name in self._held:
+                self._held[name] = item
+                self.deferred += 1
+                return False
+            last = self._last_sent.get(name)
+            if last is None or now - last >= iv:
+                self._last_sent[name] = now
+                self.passed += 1
+                return True
+            self._held[name] = item
+            self.deferred += 1
+            self._schedule(name, last + iv, now)
+        self._ensure_thread()
+        return False
+
+    def _schedule(self, name: str, due: float, now: float) -> None:
+        if self._cursor is None:
+            self._cursor = int(now / self._tick)
+        due_tick = math.ceil(due / self._tick)
+        self._wheel[due_tick % len(self._wheel)][name] = due_tick
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """Dreht das Rad bis ``now`` weiter und stellt fällige Werte zu. Gibt deren Anzahl zurück."""
+        out: List[Outgoing] = []
+        with self._lock:
+            if self._cursor is None:
+                return 0
+            now = self._clock() if now is None else now
+            current = int(now / self._tick)
+            steps = min(current - self._cursor, len(self._wheel))
+            for step in range(1, steps + 1):
+                slot = self._wheel[(self._cursor + step) % len(self._wheel)]
+                for name, due_tick in list(slot.items()):
+                    if due_tick <= current:
+                        del slot[name]
+                        item = self._held.pop(name, None)
+                        if item is not None:
+                            self._last_sent[name] = now
+                            out.append(item)
+            self._cursor = max(self._cursor, current)
+            self.released += len(out)
+        if out:
+            self._deliver(out)
+        return len(out)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="loxone-ratelimit", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._tick):
+            try:
+                self.advance()
+            except Exception as e:
+                log.warning("Loxone Rate-Limiter: Zustellung fehlgeschlagen: %s", e)
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=1)
+
+    def held(self) -> int:
+        return len(self._held)
+
+
+def _send_to_sinks(by_sink: Dict[PushSink, List[str]], values: Dict[str, Any]) -> None:
+    """Sendet je Senke und merkt danach die Werte im ChangeFilter vor – nur die, die
+    alle ihre Senken erreicht haben."""
+    failed: Set[str] = set()
+    for sink, lines in by_sink.items():
+        packets = sink.sender.send_lines(lines)
+        if not packets:
+            failed.update(_line_name(line) for line in lines)
+        log.debug("Push → %s | %d Werte in %d Paket(en)", sink.sender.label, len(lines), packets)
+    for name, value in values.items():
+        if name not in failed:
+            _change_filter.record(name, value)
+
+
+def _deliver_held(items: List[Outgoing]) -> None:
+    by_sink: Dict[PushSink, List[str]] = {}
+    values: Dict[str, Any] = {}
+    for targets, name, value, line in items:
+        values[name] = value
+        for sink in targets:
+            by_sink.setdefault(sink, []).append(line)
+    _send_to_sinks(by_sink, values)
+
+
+_rate_limiter = RateLimiter(_deliver_held)
+
+
+class ResyncJob:
+    """Überträgt den kompletten aktuellen Kanalzustand aller Geräte an alle Senken.
+
+    Nach einem Miniserver-Neustart stehen dessen virtuelle Eingänge auf 0, bis jedes Gerät
+    zufällig ein Event sendet; ein Resync füllt sie sofort. Die Pakete gehen gedrosselt
+    (``packets_per_s``) raus, damit der Miniserver nicht überrollt wird. Auslöser: ``trigger``
+    (API, neuer Snapshot nach (Re-)Connect) oder zyklisch alle ``interval_s`` Sekunden.
+    Mehrere Anforderungen während eines Laufs werden zu einem Folgelauf zusammengefasst.
+    """
+
+    def __init__(self, source: Optional[Callable[[], Optional[Dict[str, Any]]]] = None,
+                 packets_per_s: float = 20.0, interval_s: float = 0.0,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        self._source = source
+        self._rate = packets_per_s
+        self._interval = interval_s
+        self.on_snapshot = True
+        self._sleep = sleep
+        self._cond = threading.Condition()
+        self._requested: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.in_progress = False
+        self.runs = 0
+        self.values = 0
+        self.packets = 0
+        self.last_reason: Optional[str] = None
+        self.last_duration_ms: Optional[int] = None
+
+    def configure(self, packets_per_s: float = 20.0, interval_s: float = 0.0, on_snapshot: bool = True) -> None:
+        with self._cond:
+            self._rate = packets_per_s
+            self._interval = interval_s
+            self.on_snapshot = on_snapshot
+            self._cond.notify_all()
+
+    def trigger(self, reason: str) -> bool:
+        """Fordert einen Resync an. False, wenn bereits einer angefordert ist (wird zusammengefasst)."""
+        with self._cond:
+            if self._requested is not None:
+                return False
+            self._requested = reason
+            self._cond.notify_all()
+            return True
+
+    def start(self, source: Callable[[], Optional[Dict[str, Any]]]) -> None:
+        self._source = source
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="loxone-resync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self) -> None:
+        next_due = time.monotonic() + self._interval
+        while True:
+            with self._cond:
+                while self._running and self._requested is None:
+                    if self._interval <= 0:
+                        self._cond.wait()
+                        next_due = time.monotonic() + self._interval
+                        continue
+                    remaining = next_due - time.monotonic()
+                    if remaining <= 0:
+                        self._requested = "schedule"
+                        break
+                    self._cond.wait(remaining)
+                if not self._running:
+                    return
+                reason, self._requested = self._requested, None
+            try:
+                self.run_once(reason)
+            except Exception:
+                log.exception("Loxone-Resync fehlgeschlagen")
+            next_due = time.monotonic() + self._interval
+
+    def run_once(self, reason: str = "manual", sinks: Optional[List[PushSink]] = None) -> int:
+        """Führt einen Resync synchron aus. Gibt die Anzahl übertragener Werte zurück."""
+        sinks = _sinks if sinks is None else sinks
+        devices = self._source() if self._source is not None else None
+        if not sinks or not devices:
+            return 0
+        started = time.monotonic()
+        self.in_progress = True
+        try:
+            by_sink: Dict[PushSink, List[str]] = {}
+            values: Dict[str, Any] = {}
+            count = 0
+            for dev_id, dev in sorted(devices.items()):
+                if not isinstance(dev, dict):
+                    continue
+                for ch_idx, ch_state in (dev.get("functionalChannels") or {}).items():
+                    if not isinstance(ch_state, dict):
+                        continue
+                    for name, field, value in channel_values(dev_id, ch_idx, ch_state):
+                        targets = [sink for sink in sinks if sink.matches(dev_id, field)]
+                        if not targets:
+                            continue
+                        values[name] = value
+                        line = f"{name}@{value}\r\n"
+                        count += 1
+                        for sink in targets:
+                            by_sink.setdefault(sink, []).append(line)
+            gap = 1.0 / self._rate if self._rate > 0 else 0.0
+            packets = 0
+            failed: Set[str] = set()
+            for sink, lines in by_sink.items():
+                for chunk in chunk_lines(lines):
+                    if packets and gap:
+                        self._sleep(gap)
+                    if not sink.sender.send_lines(chunk):
+                        failed.update(_line_name(line) for line in chunk)
+                    packets += 1
+            for name, value in values.items():
+                if name not in failed:
+                    _change_filter.record(name, value)
+        finally:
+            self.in_progress = False
+        self.runs += 1
+        self.values += count
+        self.packets += packets
+        self.last_reason = reason
+        self.last_duration_ms = int((time.monotonic() - started) * 1000)
+        log.info("Loxone-Resync (%s): %d Werte in %d Paket(en) an %d Ziel(e), %d ms",
+                 reason, count, packets, len(by_sink), self.last_duration_ms)
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs":             self.runs,
+            "values":           self.values,
+            "packets":          self.packets,
+            "in_progress":      self.in_progress,
+            "requested":        self._requested,
+            "last_reason":      self.last_reason,
+            "last_duration_ms": self.last_duration_ms,
+            "interval_s":       self._interval,
+            "packets_per_s":    self._rate,
+        }
+
+
+_resync = ResyncJob()
+
+
+def start_resync(source: Callable[[], Optional[Dict[str, Any]]]) -> None:
+    """Startet den Resync-Thread; source liefert das aktuelle devices-Dict (oder None)."""
+    _resync.start(source)
+
+
+def stop_resync() -> None:
+    _resync.stop()
+
+
+def trigger_resync(reason: str) -> bool:
+    """Fordert einen vollständigen Zustandsabgleich an (nicht blockierend).
+
+    Bei ``reason == "snapshot"`` nur, wenn ``resync_on_snapshot`` aktiv ist.
+    """
+    if not _sinks or (reason == "snapshot" and not _resync.on_snapshot):
+        return False
+    return _resync.trigger(reason)
+
+# Konfigurierte Push-Ziele (configure_push); Liste wird nur ersetzt, nie verändert
+_sinks: List[PushSink] = []
+
+
+def configure_push(loxone_cfg: Optional[Dict[str, Any]]) -> None:
+    """Übernimmt Ziele, change_only/deadbands/min_interval_s aus der ``loxone``-Sektion der config.yaml."""
+    global _sinks
+    cfg = loxone_cfg or {}
+    _sinks = build_sinks(cfg)
+    _change_filter.configure(enabled=cfg.get("change_only", True), deadbands=cfg.get("deadbands"))
+    intervals = cfg.get("min_interval_s") or {}
+    _rate_limiter.configure(fields=intervals.get("fields"), devices=intervals.get("devices"))
+    _resync.configure(
+        packets_per_s=float(cfg.get("resync_packets_per_s", 20)),
+        interval_s=float(cfg.get("resync_interval_min") or 0) * 60,
+        on_snapshot=bool(cfg.get("resync_on_snapshot", True)),
+    )
+
+
+def push_stats() -> Dict[str, Any]:
+    """Zähler des Loxone-Pushs (gesendete/unterdrückte/gedrosselte Werte, Datagramme, Fehler)."""
+    senders = list(_senders.values())
+    return {
+        "values_sent":       _change_filter.sent,
+        "values_suppressed": _change_filter.suppressed,
+        "values_deferred":   _rate_limiter.deferred,
+        "values_held":       _rate_limiter.held(),
+        "datagrams":         sum(s.datagrams for s in senders),
+        "errors":            sum(s.errors for s in senders),
+        "resolve_errors":    sum(s.resolve_errors for s in senders),
+        "sinks":             [sink.sender.stats() for sink in _sinks],
+        "resync":            _resync.stats(),
+    }
+
+
+def channel_values(device_id: str, channel_index: Union[str, int],
+                   channel: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    """(Variablenname, Feld, Loxone-Wert) für alle relevanten Werte eines functionalChannel."""
+    prefix = f"hmip_{device_id}_ch{channel_index}"
+    out = []
     for key, val in channel.items():
         if key in _BOOL_FIELDS and isinstance(val, bool):
-            lines.append(f"{prefix}_{key}@{1 if val else 0}\r\n")
+            out.append((f"{prefix}_{key}", key, 1 if val else 0))
         elif key in _NUMERIC_FIELDS and isinstance(val, (int, float)):
-            lines.append(f"{prefix}_{key}@{val}\r\n")
+            out.append((f"{prefix}_{key}", key, val))
         elif key in _STRING_FIELDS and isinstance(val, str):
             # Loxone Virtual Input akzeptiert Text – nützlich als Triggerwert
-            lines.append(f"{prefix}_{key}@{val}\r\n")
+            out.append((f"{prefix}_{key}", key, val))
+    return out
+
+
+def channel_lines(device_id: str, channel_index: Union[str, int], channel: Dict[str, Any],
+                  only_changed: bool = False) -> List[str]:
+    """Formatiert die Werte eines functionalChannel als Loxone-UDP-Zeilen.
+
+    only_changed: nur Werte, die den ChangeFilter passieren (geänderte, außerhalb des Totbands).
+    """
+    return [f"{name}@{value}\r\n" for name, field, value in channel_values(device_id, channel_index, channel)
+            if not only_changed or _change_filter.changed(name, field, value)]
+
+
+def _collect(sinks: List[PushSink], device_id: str, channel_index: Union[str, int],
+             channel: Dict[str, Any], out: Dict[PushSink, List[str]], values: Dict[str, Any]) -> None:
+    """Verteilt die jetzt fälligen Zeilen eines Kanals auf die passenden Senken.
 
-    if not lines:
+    Jede Zeile wird einmal formatiert und von allen Senken geteilt; ChangeFilter und
+    RateLimiter entscheiden einmal je Variable, nicht je Senke. ``values`` sammelt die
+    gesendeten Werte für den ChangeFilter (Eintrag erst nach dem Senden).
+    """
+    for name, field, value in channel_values(device_id, channel_index, channel):
+        targets = tuple(sink for sink in sinks if sink.matches(device_id, field))
+        if not targets or (name in values and values[name] == value):
+            continue
+        if not _change_filter.changed(name, field, value):
+            continue
+        line = f"{name}@{value}\r\n"
+        if _rate_limiter.admit(name, device_id, field, (targets, name, value, line)):
+            values[name] = value
+            for sink in targets:
+                out.setdefault(sink, []).append(line)
+
+
+_direct_sinks: Dict[Tuple[str, int], PushSink] = {}
+
+
+def _direct_sink(host: str, port: int) -> PushSink:
+    """Ungefilterte UDP-Senke für Aufrufe mit explizitem Ziel (host, port)."""
+    sender = get_sender(host, port)
+    sink = _direct_sinks.get((host, int(port)))
+    if sink is None or sink.sender is not sender:
+        sink = _direct_sinks[(host, int(port))] = PushSink(sender)
+    return sink
+
+
+def push_channel_state(host: str, port: int, device_id: str, channel_index: Union[str, int], channel: Dict[str, Any]) -> None:
+    """Sendet alle relevanten Werte eines functionalChannel per UDP an Loxone."""
+    if not host or not channel:
         return
+    out: Dict[PushSink, List[str]] = {}
+    values: Dict[str, Any] = {}
+    _collect([_direct_sink(host, port)], device_id, channel_index, channel, out, values)
+    _send_to_sinks(out, values)
 
-    payload = "".join(lines).encode("utf-8")
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            sock.sendto(payload, (host, int(port)))
-        log.debug("UDP → Loxone %s:%s | %s | %d Werte", host, port, device_id, len(lines))
-    except Exception as e:
-        log.warning("UDP Push zu Loxone fehlgeschlagen (%s:%s): %s", host, port, e)
 
+def push_event(msg_data: Dict[str, Any], sinks: Optional[List[PushSink]] = None) -> None:
+    """Extrahiert alle Device-Channels aus einem HMIP_SYSTEM_EVENT und pushed sie an die Senken.
 
-def push_event_devices(host: str, port: int, msg_data: Dict[str, Any]) -> None:
-    """Extrahiert alle Device-Channels aus einem HMIP_SYSTEM_EVENT und pushed sie."""
-    if not host:
+    Ohne ``sinks`` gehen die Werte an die konfigurierten Ziele (``configure_push``). Alle Zeilen
+    einer eventTransaction gehen je Senke gebündelt in möglichst wenigen Paketen raus;
+    unveränderte Werte und Änderungen innerhalb des Totbands werden nicht gesendet, gedrosselte
+    Variablen (``min_interval_s``) kommen am Ende ihres Intervalls mit dem letzten Wert nach.
+    """
+    sinks = _sinks if sinks is None else sinks
+    if not sinks:
         return
 
     tx = (msg_data.get("body") or {}).get("eventTransaction") or {}
     events = tx.get("events") or {}
 
+    out: Dict[PushSink, List[str]] = {}
+    values: Dict[str, Any] = {}
     for _, ev in sorted(events.items(), key=lambda kv: kv[0]):
         if not isinstance(ev, dict):
             continue
@@ -83,4 +881,111 @@ def push_event_devices(host: str, port: int, msg_data: Dict[str, Any]) -> None:
         channels = dev.get("functionalChannels") or {}
         for ch_idx, ch_state in channels.items():
             if isinstance(ch_state, dict):
-                push_channel_state(host, port, dev_id, ch_idx, ch_state)
+                _collect(sinks, dev_id, ch_idx, ch_state, out, values)
+
+    _send_to_sinks(out, values)
+
+
+def push_event_devices(host: str, port: int, msg_data: Dict[str, Any]) -> None:
+    """Wie ``push_event``, aber an genau ein UDP-Ziel (host, port)."""
+    if host:
+        push_event(msg_data, [_direct_sink(host, port)])
+
+
+class PushWorker:
+    """Eigener Thread für den Loxone-Push, damit die HCU-Eventverarbeitung nie auf UDP/DNS wartet.
+
+    ``submit`` stellt nur ein und kehrt sofort zurück. Ist die Schlange voll, wird das
+    älteste Event verworfen (gezählt) – neuere Werte sind für Loxone wichtiger. Im Leerlauf
+    erneuert der Worker die aufgelösten Zieladressen alle ``resolve_interval_s`` Sekunden.
+    """
+
+    def __init__(self, maxsize: int = 1000, resolve_interval_s: float = _RESOLVE_INTERVAL_S) -> None:
+        self._items: deque = deque()
+        self._maxsize = max(1, int(maxsize))
+        self._cond = threading.Condition()
+        self._resolve_interval = float(resolve_interval_s)
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._last_drop_log = 0.0
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self._last_latency_ms = 0.0
+        self._max_latency_ms = 0.0
+
+    def submit(self, msg_data: Dict[str, Any]) -> bool:
+        """Stellt ein HMIP_SYSTEM_EVENT für den Push ein. False, wenn dafür ein älteres verworfen wurde."""
+        if not _sinks:
+            return True
+        dropped = False
+        with self._cond:
+            if len(self._items) >= self._maxsize:
+                self._items.popleft()
+                self.dropped += 1
+                dropped = True
+            self._items.append((time.monotonic(), msg_data))
+            self.submitted += 1
+            self._cond.notify()
+        if dropped and time.monotonic() - self._last_drop_log > 10:
+            self._last_drop_log = time.monotonic()
+            log.warning("Loxone-Push-Warteschlange voll (%d) – älteste Events verworfen (gesamt %d)",
+                        self._maxsize, self.dropped)
+        return not dropped
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="loxone-push", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+
+    def _next(self, timeout: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._cond:
+            if not self._items and self._running:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def _run(self) -> None:
+        next_refresh = 0.0
+        while self._running or self._items:
+            now = time.monotonic()
+            if now >= next_refresh:
+                refresh_addresses(self._resolve_interval)
+                next_refresh = now + min(self._resolve_interval, 60.0)
+            item = self._next(timeout=max(0.0, next_refresh - now))
+            if item is None:
+                continue
+            enqueued_at, msg_data = item
+            try:
+                push_event(msg_data)
+            except Exception:
+                log.exception("Loxone-Push fehlgeschlagen")
+            latency_ms = (time.monotonic() - enqueued_at) * 1000
+            with self._cond:
+                self.processed += 1
+                self._last_latency_ms = latency_ms
+                if latency_ms > self._max_latency_ms:
+                    self._max_latency_ms = latency_ms
+
+    def depth(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "depth":          len(self._items),
+                "submitted":      self.submitted,
+                "processed":      self.processed,
+                "dropped":        self.dropped,
+                "last_latency_ms": round(self._last_latency_ms, 1),
+                "max_latency_ms": round(self._max_latency_ms, 1),
+            }
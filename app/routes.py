@@ -5,10 +5,13 @@ import colorsys
 import json
 import logging
 import os
+import threading
 import time
-from typing import Any, Dict, Optional
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from flask import Blueprint, jsonify, redirect, render_template, request, session
+from flask import (Blueprint, Response, g, jsonify, redirect, render_template, request,
+                   session, stream_with_context)
 from werkzeug.security import check_password_hash
 
 import app.state as state
@@ -22,8 +25,13 @@ from app.adapters.hmip_messages import (send_hmip_set_alarm_signal_acoustic,
                                         send_hmip_set_hue_saturation_dim_level,
                                         send_hmip_set_point_temperature,
                                         send_hmip_set_switch)
+from app.adapters.hmip_commands import apply_optimistic, commands_unavailable, send_command
 from app.adapters.hmip_websocket import _register_pending
-from app.utils import _find_device_in_list, _locate_devices_container
+from app.adapters.hmip_writer import BatchSink, SendQueueFull
+from app.adapters.hmip_store import SystemView
+from app.change_feed import get_change_feed
+from app.loxone_udp import configure_push, push_stats, trigger_resync
+from app.utils import get_state_store, get_system_view
 
 bp = Blueprint("bridge", __name__)
 log = logging.getLogger("bridge-ws")
@@ -31,26 +39,114 @@ log = logging.getLogger("bridge-ws")
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
-def _load_snapshot() -> Optional[Dict[str, Any]]:
-    try:
-        with open(state.config_internal["system_state_path"], "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
+def _load_view() -> Optional[SystemView]:
+    return get_system_view()
+
+
+def _devices_count_from_view(view: Optional[SystemView]) -> int:
+    return len(view.devices) if view is not None else 0
+
+
+def _not_modified(etag: str) -> Optional[Response]:
+    """304-Antwort, wenn der Client die Ressource mit diesem ETag schon hat (sonst None)."""
+    if not request.if_none_match.contains_weak(etag):
         return None
+    resp = Response(status=304)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def _with_etag(payload: Any, etag: str) -> Response:
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+def _ws_unavailable() -> Optional[tuple]:
+    """503-Antwort, solange keine Befehle angenommen werden können (sonst None)."""
+    reason = commands_unavailable()
+    if reason:
+        return jsonify({"error": reason}), 503
+    return None
+
+
+@bp.errorhandler(SendQueueFull)
+def _send_queue_full(e: SendQueueFull):
+    """Befehl passte nicht mehr in die Sendewarteschlange – 503 wie bei /hmipBatch."""
+    return jsonify({"error": str(e) or "Sendewarteschlange voll"}), 503
+
+
+_ACK_WAIT_MAX_MS = 10000
+
+
+def _parse_ack_wait() -> Tuple[Optional[float], Optional[tuple]]:
+    """Liest ``?wait=<ms>`` (synchron auf das HCU-ACK warten). Gibt (ms|None, Fehlerantwort|None)."""
+    raw = request.args.get("wait")
+    if raw is None:
+        return None, None
+    try:
+        wait_ms = float(raw)
+    except ValueError:
+        return None, (jsonify({"error": "wait muss eine Zahl (ms) sein"}), 400)
+    return max(0.0, min(wait_ms, _ACK_WAIT_MAX_MS)), None
+
+
+def _send_command(send_fn: Callable[..., str], path: str, *args: Any,
+                  wait: bool = False) -> Tuple[str, Optional[Future]]:
+    """``send_command`` für Routen: merkt zusätzlich die Store-Revision vor dem ersten
+    Befehl des Requests in ``g.command_revision`` (Konsistenz-Token für
+    ``/hmipState?min_revision=``). Volle Schlange → ``SendQueueFull`` (→ 503).
+    """
+    _note_command_revision()
+    return send_command(send_fn, path, *args, wait=wait)
+
 
+def _note_command_revision() -> None:
+    if "command_revision" not in g:
+        g.command_revision = get_state_store().revision()
 
-def _devices_count_from_snapshot(snap: Optional[Dict[str, Any]]) -> int:
-    if not isinstance(snap, dict):
-        return 0
-    devs, _ = _locate_devices_container(snap)
-    if isinstance(devs, dict):
-        return len(devs)
-    if isinstance(devs, list):
-        return sum(1 for x in devs if isinstance(x, dict))
-    return 0
+
+def _await_ack(future: Optional[Future], deadline: float) -> Dict[str, Any]:
+    """Wartet bis ``deadline`` (monotonic) auf das ACK und liefert die Felder für die Antwort."""
+    if future is None:
+        return {"ack": "unknown"}
+    try:
+        result = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        return {"ack": "timeout"}
+    if result.get("error"):
+        return {"ack": result["error"], "code": None, "latency_ms": result["latency_ms"]}
+    ack = "ok" if result.get("code") == 200 else "error"
+    return {"ack": ack, "code": result.get("code"), "latency_ms": result["latency_ms"]}
+
+
+def _ack_status(acks: List[Dict[str, Any]]) -> int:
+    """HTTP-Status für ?wait: 200 alle bestätigt, 502 HCU-Fehler, 202 noch unbestätigt."""
+    if any(a["ack"] in {"error", "expired", "disconnected"} for a in acks):
+        return 502
+    if any(a["ack"] != "ok" for a in acks):
+        return 202
+    return 200
+
+
+def _command_response(payload: Dict[str, Any], future: Optional[Future],
+                      wait_ms: Optional[float]) -> tuple:
+    """Antwort eines Steuer-Endpunkts; mit ?wait inklusive HCU-Code und Latenz."""
+    payload["revision"] = g.get("command_revision")
+    if wait_ms is None:
+        return jsonify(payload), 200
+    ack = _await_ack(future, time.monotonic() + wait_ms / 1000.0)
+    payload.update(ack)
+    return jsonify(payload), _ack_status([ack])
 
 
 def _snapshot_age_ms(path: str) -> Optional[int]:
+    # Letzte Änderung im Store; vor dem ersten Event zählt die Datei vom Warmstart
+    age = get_state_store().age_ms()
+    if age is not None:
+        return age
     try:
         return int((time.time() - os.path.getmtime(path)) * 1000)
     except Exception:
@@ -94,31 +190,31 @@ def logout():
 @bp.route("/")
 @require_web_auth
 def serve_dashboard():
-    return render_template("dashboard.html", **prepare_dashboard(state.config_internal["system_state_path"]))
+    return render_template("dashboard.html", **prepare_dashboard(_load_view()))
 
 
 @bp.route("/heating")
 @require_web_auth
 def serve_heating():
-    return render_template("heating.html", **prepare_heating(state.config_internal["system_state_path"]))
+    return render_template("heating.html", **prepare_heating(_load_view()))
 
 
 @bp.route("/devices/html")
 @require_web_auth
 def serve_html_overview():
-    return render_template("devices.html", **prepare_device_overview(state.config_internal["system_state_path"]))
+    return render_template("devices.html", **prepare_device_overview(_load_view()))
 
 
 @bp.route("/devices/status")
 @require_web_auth
 def serve_device_status():
-    return render_template("status.html", **prepare_device_status(state.config_internal["system_state_path"]))
+    return render_template("status.html", **prepare_device_status(_load_view()))
 
 
 @bp.route("/devices/<device_id>")
 @require_web_auth
 def serve_device_detail(device_id):
-    return render_template("device_detail.html", **prepare_device_detail(state.config_internal["system_state_path"], device_id))
+    return render_template("device_detail.html", **prepare_device_detail(_load_view(), device_id))
 
 
 # ── API: Switch ───────────────────────────────────────────────────────────────
@@ -126,18 +222,22 @@ def serve_device_detail(device_id):
 @bp.post("/hmipSwitch")
 @require_api_key
 def hmip_switch_post():
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
     data = request.get_json(silent=True, force=True) or {}
     device_id     = data.get("device")
     on            = data.get("on")
     channel_index = data.get("channelIndex", 0)
     if not device_id or not isinstance(on, bool):
         return jsonify({"error": "Ungültige Parameter: device (str), on (bool), optional channelIndex (int)"}), 400
-    with state.send_lock:
-        rid = send_hmip_set_switch(state.conn, device_id, on, channel_index)
-    _register_pending(rid, "/hmip/device/control/setSwitchState")
-    return jsonify({"status": f"{device_id}: {'ON' if on else 'OFF'}", "request_id": rid}), 200
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    rid, future = _send_command(send_hmip_set_switch, "/hmip/device/control/setSwitchState",
+                                device_id, on, channel_index, wait=wait_ms is not None)
+    return _command_response({"status": f"{device_id}: {'ON' if on else 'OFF'}", "request_id": rid},
+                             future, wait_ms)
 
 
 @bp.get("/hmipSwitch")
@@ -148,8 +248,9 @@ def hmip_switch_get():
             return jsonify({"error": "Nur lokal erlaubt oder X-API-Key erforderlich"}), 403
         if request.headers.get("X-API-Key") != state.API_KEY:
             return jsonify({"error": "unauthorized"}), 401
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
     device_id = request.args.get("device")
     on_param  = request.args.get("on")
     try:
@@ -159,10 +260,13 @@ def hmip_switch_get():
     if not device_id or on_param not in {"true", "false"}:
         return jsonify({"error": "Ungültige Parameter"}), 400
     on = on_param == "true"
-    with state.send_lock:
-        rid = send_hmip_set_switch(state.conn, device_id, on, channel_index)
-    _register_pending(rid, "/hmip/device/control/setSwitchState")
-    return jsonify({"status": f"{device_id}: {'ON' if on else 'OFF'}", "request_id": rid}), 200
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    rid, future = _send_command(send_hmip_set_switch, "/hmip/device/control/setSwitchState",
+                                device_id, on, channel_index, wait=wait_ms is not None)
+    return _command_response({"status": f"{device_id}: {'ON' if on else 'OFF'}", "request_id": rid},
+                             future, wait_ms)
 
 
 # ── API: Dimmer ───────────────────────────────────────────────────────────────
@@ -170,8 +274,9 @@ def hmip_switch_get():
 @bp.post("/hmipDimmer")
 @require_api_key
 def hmip_dimmer_post():
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
     data = request.get_json(silent=True, force=True) or {}
     device_id     = data.get("device")
     dim_level     = data.get("dimLevel")
@@ -184,19 +289,36 @@ def hmip_dimmer_post():
         return jsonify({"error": "dimLevel muss eine Zahl sein"}), 400
     if not 0 <= dim_level <= 100:
         return jsonify({"error": "dimLevel muss zwischen 0 und 100 liegen"}), 400
-    with state.send_lock:
-        rid = send_hmip_set_dim_level(state.conn, device_id, round(dim_level / 100.0, 2), channel_index)
-    _register_pending(rid, "/hmip/device/control/setDimLevel")
-    return jsonify({"status": f"{device_id}: dimLevel={dim_level}%", "request_id": rid}), 200
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    rid, future = _send_command(send_hmip_set_dim_level, "/hmip/device/control/setDimLevel",
+                                device_id, round(dim_level / 100.0, 2), channel_index,
+                                wait=wait_ms is not None)
+    return _command_response({"status": f"{device_id}: dimLevel={dim_level}%", "request_id": rid},
+                             future, wait_ms)
 
 
 # ── API: RGB ──────────────────────────────────────────────────────────────────
 
+def _parse_rgb(rgb_str: str) -> Tuple[float, float, float]:
+    """'R=50%,G=30%,B=100%' → (r, g, b) je 0.0–1.0. Wirft bei ungültigem Format."""
+    parts = {}
+    for part in rgb_str.replace(" ", "").split(","):
+        key, val = part.split("=")
+        parts[key.upper()] = float(val.rstrip("%")) / 100.0
+    r = max(0.0, min(1.0, parts.get("R", 0.0)))
+    g = max(0.0, min(1.0, parts.get("G", 0.0)))
+    b = max(0.0, min(1.0, parts.get("B", 0.0)))
+    return r, g, b
+
+
 @bp.post("/hmipRGB")
 @require_api_key
 def hmip_rgb_post():
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
     data = request.get_json(silent=True, force=True) or {}
     device_id     = data.get("device")
     rgb_str       = data.get("rgb")
@@ -204,25 +326,24 @@ def hmip_rgb_post():
     if not device_id or not rgb_str:
         return jsonify({"error": "Ungültige Parameter: device (str), rgb (str, z.B. 'R=50%,G=30%,B=100%'), optional channelIndex (int, default 1)"}), 400
     try:
-        parts = {}
-        for part in rgb_str.replace(" ", "").split(","):
-            key, val = part.split("=")
-            parts[key.upper()] = float(val.rstrip("%")) / 100.0
-        r = max(0.0, min(1.0, parts.get("R", 0.0)))
-        g = max(0.0, min(1.0, parts.get("G", 0.0)))
-        b = max(0.0, min(1.0, parts.get("B", 0.0)))
+        r, g, b = _parse_rgb(rgb_str)
     except Exception:
         return jsonify({"error": f"Ungültiges RGB-Format. Erwartet: 'R=50%,G=30%,B=100%', erhalten: '{rgb_str}'"}), 400
     h, s, v = colorsys.rgb_to_hsv(r, g, b)
     hue, saturation, dim_level = round(h * 360), round(s, 3), round(v, 3)
-    with state.send_lock:
-        if r == 0.0 and g == 0.0 and b == 0.0:
-            rid = send_hmip_set_switch(state.conn, device_id, False, channel_index)
-            _register_pending(rid, "/hmip/device/control/setSwitchState")
-            return jsonify({"status": f"{device_id}: off", "request_id": rid}), 200
-        rid = send_hmip_set_hue_saturation_dim_level(state.conn, device_id, hue, saturation, dim_level, channel_index)
-    _register_pending(rid, "/hmip/device/control/setHueSaturationDimLevel")
-    return jsonify({"status": f"{device_id}: hue={hue}° sat={saturation} dim={dim_level}", "request_id": rid}), 200
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    if r == 0.0 and g == 0.0 and b == 0.0:
+        rid, future = _send_command(send_hmip_set_switch, "/hmip/device/control/setSwitchState",
+                                    device_id, False, channel_index, wait=wait_ms is not None)
+        return _command_response({"status": f"{device_id}: off", "request_id": rid}, future, wait_ms)
+    rid, future = _send_command(send_hmip_set_hue_saturation_dim_level,
+                                "/hmip/device/control/setHueSaturationDimLevel",
+                                device_id, hue, saturation, dim_level, channel_index,
+                                wait=wait_ms is not None)
+    return _command_response({"status": f"{device_id}: hue={hue}° sat={saturation} dim={dim_level}",
+                              "request_id": rid}, future, wait_ms)
 
 
 # ── API: Alarm (Rauchmelder als Sirene) ───────────────────────────────────────
@@ -230,16 +351,10 @@ def hmip_rgb_post():
 _VALID_ALARM_SIGNALS = {"FULL_ALARM", "INTRUSION_ALARM", "PRE_ALARM", "NO_ALARM"}
 
 
-def _find_alarm_siren_devices(snap: Dict[str, Any]) -> list:
+def _find_alarm_siren_devices(view: SystemView) -> list:
     """Gibt Liste von (device_id, channel_index) für alle Geräte mit ALARM_SIREN_CHANNEL zurück."""
     result = []
-    devices_container, _ = _locate_devices_container(snap)
-    devs = {}
-    if isinstance(devices_container, dict):
-        devs = devices_container
-    elif isinstance(devices_container, list):
-        devs = {d.get("id", ""): d for d in devices_container if isinstance(d, dict)}
-    for dev_id, dev in devs.items():
+    for dev_id, dev in view.devices.items():
         if not isinstance(dev, dict):
             continue
         for ch_idx, ch in (dev.get("functionalChannels") or {}).items():
@@ -260,8 +375,9 @@ def hmip_alarm_post():
       device       (str)  – optional – Device-ID; fehlt → alle Geräte mit ALARM_SIREN_CHANNEL
       channelIndex (int)  – optional – Standard: automatisch aus Snapshot
     """
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
 
     data = request.get_json(silent=True, force=True) or {}
     mode         = str(data.get("mode", "")).lower()
@@ -283,10 +399,10 @@ def hmip_alarm_post():
     # Zielgeräte bestimmen
     if device_id:
         # Einzelnes Gerät – channel_index aus Snapshot ableiten oder Override nutzen
-        snap = _load_snapshot()
+        view = _load_view()
         ch_idx = channel_override
-        if ch_idx is None and snap:
-            for _did, _cidx in _find_alarm_siren_devices(snap):
+        if ch_idx is None and view:
+            for _did, _cidx in _find_alarm_siren_devices(view):
                 if _did == device_id:
                     ch_idx = _cidx
                     break
@@ -295,27 +411,41 @@ def hmip_alarm_post():
         targets = [(device_id, int(ch_idx))]
     else:
         # Alle Rauchmelder / Sirenen im Snapshot
-        snap = _load_snapshot()
-        if snap is None:
+        view = _load_view()
+        if view is None:
             return jsonify({"error": "Kein Snapshot vorhanden – Gerätliste unbekannt"}), 503
-        targets = _find_alarm_siren_devices(snap)
+        targets = _find_alarm_siren_devices(view)
         if not targets:
             return jsonify({"error": "Keine Geräte mit ALARM_SIREN_CHANNEL im Snapshot gefunden"}), 404
 
-    sent = []
-    with state.send_lock:
-        for did, cidx in targets:
-            if mode in {"optical", "both", "off"}:
-                rid = send_hmip_set_alarm_signal_optical(state.conn, did, signal, cidx)
-                _register_pending(rid, "/hmip/device/control/setAlarmSignalOptical")
-                sent.append({"device": did, "type": "optical", "request_id": rid})
-            if mode in {"acoustic", "both", "off"}:
-                rid = send_hmip_set_alarm_signal_acoustic(state.conn, did, signal, cidx)
-                _register_pending(rid, "/hmip/device/control/setAlarmSignalAcoustic")
-                sent.append({"device": did, "type": "acoustic", "request_id": rid})
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    wait = wait_ms is not None
+    sent, futures = [], []
+    for did, cidx in targets:
+        if mode in {"optical", "both", "off"}:
+            rid, future = _send_command(send_hmip_set_alarm_signal_optical,
+                                        "/hmip/device/control/setAlarmSignalOptical",
+                                        did, signal, cidx, wait=wait)
+            sent.append({"device": did, "type": "optical", "request_id": rid})
+            futures.append(future)
+        if mode in {"acoustic", "both", "off"}:
+            rid, future = _send_command(send_hmip_set_alarm_signal_acoustic,
+                                        "/hmip/device/control/setAlarmSignalAcoustic",
+                                        did, signal, cidx, wait=wait)
+            sent.append({"device": did, "type": "acoustic", "request_id": rid})
+            futures.append(future)
 
     log.info("Alarm %s / %s → %d Gerät(e)", mode, signal, len(targets))
-    return jsonify({"status": "ok", "mode": mode, "signal": signal, "sent": sent}), 200
+    result = {"status": "ok", "mode": mode, "signal": signal, "sent": sent,
+              "revision": g.get("command_revision")}
+    if not wait:
+        return jsonify(result), 200
+    deadline = time.monotonic() + wait_ms / 1000.0
+    for item, future in zip(sent, futures):
+        item.update(_await_ack(future, deadline))
+    return jsonify(result), _ack_status(sent)
 
 
 # ── API: Thermostat ────────────────────────────────────────────────────────────
@@ -330,8 +460,9 @@ def hmip_thermostat_post():
       temperature   (float) – Zieltemperatur in °C (4.5–30.5)
       channelIndex  (int)   – optional, Standard: 1
     """
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
 
     data = request.get_json(silent=True, force=True) or {}
     device_id     = data.get("device")
@@ -347,10 +478,13 @@ def hmip_thermostat_post():
     if not 4.5 <= temperature <= 30.5:
         return jsonify({"error": "temperature muss zwischen 4.5 und 30.5 °C liegen"}), 400
 
-    with state.send_lock:
-        rid = send_hmip_set_point_temperature(state.conn, device_id, temperature, int(channel_index))
-    _register_pending(rid, "/hmip/device/control/setSetPointTemperature")
-    return jsonify({"status": f"{device_id}: setpoint={temperature:.1f}°C", "request_id": rid}), 200
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    rid, future = _send_command(send_hmip_set_point_temperature, "/hmip/device/control/setSetPointTemperature",
+                                device_id, temperature, int(channel_index), wait=wait_ms is not None)
+    return _command_response({"status": f"{device_id}: setpoint={temperature:.1f}°C", "request_id": rid},
+                             future, wait_ms)
 
 
 # ── API: Bewässerung ───────────────────────────────────────────────────────────
@@ -365,8 +499,9 @@ def hmip_irrigation_post():
       on            (bool) – true = Ventil öffnen, false = schließen
       channelIndex  (int)  – optional, Standard: 1
     """
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
 
     data = request.get_json(silent=True, force=True) or {}
     device_id     = data.get("device")
@@ -376,13 +511,145 @@ def hmip_irrigation_post():
     if not device_id or not isinstance(on, bool):
         return jsonify({"error": "Pflichtfelder: device (str), on (bool)"}), 400
 
-    with state.send_lock:
-        rid = send_hmip_set_switch(state.conn, device_id, on, int(channel_index))
-    _register_pending(rid, "/hmip/device/control/setSwitchState")
-    return jsonify({
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+    rid, future = _send_command(send_hmip_set_switch, "/hmip/device/control/setSwitchState",
+                                device_id, on, int(channel_index), wait=wait_ms is not None)
+    return _command_response({
         "status": f"{device_id}: {'geöffnet' if on else 'geschlossen'}",
         "request_id": rid,
-    }), 200
+    }, future, wait_ms)
+
+
+# ── API: Batch ────────────────────────────────────────────────────────────────
+
+_BATCH_MAX_OPS = 100
+
+Command = Tuple[Callable[..., str], str, tuple, Dict[str, Any]]
+
+
+def _batch_commands(op: Dict[str, Any]) -> List[Command]:
+    """Übersetzt eine Batch-Operation in (send_fn, path, args, Info)-Tupel. Wirft ValueError."""
+    if not isinstance(op, dict):
+        raise ValueError("Operation muss ein Objekt sein")
+    kind = op.get("op")
+    device_id = op.get("device")
+    if not device_id or not isinstance(device_id, str):
+        raise ValueError("device (str) fehlt")
+
+    if kind == "switch":
+        on = op.get("on")
+        if not isinstance(on, bool):
+            raise ValueError("on (bool) fehlt")
+        return [(send_hmip_set_switch, "/hmip/device/control/setSwitchState",
+                 (device_id, on, int(op.get("channelIndex", 0))), {})]
+
+    if kind == "dim":
+        dim_level = float(op.get("dimLevel"))
+        if not 0 <= dim_level <= 100:
+            raise ValueError("dimLevel muss zwischen 0 und 100 liegen")
+        return [(send_hmip_set_dim_level, "/hmip/device/control/setDimLevel",
+                 (device_id, round(dim_level / 100.0, 2), int(op.get("channelIndex", 1))), {})]
+
+    if kind == "rgb":
+        r, g, b = _parse_rgb(str(op.get("rgb", "")))
+        channel_index = int(op.get("channelIndex", 1))
+        if r == 0.0 and g == 0.0 and b == 0.0:
+            return [(send_hmip_set_switch, "/hmip/device/control/setSwitchState",
+                     (device_id, False, channel_index), {})]
+        h, s, v = colorsys.rgb_to_hsv(r, g, b)
+        return [(send_hmip_set_hue_saturation_dim_level, "/hmip/device/control/setHueSaturationDimLevel",
+                 (device_id, round(h * 360), round(s, 3), round(v, 3), channel_index), {})]
+
+    if kind == "thermostat":
+        temperature = float(op.get("temperature"))
+        if not 4.5 <= temperature <= 30.5:
+            raise ValueError("temperature muss zwischen 4.5 und 30.5 °C liegen")
+        return [(send_hmip_set_point_temperature, "/hmip/device/control/setSetPointTemperature",
+                 (device_id, temperature, int(op.get("channelIndex", 1))), {})]
+
+    if kind == "alarm":
+        mode = str(op.get("mode", "")).lower()
+        if mode not in {"optical", "acoustic", "both", "off"}:
+            raise ValueError("mode muss 'optical', 'acoustic', 'both' oder 'off' sein")
+        signal = op.get("signal", "NO_ALARM" if mode == "off" else "FULL_ALARM")
+        if signal not in _VALID_ALARM_SIGNALS:
+            raise ValueError(f"signal muss eines von {sorted(_VALID_ALARM_SIGNALS)} sein")
+        channel_index = int(op.get("channelIndex", 2))
+        cmds: List[Command] = []
+        if mode in {"optical", "both", "off"}:
+            cmds.append((send_hmip_set_alarm_signal_optical, "/hmip/device/control/setAlarmSignalOptical",
+                         (device_id, signal, channel_index), {"type": "optical"}))
+        if mode in {"acoustic", "both", "off"}:
+            cmds.append((send_hmip_set_alarm_signal_acoustic, "/hmip/device/control/setAlarmSignalAcoustic",
+                         (device_id, signal, channel_index), {"type": "acoustic"}))
+        return cmds
+
+    raise ValueError("op muss switch/dim/rgb/thermostat/alarm sein")
+
+
+@bp.post("/hmipBatch")
+@require_api_key
+def hmip_batch_post():
+    """Mehrere Steuerbefehle in einem Aufruf (z. B. Loxone-Szenen).
+
+    Body: {"operations": [{"op": "switch", "device": "...", "on": true}, ...]} oder direkt die Liste.
+    op: switch | dim | rgb | thermostat | alarm – Felder wie bei den Einzel-Endpunkten.
+    Alle Operationen werden vorab geprüft; ist eine ungültig, wird nichts gesendet (400).
+    Die Nachrichten gehen als ein Paket an den WS-Writer. Optional ?wait=<ms> für ACK-Codes.
+    """
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
+    data = request.get_json(silent=True, force=True)
+    ops = data.get("operations") if isinstance(data, dict) else data
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "operations (Liste) fehlt"}), 400
+    if len(ops) > _BATCH_MAX_OPS:
+        return jsonify({"error": f"Höchstens {_BATCH_MAX_OPS} Operationen pro Batch"}), 400
+    wait_ms, err = _parse_ack_wait()
+    if err:
+        return err
+
+    planned: List[Tuple[int, Dict[str, Any], Command]] = []
+    errors = []
+    for idx, op in enumerate(ops):
+        try:
+            for cmd in _batch_commands(op):
+                planned.append((idx, op, cmd))
+        except (TypeError, ValueError) as e:
+            errors.append({"index": idx, "error": str(e) or "ungültige Parameter"})
+    if errors:
+        return jsonify({"error": "Ungültige Operationen – nichts gesendet", "details": errors}), 400
+
+    wait = wait_ms is not None
+    sink = BatchSink()
+    results, futures = [], []
+    _note_command_revision()
+    with state.pending_lock:
+        for idx, op, (send_fn, path, args, info) in planned:
+            rid = send_fn(sink, *args)
+            futures.append(_register_pending(rid, path, with_future=wait))
+            apply_optimistic(rid, path, args)
+            results.append({"index": idx, "op": op["op"], "device": op["device"], **info, "request_id": rid})
+        try:
+            state.ws_writer.send_batch(sink.messages)
+        except SendQueueFull:
+            store = get_state_store()
+            for item in results:
+                state.pending.pop(item["request_id"], None)
+                store.rollback_optimistic(item["request_id"])
+            return jsonify({"error": "Sendewarteschlange voll"}), 503
+
+    log.info("Batch: %d Operation(en) → %d Nachricht(en) eingestellt", len(ops), len(results))
+    revision = g.command_revision
+    if not wait:
+        return jsonify({"count": len(results), "results": results, "revision": revision}), 200
+    deadline = time.monotonic() + wait_ms / 1000.0
+    for item, future in zip(results, futures):
+        item.update(_await_ack(future, deadline))
+    return jsonify({"count": len(results), "results": results, "revision": revision}), _ack_status(results)
 
 
 # ── API: State ────────────────────────────────────────────────────────────────
@@ -397,22 +664,233 @@ def hmip_state_get():
         channel_index = str(int(request.args.get("channelIndex", "0")))
     except ValueError:
         return jsonify({"error": "channelIndex muss eine Zahl sein"}), 400
-    snap = _load_snapshot()
-    if snap is None:
+    store = get_state_store()
+    min_revision = request.args.get("min_revision")
+    since = request.args.get("since")
+    try:
+        min_rev = int(min_revision) if min_revision is not None else None
+        since_rev = int(since) if since is not None else None
+        # Eine Frist für beide Wartephasen – min_revision+since belegen den Thread nicht doppelt
+        default_s = _MIN_REVISION_DEFAULT_S if min_rev is not None else _LONGPOLL_DEFAULT_S
+        deadline = time.monotonic() + min(float(request.args.get("wait", default_s)), _LONGPOLL_MAX_S)
+    except ValueError:
+        return jsonify({"error": "min_revision/since/wait müssen Zahlen sein"}), 400
+    min_revision_met = None
+    if min_rev is not None:
+        # Read-your-writes: warten, bis die HCU eine Änderung nach dem Token bestätigt hat
+        view = store.view()
+        min_revision_met = (view is not None and device_id in view.devices
+                            and _wait_for_device_revision(store, device_id, min_rev,
+                                                          deadline - time.monotonic(), confirmed=True))
+    if since_rev is not None:
+        view = store.view()
+        if view is not None and device_id in view.devices:
+            _wait_for_device_revision(store, device_id, since_rev, deadline - time.monotonic())
+    view = store.view()
+    if view is None:
         return jsonify({"error": "Kein Snapshot vorhanden"}), 503
-    devices_container, _ = _locate_devices_container(snap)
-    if devices_container is None:
-        return jsonify({"error": "Devices nicht im Snapshot gefunden"}), 503
-    if isinstance(devices_container, dict):
-        device = devices_container.get(device_id)
-    else:
-        device, _ = _find_device_in_list(devices_container, device_id)
+    device = view.devices.get(device_id)
     if device is None:
         return jsonify({"error": f"Device {device_id} nicht gefunden"}), 404
+    rev = store.device_revision(device_id) or store.revision()
+    etag = f"{store.epoch}.{rev}"
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        not_modified.headers["X-Revision"] = str(rev)
+        if min_revision_met is not None:
+            not_modified.headers["X-Min-Revision-Met"] = "true" if min_revision_met else "false"
+        return not_modified
     channel = device.get("functionalChannels", {}).get(channel_index)
     if channel is None:
         return jsonify({"error": f"Channel {channel_index} nicht gefunden"}), 404
-    return jsonify(channel), 200
+    resp = _with_etag(channel, etag)
+    resp.headers["X-Revision"] = str(rev)
+    pending = store.pending_fields(device_id, channel_index)
+    if pending:
+        # Lokal gesetzt, von der HCU noch nicht per Event bestätigt
+        resp.headers["X-Pending"] = ",".join(pending)
+    if min_revision_met is not None:
+        resp.headers["X-Min-Revision-Met"] = "true" if min_revision_met else "false"
+        resp.headers["X-Confirmed-Revision"] = str(store.device_event_revision(device_id) or 0)
+    return resp, 200
+
+
+_LONGPOLL_DEFAULT_S = 30.0
+_LONGPOLL_MAX_S = 60.0
+_MIN_REVISION_DEFAULT_S = 5.0
+# Blockierende Anfragen (Long-Poll/min_revision, /events) teilen sich ein Thread-Budget
+_MIN_RESERVED_THREADS = 2
+_blocking_lock = threading.Lock()
+_blocking_clients: Dict[str, int] = {"longpoll": 0, "sse": 0}
+
+
+def _blocking_budget() -> int:
+    """Threads, die blockierende Anfragen insgesamt belegen dürfen (Rest bleibt für Steuerung frei)."""
+    cfg = state.config_internal
+    reserved = max(_MIN_RESERVED_THREADS, int(cfg.get("http_reserved_threads", _MIN_RESERVED_THREADS)))
+    return max(0, int(cfg.get("http_threads", 8)) - reserved)
+
+
+def _acquire_blocking_slot(kind: str) -> bool:
+    """Belegt einen Platz für eine blockierende Anfrage (``longpoll`` | ``sse``); False, wenn keiner frei ist."""
+    kind_max = int(state.config_internal.get(f"{kind}_max_clients", 4))
+    with _blocking_lock:
+        if _blocking_clients[kind] >= kind_max or sum(_blocking_clients.values()) >= _blocking_budget():
+            return False
+        _blocking_clients[kind] += 1
+        return True
+
+
+def _release_blocking_slot(kind: str) -> None:
+    with _blocking_lock:
+        _blocking_clients[kind] -= 1
+
+
+def _wait_for_device_revision(store: Any, device_id: str, since: int, timeout: float,
+                              confirmed: bool = False) -> bool:
+    """Blockiert, bis die Revision des Devices ``since`` übersteigt (True) oder timeout abläuft.
+
+    Wartet auf dem ChangeFeed, den auch der Merge in save_system_state bedient.
+    Sind bereits ``longpoll_max_clients`` Threads im Wartezustand oder ist das gemeinsame
+    Budget für blockierende Anfragen erschöpft, wird nicht gewartet – der Aufruf
+    verhält sich dann wie ein normales GET. Mit confirmed
+    zählen nur von der HCU stammende Änderungen, keine optimistischen Updates.
+    """
+    revision_of = store.device_event_revision if confirmed else store.device_revision
+    if (revision_of(device_id) or 0) > since:
+        return True
+    if not _acquire_blocking_slot("longpoll"):
+        log.debug("Long-Poll-Limit erreicht – antworte sofort")
+        return False
+    try:
+        feed = get_change_feed()
+        deadline = time.monotonic() + max(0.0, timeout)
+        cursor = feed.last_seq
+        while (revision_of(device_id) or 0) <= since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            changes, _ = feed.read(cursor, remaining, wake_on_notify=True)
+            if changes:
+                cursor = changes[-1][0]
+        return True
+    finally:
+        _release_blocking_slot("longpoll")
+
+
+@bp.get("/hmipDevices")
+@require_api_key
+def hmip_devices_get():
+    store = get_state_store()
+    view = store.view()
+    if view is None:
+        return jsonify({"error": "Kein Snapshot vorhanden"}), 503
+    rev = store.revision()
+    etag = f"{store.epoch}.{rev}"
+    not_modified = _not_modified(etag)
+    if not_modified is not None:
+        return not_modified
+    devices = [
+        {
+            "id":       dev_id,
+            "label":    dev.get("label"),
+            "type":     dev.get("type"),
+            "revision": store.device_revision(dev_id),
+        }
+        for dev_id, dev in view.devices.items() if isinstance(dev, dict)
+    ]
+    return _with_etag({"revision": rev, "devices": devices}, etag), 200
+
+
+# ── API: Events (Server-Sent Events) ──────────────────────────────────────────
+
+_SSE_KEEPALIVE_S = 15.0
+
+
+def _csv_arg(name: str) -> Optional[set]:
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    return {part.strip() for part in raw.split(",") if part.strip()}
+
+
+def _change_matches(change: Dict[str, Any], devices: Optional[set], channels: Optional[set],
+                    fields: Optional[set], sources: Optional[set]) -> bool:
+    if change.get("kind") == "snapshot":
+        return sources is None or change.get("source") in sources
+    if sources is not None and change.get("source") not in sources:
+        return False
+    if devices is not None and change.get("id") not in devices:
+        return False
+    if channels is not None and change.get("channel") not in channels:
+        return False
+    if fields is not None and change.get("field") not in fields:
+        return False
+    return True
+
+
+@bp.get("/events")
+@require_api_key
+def events_stream():
+    """Feldgenaue Zustandsänderungen als text/event-stream.
+
+    Filter (kommagetrennt): device, channel, field, source (hmip|shelly).
+    Fortsetzen über den Last-Event-ID-Header; liegt die ID nicht mehr im Puffer,
+    kommt zuerst ein ``resync``-Event.
+    """
+    if not _acquire_blocking_slot("sse"):
+        return jsonify({"error": "Zu viele blockierende Anfragen (/events, Long-Poll) – später erneut versuchen"}), 503
+
+    def _release() -> None:
+        _release_blocking_slot("sse")
+
+    devices, channels = _csv_arg("device"), _csv_arg("channel")
+    fields, sources = _csv_arg("field"), _csv_arg("source")
+    feed = get_change_feed()
+    try:
+        cursor = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        cursor = feed.last_seq
+
+    def _generate():
+        nonlocal cursor
+        yield f"retry: 3000\n: verbunden (seq {feed.last_seq})\n\n"
+        while True:
+            changes, gap = feed.read(cursor, timeout=_SSE_KEEPALIVE_S)
+            if gap:
+                cursor = changes[0][0] - 1 if changes else feed.last_seq
+                yield f"id: {cursor}\nevent: resync\ndata: {{}}\n\n"
+            if not changes:
+                yield ": keepalive\n\n"
+                continue
+            out = []
+            for seq, change in changes:
+                if _change_matches(change, devices, channels, fields, sources):
+                    data = json.dumps(change, ensure_ascii=False, separators=(",", ":"))
+                    out.append(f"id: {seq}\nevent: change\ndata: {data}\n\n")
+            cursor = changes[-1][0]
+            if out:
+                yield "".join(out)
+
+    resp = Response(stream_with_context(_generate()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.call_on_close(_release)
+    return resp
+
+
+# ── API: Loxone-Resync ───────────────────────────────────────────────────────
+
+@bp.post("/loxone/resync")
+@require_api_key
+def loxone_resync():
+    """Überträgt den kompletten aktuellen Zustand gedrosselt an alle Loxone-Ziele (asynchron)."""
+    if _load_view() is None:
+        return jsonify({"error": "Kein Snapshot vorhanden"}), 503
+    if not push_stats()["sinks"]:
+        return jsonify({"error": "Kein Loxone-Ziel konfiguriert"}), 409
+    queued = trigger_resync("api")
+    return jsonify({"status": "queued" if queued else "already_queued"}), 202
 
 
 # ── Web-UI: Alarm löschen ─────────────────────────────────────────────────────
@@ -421,20 +899,20 @@ def hmip_state_get():
 @require_web_auth
 def alarm_test_smoke():
     """Löst auf allen Rauchmeldern kurz das Testsignal aus (Web-UI Aktion)."""
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
-    snap = _load_snapshot()
-    if snap is None:
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
+    view = _load_view()
+    if view is None:
         return jsonify({"error": "Kein Snapshot vorhanden"}), 503
-    targets = _find_alarm_siren_devices(snap)
+    targets = _find_alarm_siren_devices(view)
     if not targets:
         return jsonify({"error": "Keine Rauchmelder mit Sirenenfunktion gefunden"}), 404
-    with state.send_lock:
-        for did, cidx in targets:
-            rid = send_hmip_set_alarm_signal_optical(state.conn, did, "FULL_ALARM", cidx)
-            _register_pending(rid, "/hmip/device/control/setAlarmSignalOptical")
-            rid = send_hmip_set_alarm_signal_acoustic(state.conn, did, "FULL_ALARM", cidx)
-            _register_pending(rid, "/hmip/device/control/setAlarmSignalAcoustic")
+    for did, cidx in targets:
+        _send_command(send_hmip_set_alarm_signal_optical, "/hmip/device/control/setAlarmSignalOptical",
+                      did, "FULL_ALARM", cidx)
+        _send_command(send_hmip_set_alarm_signal_acoustic, "/hmip/device/control/setAlarmSignalAcoustic",
+                      did, "FULL_ALARM", cidx)
     log.info("Alarm-Test durch Web-UI: %d Gerät(e)", len(targets))
     return jsonify({"triggered": len(targets)}), 200
 
@@ -443,20 +921,20 @@ def alarm_test_smoke():
 @require_web_auth
 def alarm_clear_smoke():
     """Löscht alle aktiven Alarmsignale auf allen Rauchmeldern (Web-UI Aktion)."""
-    if state.conn is None:
-        return jsonify({"error": "WebSocket nicht verbunden"}), 503
-    snap = _load_snapshot()
-    if snap is None:
+    unavailable = _ws_unavailable()
+    if unavailable:
+        return unavailable
+    view = _load_view()
+    if view is None:
         return jsonify({"error": "Kein Snapshot vorhanden"}), 503
-    targets = _find_alarm_siren_devices(snap)
+    targets = _find_alarm_siren_devices(view)
     if not targets:
         return jsonify({"cleared": 0, "info": "Keine Rauchmelder mit Sirenenfunktion gefunden"}), 200
-    with state.send_lock:
-        for did, cidx in targets:
-            rid = send_hmip_set_alarm_signal_optical(state.conn, did, "NO_ALARM", cidx)
-            _register_pending(rid, "/hmip/device/control/setAlarmSignalOptical")
-            rid = send_hmip_set_alarm_signal_acoustic(state.conn, did, "NO_ALARM", cidx)
-            _register_pending(rid, "/hmip/device/control/setAlarmSignalAcoustic")
+    for did, cidx in targets:
+        _send_command(send_hmip_set_alarm_signal_optical, "/hmip/device/control/setAlarmSignalOptical",
+                      did, "NO_ALARM", cidx)
+        _send_command(send_hmip_set_alarm_signal_acoustic, "/hmip/device/control/setAlarmSignalAcoustic",
+                      did, "NO_ALARM", cidx)
     log.info("Alarm-Clear durch Web-UI: %d Gerät(e)", len(targets))
     return jsonify({"cleared": len(targets)}), 200
 
@@ -493,6 +971,7 @@ def serve_config():
                 _lox = parsed.get("loxone") or {}
                 state.LOXONE_HOST = _lox.get("miniserver_ip") or ""
                 state.LOXONE_UDP_PORT = int(_lox.get("udp_port") or 7777)
+                configure_push(_lox)
             success = True
         except Exception as e:
             error = str(e)
@@ -727,10 +1206,12 @@ def healthz():
     ws_connected = state.conn is not None
     path         = state.config_internal["system_state_path"]
     age_ms       = _snapshot_age_ms(path)
-    snap         = _load_snapshot()
-    devices_count = _devices_count_from_snapshot(snap)
+    devices_count = _devices_count_from_view(_load_view())
+    store        = get_state_store()
+    flush_lag_ms = store.flush_lag_ms()
     with state.pending_lock:
         pending_count = len(state.pending)
+        pending_stats = dict(state.pending_stats)
 
     if not ws_connected:
         status = "degraded"
@@ -739,10 +1220,26 @@ def healthz():
     else:
         status = "ok"
 
-    return jsonify({
+    # Kein ETag/304: fast jedes Feld (Alter, Zähler, Latenzen) ändert sich laufend
+    resp = jsonify({
         "ws_connected":    ws_connected,
         "snapshot_age_ms": age_ms,
+        "snapshot_flush_lag_ms": flush_lag_ms,
+        "journal_bytes":   store.journal_bytes(),
         "devices_count":   devices_count,
         "pending_requests": pending_count,
+        "pending_stats":   pending_stats,
+        "optimistic":      store.optimistic_stats(),
+        "confirm_latency_ms": store.confirm_latency(),
+        "loxone_push":     push_stats(),
+        "loxone_worker":   state.loxone_push.stats() if state.loxone_push is not None else None,
+        "loxone_commands": state.loxone_listener.stats() if state.loxone_listener is not None else None,
+        "send_queue_depth": state.ws_writer.depth() if state.ws_writer is not None else None,
+        "coalescing":      state.ws_writer.coalesce_stats() if state.ws_writer is not None else None,
+        "send_scheduler":  state.ws_writer.scheduler_stats() if state.ws_writer is not None else None,
+        "offline_buffer":  state.ws_writer.offline_stats() if state.ws_writer is not None else None,
+        "event_queue":     state.ws_inbound.stats() if state.ws_inbound is not None else None,
         "status":          status,
-    }), 200
+    })
+    resp.headers["Cache-Control"] = "no-store"
+    return resp, 200
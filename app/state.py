@@ -1,16 +1,27 @@
 # SPDX-License-Identifier: Apache-2.0
 # state.py – Gemeinsamer Laufzeitzustand (wird von main.py initialisiert)
 
-from threading import Lock
+from collections import OrderedDict
+from threading import Lock, RLock
 from typing import Dict, Any, Optional
 
 # WebSocket-Verbindung
 conn = None
 send_lock = Lock()
+ws_writer: Optional[Any] = None  # Type: WsWriter – einziger Schreiber für HTTP-Befehle
+ws_inbound: Optional[Any] = None  # Type: FrameQueue – empfangene Frames bis zur Verarbeitung
 
-# Pending-Requests: id -> {"path": str, "ts": float}
-pending: Dict[str, Dict[str, Any]] = {}
-pending_lock = Lock()
+# Pending-Requests: id -> {"path": str, "ts": float}, in Registrierungsreihenfolge
+# (bei fester TTL zugleich Ablaufreihenfolge – Aufräumen prüft nur die fälligen Einträge vorne)
+pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+pending_lock = RLock()  # reentrant: Einstellen + Registrieren laufen atomar unter dem Lock
+pending_stats: Dict[str, int] = {"registered": 0, "resolved": 0, "expired": 0, "uncorrelated": 0, "dropped": 0}
+
+# HmIP-Systemzustand im Speicher (wird vom HmIP-Adapter gesetzt)
+hmip_store: Optional[Any] = None  # Type: HmIPStateStore (vermeidet zirkulären Import)
+
+# Änderungs-Strom für /events (lazy über app.change_feed.get_change_feed)
+change_feed: Optional[Any] = None  # Type: ChangeFeed
 
 # Auth
 API_KEY: Optional[str] = None
@@ -20,6 +31,8 @@ API_KEY_FILE: str = "data/api_key.txt"
 # Loxone UDP-Push
 LOXONE_HOST: str = ""
 LOXONE_UDP_PORT: int = 7777
+loxone_push: Optional[Any] = None  # Type: PushWorker – entkoppelt den Push von der Eventverarbeitung
+loxone_listener: Optional[Any] = None  # Type: CommandListener – UDP-Steuerbefehle von Loxone (optional)
 
 # Health / Timeouts
 STALE_SEC: float = 60.0
@@ -1,7 +1,6 @@
 # SPDX-License-Identifier: Apache-2.0
 
 # utils.py
-import json
 import logging
 import os
 import tempfile
@@ -12,15 +11,18 @@ from config.loader import load_internal_config
 config_internal = load_internal_config()
 SNAPSHOT_PATH = config_internal["system_state_path"]
 log = logging.getLogger("bridge-ws")
-_snapshot_lock = threading.Lock()
+_store_lock = threading.Lock()
 
 # --------- Helpers: IO ---------
-def _atomic_write(path: str, data: str) -> None:
+def _atomic_write(path: str, data: str, fsync: bool = False) -> None:
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
     fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(path) or ".")
     try:
         with os.fdopen(fd, "w", encoding="utf-8") as f:
             f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
         os.replace(tmp, path)  # atomar
     except Exception:
         try:
@@ -29,30 +31,7 @@ def _atomic_write(path: str, data: str) -> None:
             pass
         raise
 
-def _read_snapshot() -> Optional[Dict[str, Any]]:
-    try:
-        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return None
-    except Exception as e:
-        log.exception("Snapshot lesen fehlgeschlagen")
-        return None
-
-def _write_snapshot(obj: Dict[str, Any]) -> None:
-    _atomic_write(SNAPSHOT_PATH, json.dumps(obj, ensure_ascii=False, indent=2))
-
 # --------- Helpers: Struktur finden ---------
-def _get_nested(d: Any, keys: tuple) -> Any:
-    """Navigiert verschachtelte Dicts entlang einer Key-Sequenz."""
-    cur = d
-    for k in keys:
-        if not isinstance(cur, dict):
-            return None
-        cur = cur.get(k)
-    return cur
-
-
 def _locate_devices_container(snap: Dict[str, Any]) -> Tuple[Optional[Any], str]:
     """
     Liefert (devices_container, path_hint):
@@ -77,11 +56,45 @@ def _locate_devices_container(snap: Dict[str, Any]) -> Tuple[Optional[Any], str]
             return cur, ".".join(path)
     return None, "not found"
 
-def _find_device_in_list(devs_list: list, dev_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
-    for idx, d in enumerate(devs_list):
-        if isinstance(d, dict) and d.get("id") == dev_id:
-            return d, idx
-    return None, None
+def normalize_snapshot(snap: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bringt einen Vollsnapshot einmalig in das kanonische Layout
+    ``body.body.{home, devices, groups}`` mit devices/groups als Dict {id: obj}.
+    Alle bekannten Pfade (inkl. Devices als Liste oder unter home) werden hier
+    aufgelöst, damit Leser danach direkt zugreifen können.
+
+    Formatänderung: system_state.json wird seitdem immer in diesem Layout
+    geschrieben. Ältere Dateien (Devices unter ``body.devices``, ``body.home.devices``
+    oder als Liste) bleiben lesbar; der Store normalisiert sie beim Laden und
+    schreibt sie einmalig im neuen Layout zurück.
+    """
+    if not isinstance(snap, dict):
+        snap = {}
+    body = snap.get("body") if isinstance(snap.get("body"), dict) else {}
+    if isinstance(body.get("body"), dict):
+        outer = {k: v for k, v in body.items() if k != "body"}
+        inner = dict(body["body"])
+    else:
+        outer = {}
+        inner = dict(body)
+
+    devices, _ = _locate_devices_container(snap)
+    if isinstance(devices, list):
+        devices = {d["id"]: d for d in devices if isinstance(d, dict) and d.get("id")}
+    elif not isinstance(devices, dict):
+        devices = {}
+
+    groups = inner.get("groups")
+    if isinstance(groups, list):
+        groups = {g["id"]: g for g in groups if isinstance(g, dict) and g.get("id")}
+    elif not isinstance(groups, dict):
+        groups = {}
+
+    home = inner.get("home")
+    home = {k: v for k, v in home.items() if k != "devices"} if isinstance(home, dict) else {}
+
+    inner.update({"home": home, "devices": devices, "groups": groups})
+    return {**{k: v for k, v in snap.items() if k != "body"}, "body": {**outer, "body": inner}}
 
 # --------- Helpers: Merge-Logik ---------
 def _merge_functional_channels(current: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
@@ -124,11 +137,35 @@ def _merge_group(current: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str,
         incoming = {}
     return {**current, **incoming}
 
+# --------- Public: State-Store ---------
+def get_state_store():
+    """Liefert den prozessweiten HmIPStateStore (``state.hmip_store``).
+
+    Normalerweise legt der HmIP-Adapter den Store an; ohne Adapter (Tests, Tools)
+    wird er hier lazy für SNAPSHOT_PATH erzeugt.
+    """
+    import app.state as state
+    from app.adapters.hmip_store import HmIPStateStore
+    from app.change_feed import get_change_feed
+
+    if state.hmip_store is None:
+        with _store_lock:
+            if state.hmip_store is None:
+                state.hmip_store = HmIPStateStore(SNAPSHOT_PATH, feed=get_change_feed())
+    return state.hmip_store
+
+
+def get_system_view():
+    """Kanonische Sicht (SystemView) auf den aktuellen Zustand oder None."""
+    return get_state_store().view()
+
+
 # --------- Public: Save + Merge ---------
 def save_system_state(msg: Dict[str, Any]) -> None:
     """
-    - HMIP_SYSTEM_RESPONSE  -> gesamten Snapshot atomar speichern
-    - HMIP_SYSTEM_EVENT     -> bestehende Datei laden, Devices daraus mit Event-Devices mergen, zurückschreiben
+    - HMIP_SYSTEM_RESPONSE  -> Zustand im Store ersetzen
+    - HMIP_SYSTEM_EVENT     -> Event-Devices/-Groups in den Store mergen
+    Die Snapshot-Datei wird vom Store geschrieben, nicht mehr pro Event gelesen.
     """
     try:
         if not isinstance(msg, dict):
@@ -136,61 +173,14 @@ def save_system_state(msg: Dict[str, Any]) -> None:
 
         msg_type = msg.get("type")
         if msg_type == "HMIP_SYSTEM_RESPONSE":
-            _write_snapshot(msg)
-            log.info("Systemzustand (Vollsnapshot) gespeichert → %s", SNAPSHOT_PATH)
+            store = get_state_store()
+            store.replace(msg)
+            log.info("Systemzustand (Vollsnapshot) übernommen → %s", store.path)
             return
 
         if msg_type == "HMIP_SYSTEM_EVENT":
-            with _snapshot_lock:
-                snapshot = _read_snapshot()
-                if snapshot is None:
-                    log.warning("Kein vorhandener Snapshot – HMIP_SYSTEM_EVENT wird ignoriert (warte auf Vollsnapshot).")
-                    return
-
-                body_inner = (snapshot.get("body") or {}).get("body") or {}
-                devices_container, hint = _locate_devices_container(snapshot)
-                groups_container = body_inner.get("groups")
-
-                if devices_container is None:
-                    log.warning("Devices-Container im Snapshot nicht gefunden (%s) – Event kann nicht gemerged werden.", hint)
-                    return
-
-                tx = (msg.get("body") or {}).get("eventTransaction") or {}
-                events = tx.get("events") or {}
-
-                for _, ev in sorted(events.items(), key=lambda kv: kv[0]):
-                    if not isinstance(ev, dict):
-                        continue
-
-                    # ── Device-Event ──
-                    dev = ev.get("device")
-                    if isinstance(dev, dict):
-                        dev_id = dev.get("id")
-                        if dev_id:
-                            if isinstance(devices_container, list):
-                                cur, idx = _find_device_in_list(devices_container, dev_id)
-                                if cur is None:
-                                    devices_container.append(dev)
-                                    log.debug("Neues Device angelegt (Liste): %s", dev_id)
-                                else:
-                                    devices_container[idx] = _merge_device(cur, dev)
-                                    log.debug("Device gemerged: %s", dev_id)
-                            elif isinstance(devices_container, dict):
-                                cur = devices_container.get(dev_id, {})
-                                devices_container[dev_id] = _merge_device(cur, dev)
-                                log.debug("Device gemerged: %s", dev_id)
-
-                    # ── Group-Event ──
-                    grp = ev.get("group")
-                    if isinstance(grp, dict) and isinstance(groups_container, dict):
-                        grp_id = grp.get("id")
-                        if grp_id:
-                            cur = groups_container.get(grp_id, {})
-                            groups_container[grp_id] = _merge_group(cur, grp)
-                            log.debug("Group gemerged: %s (%s)", grp_id, grp.get("label", "–"))
-
-                _write_snapshot(snapshot)
-                log.debug("Systemzustand (Delta-Event) in Snapshot gemerged.")
+            if get_state_store().apply_event(msg):
+                log.debug("Systemzustand (Delta-Event) in Store gemerged.")
             return
 
         # Andere Typen ignorieren wir still (oder debug-loggen)
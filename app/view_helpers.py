@@ -2,7 +2,7 @@
 
 """Datenvorbereitung für Jinja2-Templates.
 
-Extrahiert Rohdaten aus dem HmIP-Snapshot und bereitet sie als
+Extrahiert Rohdaten aus der SystemView des HmIP-Stores und bereitet sie als
 einfache Dicts/Listen für render_template() auf.
 """
 
@@ -12,7 +12,7 @@ import json
 import time
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from app.utils import _get_nested, _locate_devices_container, _find_device_in_list
+from app.adapters.hmip_store import SystemView
 
 
 # ── Wetter-Icons ──────────────────────────────────────────────────────────────
@@ -24,22 +24,14 @@ _WEATHER_ICON = {
 }
 
 
-# ── JSON-Navigation ──────────────────────────────────────────────────────────
+# ── Zustands-Navigation ──────────────────────────────────────────────────────
 
-def _build_room_map(snapshot: Dict[str, Any]) -> Dict[str, str]:
+_EMPTY_VIEW = SystemView(home={}, devices={}, groups={})
+
+
+def _build_room_map(groups: Dict[str, Any]) -> Dict[str, str]:
     """Gibt {device_id: room_label} zurück, basierend auf META-Gruppen."""
     room_map: Dict[str, str] = {}
-    candidates = [
-        ("body", "groups"),
-        ("body", "body", "groups"),
-    ]
-    groups = None
-    for path in candidates:
-        groups = _get_nested(snapshot, path)
-        if isinstance(groups, dict):
-            break
-    if not isinstance(groups, dict):
-        return room_map
     for g in groups.values():
         if not isinstance(g, dict) or g.get("type") != "META":
             continue
@@ -50,36 +42,11 @@ def _build_room_map(snapshot: Dict[str, Any]) -> Dict[str, str]:
     return room_map
 
 
-def _iter_devices(snapshot: Dict[str, Any]) -> Iterable[Tuple[str, Dict[str, Any]]]:
-    """Iteriert über alle Devices im Snapshot (Dict oder Liste)."""
-    devices, _ = _locate_devices_container(snapshot)
-    if isinstance(devices, dict):
-        for dev_id, dev in devices.items():
-            if isinstance(dev, dict):
-                yield str(dev_id), dev
-    elif isinstance(devices, list):
-        for dev in devices:
-            if isinstance(dev, dict):
-                yield str(dev.get("id", "")), dev
-
-
-def _find_device(snapshot: Dict[str, Any], device_id: str) -> Optional[Dict[str, Any]]:
-    """Findet ein einzelnes Device im Snapshot."""
-    devices, _ = _locate_devices_container(snapshot)
-    if isinstance(devices, list):
-        dev, _ = _find_device_in_list(devices, device_id)
-        return dev
-    if isinstance(devices, dict):
-        return devices.get(device_id)
-    return None
-
-
-def _get_home_and_groups(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-    """Gibt (home_dict, groups_dict) zurück."""
-    body = data.get("body", {}).get("body", {}) or data.get("body", {})
-    home = body.get("home", {})
-    groups = body.get("groups", {})
-    return home, groups
+def _iter_devices(devices: Dict[str, Any]) -> Iterable[Tuple[str, Dict[str, Any]]]:
+    """Iteriert über alle Devices der kanonischen Sicht."""
+    for dev_id, dev in devices.items():
+        if isinstance(dev, dict):
+            yield str(dev_id), dev
 
 
 def _wind_dir(deg: Any) -> str:
@@ -114,13 +81,12 @@ def _age_str(last_seen: Any) -> str:
 
 # ── Datenvorbereitung pro Seite ──────────────────────────────────────────────
 
-def prepare_device_overview(system_state_path: str) -> Dict[str, Any]:
+def prepare_device_overview(view: Optional[SystemView]) -> Dict[str, Any]:
     """Daten für die Geräteübersicht."""
-    with open(system_state_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    room_map = _build_room_map(data)
+    view = view or _EMPTY_VIEW
+    room_map = _build_room_map(view.groups)
     devices = []
-    for dev_id, dev in _iter_devices(data):
+    for dev_id, dev in _iter_devices(view.devices):
         devices.append({
             "id": dev_id,
             "label": str(dev.get("label", "–")),
@@ -131,15 +97,14 @@ def prepare_device_overview(system_state_path: str) -> Dict[str, Any]:
     return {"devices": devices, "device_count": len(devices), "active_nav": "devices"}
 
 
-def prepare_device_detail(system_state_path: str, device_id: str) -> Dict[str, Any]:
+def prepare_device_detail(view: Optional[SystemView], device_id: str) -> Dict[str, Any]:
     """Daten für die Gerätedetail-Seite."""
-    with open(system_state_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    dev_raw = _find_device(data, device_id)
+    view = view or _EMPTY_VIEW
+    dev_raw = view.devices.get(device_id)
     if not isinstance(dev_raw, dict):
         return {"dev": None, "device_id": device_id, "active_nav": "devices"}
 
-    room_map = _build_room_map(data)
+    room_map = _build_room_map(view.groups)
     fch = dev_raw.get("functionalChannels", {})
     channels = []
     if isinstance(fch, dict):
@@ -165,13 +130,12 @@ def prepare_device_detail(system_state_path: str, device_id: str) -> Dict[str, A
     }
 
 
-def prepare_device_status(system_state_path: str) -> Dict[str, Any]:
+def prepare_device_status(view: Optional[SystemView]) -> Dict[str, Any]:
     """Daten für die Gerätestatus-Seite."""
-    with open(system_state_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    room_map = _build_room_map(data)
+    view = view or _EMPTY_VIEW
+    room_map = _build_room_map(view.groups)
     entries = []
-    for dev_id, dev in _iter_devices(data):
+    for dev_id, dev in _iter_devices(view.devices):
         ch0 = dev.get("functionalChannels", {}).get("0", {})
         low_bat = ch0.get("lowBat")
         unreach = ch0.get("unreach")
@@ -205,11 +169,10 @@ def prepare_device_status(system_state_path: str) -> Dict[str, Any]:
     }
 
 
-def prepare_dashboard(system_state_path: str) -> Dict[str, Any]:
+def prepare_dashboard(view: Optional[SystemView]) -> Dict[str, Any]:
     """Daten für das Dashboard."""
-    with open(system_state_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    home, groups = _get_home_and_groups(data)
+    view = view or _EMPTY_VIEW
+    home, groups = view.home, view.groups
     weather_raw = home.get("weather") or {}
 
     # Wetter
@@ -276,7 +239,7 @@ def prepare_dashboard(system_state_path: str) -> Dict[str, Any]:
 
     # Gerätewarnungen
     warn_devs: List[str] = []
-    for dev_id, dev in _iter_devices(data):
+    for dev_id, dev in _iter_devices(view.devices):
         ch0 = dev.get("functionalChannels", {}).get("0", {})
         if ch0.get("lowBat") or ch0.get("unreach") or ch0.get("dutyCycle") or ch0.get("sabotage"):
             warn_devs.append(dev.get("label", dev_id))
@@ -291,11 +254,10 @@ def prepare_dashboard(system_state_path: str) -> Dict[str, Any]:
     }
 
 
-def prepare_heating(system_state_path: str) -> Dict[str, Any]:
+def prepare_heating(view: Optional[SystemView]) -> Dict[str, Any]:
     """Daten für die Heizungsseite."""
-    with open(system_state_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    home, groups = _get_home_and_groups(data)
+    view = view or _EMPTY_VIEW
+    home, groups = view.home, view.groups
 
     # Abwesenheitsmodus
     absence = "–"
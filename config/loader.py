@@ -70,6 +70,67 @@ def validate_config(config: dict) -> List[str]:
         else:
             _check_type(errors, lox, "miniserver_ip", str, label="loxone.miniserver_ip")
             _check_type(errors, lox, "udp_port", int, label="loxone.udp_port")
+            _check_type(errors, lox, "change_only", bool, label="loxone.change_only")
+            deadbands = lox.get("deadbands")
+            if deadbands is not None:
+                if not isinstance(deadbands, dict):
+                    errors.append("'loxone.deadbands' muss ein Dict sein (Feldname → {abs, rel})")
+                else:
+                    for field, band in deadbands.items():
+                        label = f"loxone.deadbands.{field}"
+                        if isinstance(band, dict):
+                            _check_type(errors, band, "abs", (int, float), label=f"{label}.abs")
+                            _check_type(errors, band, "rel", (int, float), label=f"{label}.rel")
+                        elif not isinstance(band, (int, float)) or isinstance(band, bool):
+                            errors.append(f"'{label}' muss eine Zahl oder {{abs, rel}} sein")
+            intervals = lox.get("min_interval_s")
+            if intervals is not None:
+                if not isinstance(intervals, dict):
+                    errors.append("'loxone.min_interval_s' muss ein Dict sein ({fields: ..., devices: ...})")
+                else:
+                    for scope in ("fields", "devices"):
+                        entries = intervals.get(scope)
+                        if entries is None:
+                            continue
+                        if not isinstance(entries, dict):
+                            errors.append(f"'loxone.min_interval_s.{scope}' muss ein Dict sein (Name → Sekunden)")
+                            continue
+                        for key in entries:
+                            _check_type(errors, entries, key, (int, float), label=f"loxone.min_interval_s.{scope}.{key}")
+            _check_type(errors, lox, "resync_packets_per_s", (int, float), label="loxone.resync_packets_per_s")
+            _check_type(errors, lox, "resync_interval_min", (int, float), label="loxone.resync_interval_min")
+            _check_type(errors, lox, "resync_on_snapshot", bool, label="loxone.resync_on_snapshot")
+            listener = lox.get("command_listener")
+            if listener is not None:
+                if not isinstance(listener, dict):
+                    errors.append("'loxone.command_listener' muss ein Dict sein")
+                else:
+                    _check_type(errors, listener, "enabled", bool, label="loxone.command_listener.enabled")
+                    _check_type(errors, listener, "port", int, label="loxone.command_listener.port")
+                    _check_type(errors, listener, "bind", str, label="loxone.command_listener.bind")
+                    allow = listener.get("allow")
+                    if allow is not None and (not isinstance(allow, list)
+                                              or not all(isinstance(a, str) for a in allow)):
+                        errors.append("'loxone.command_listener.allow' muss eine Liste von IPs/Netzen sein")
+            sinks = lox.get("sinks")
+            if sinks is not None:
+                if not isinstance(sinks, list):
+                    errors.append("'loxone.sinks' muss eine Liste sein")
+                else:
+                    for i, sink in enumerate(sinks):
+                        label = f"loxone.sinks[{i}]"
+                        if not isinstance(sink, dict):
+                            errors.append(f"'{label}' muss ein Dict sein")
+                            continue
+                        _check_type(errors, sink, "host", str, required=True, label=f"{label}.host")
+                        _check_type(errors, sink, "port", int, label=f"{label}.port")
+                        if sink.get("protocol") not in (None, "udp", "tcp"):
+                            errors.append(f"'{label}.protocol' muss udp oder tcp sein")
+                        for key in ("include_devices", "exclude_devices", "include_fields", "exclude_fields"):
+                            patterns = sink.get(key)
+                            if patterns is not None and (not isinstance(patterns, list)
+                                                         or not all(isinstance(p, str) for p in patterns)):
+                                errors.append(f"'{label}.{key}' muss eine Liste von Mustern (Strings) sein")
 
     # Shelly-Sektion
     shelly = config.get("shelly")
@@ -98,6 +159,30 @@ def validate_internal_config(config: dict) -> List[str]:
     _check_type(errors, config, "system_state_path", str, required=True)
     _check_type(errors, config, "log_file", str)
     _check_type(errors, config, "health_stale_seconds", (int, float))
+    _check_type(errors, config, "snapshot_flush_interval_ms", (int, float))
+    _check_type(errors, config, "snapshot_flush_max_dirty", int)
+    _check_type(errors, config, "snapshot_fsync", bool)
+    _check_type(errors, config, "snapshot_journal", bool)
+    _check_type(errors, config, "journal_max_bytes", int)
+    _check_type(errors, config, "journal_compact_interval_s", (int, float))
+    _check_type(errors, config, "http_threads", int)
+    _check_type(errors, config, "http_reserved_threads", int)
+    _check_type(errors, config, "sse_max_clients", int)
+    _check_type(errors, config, "longpoll_max_clients", int)
+    _check_type(errors, config, "ws_send_queue_size", int)
+    _check_type(errors, config, "ws_event_queue_size", int)
+    _check_type(errors, config, "command_coalesce_window_ms", (int, float))
+    _check_type(errors, config, "ws_send_rate", (int, float))
+    _check_type(errors, config, "ws_send_burst", (int, float))
+    _check_type(errors, config, "duty_cycle_soft_pct", (int, float))
+    _check_type(errors, config, "duty_cycle_hard_pct", (int, float))
+    _check_type(errors, config, "duty_cycle_min_rate_factor", (int, float))
+    _check_type(errors, config, "ws_offline_buffer_size", int)
+    _check_type(errors, config, "ws_offline_command_ttl_s", (int, float))
+    _check_type(errors, config, "optimistic_updates", bool)
+    _check_type(errors, config, "optimistic_ttl_s", (int, float))
+    _check_type(errors, config, "loxone_push_queue_size", int)
+    _check_type(errors, config, "loxone_resolve_interval_s", (int, float))
 
     log_level = config.get("log_level")
     if log_level is not None and log_level not in ("debug", "info", "warning", "error"):
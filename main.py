@@ -4,6 +4,7 @@
 import logging
 import os
 import secrets
+import signal
 import sys
 from datetime import timedelta
 from logging.handlers import TimedRotatingFileHandler
@@ -15,6 +16,8 @@ from app.adapters.hmip_adapter import HmIPAdapter
 from app.adapters.registry import AdapterRegistry
 from app.adapters.shelly_adapter import ShellyAdapter
 from app.auth import _ensure_api_key
+from app.loxone_listener import start_command_listener
+from app.loxone_udp import configure_push
 from app.routes import bp as routes_bp
 from config.loader import load_config, load_internal_config, validate_config, validate_internal_config
 
@@ -41,6 +44,7 @@ state.API_KEY         = os.getenv("BRIDGE_API_KEY") or config_internal.get("api_
 _loxone_cfg        = config.get("loxone") or {}
 state.LOXONE_HOST  = _loxone_cfg.get("miniserver_ip") or ""
 state.LOXONE_UDP_PORT = int(_loxone_cfg.get("udp_port") or 7777)
+configure_push(_loxone_cfg)
 
 _ensure_api_key()
 
@@ -109,12 +113,20 @@ state.adapter_registry = registry
 
 # ── Start ─────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    # SIGTERM (docker stop) wie Ctrl+C behandeln, damit stop_all() den Snapshot noch schreibt
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     registry.start_all()
+    listener = start_command_listener(_loxone_cfg)
     host, port = "0.0.0.0", 8080
     try:
-        from waitress import serve
-        log.info("Starte HTTP Server mit Waitress auf Port %s", port)
-        serve(app, host=host, port=port, threads=8)
-    except ImportError:
-        log.info("Waitress nicht installiert – nutze Flask-Dev-Server")
-        app.run(host=host, port=port)
+        try:
+            from waitress import serve
+            log.info("Starte HTTP Server mit Waitress auf Port %s", port)
+            serve(app, host=host, port=port, threads=int(config_internal.get("http_threads", 8)))
+        except ImportError:
+            log.info("Waitress nicht installiert – nutze Flask-Dev-Server")
+            app.run(host=host, port=port)
+    finally:
+        if listener is not None:
+            listener.stop()
+        registry.stop_all()
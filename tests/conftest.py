@@ -5,8 +5,10 @@ import pytest
 from flask import Flask
 
 import app.state as state
+from app.adapters.hmip_writer import WsWriter
 from app.auth import require_api_key, require_web_auth
 from app.routes import bp as routes_bp
+from tests.helpers import FakeConn
 
 
 @pytest.fixture()
@@ -31,6 +33,26 @@ def flask_client(flask_app):
     return flask_app.test_client()
 
 
+@pytest.fixture()
+def conn():
+    """Installs a FakeConn as the live HCU connection."""
+    saved = state.conn
+    state.conn = FakeConn()
+    yield state.conn
+    state.conn = saved
+
+
+@pytest.fixture()
+def writer():
+    """Unstarted WsWriter as state.ws_writer with a connected dummy – messages stay in the queue."""
+    saved = state.conn
+    state.conn = object()
+    state.REQUIRE_API_KEY = False
+    state.ws_writer = WsWriter()
+    yield state.ws_writer
+    state.conn = saved
+
+
 @pytest.fixture()
 def auth_app():
     """Minimal Flask app with dummy routes for auth decorator testing."""
@@ -61,6 +83,10 @@ def _reset_state():
         "config": state.config,
         "config_internal": state.config_internal,
         "pending": state.pending.copy(),
+        "hmip_store": state.hmip_store,
+        "change_feed": state.change_feed,
+        "ws_writer": state.ws_writer,
+        "loxone_push": state.loxone_push,
     }
     yield
     state.API_KEY = saved["API_KEY"]
@@ -68,6 +94,10 @@ def _reset_state():
     state.API_KEY_FILE = saved["API_KEY_FILE"]
     state.config = saved["config"]
     state.config_internal = saved["config_internal"]
+    state.hmip_store = saved["hmip_store"]
+    state.change_feed = saved["change_feed"]
+    state.ws_writer = saved["ws_writer"]
+    state.loxone_push = saved["loxone_push"]
     with state.pending_lock:
         state.pending.clear()
         state.pending.update(saved["pending"])
@@ -0,0 +1,47 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/helpers.py – Shared test doubles and polling helpers (fixtures live in conftest.py)
+
+import json
+import time
+
+
+def wait_for(predicate, timeout=2.0):
+    """Polls predicate until it returns True or the timeout expires."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+class FakeConn:
+    """Stand-in for the HCU WebSocket connection; records every frame sent."""
+
+    def __init__(self, fail=False, block=None):
+        self.sent = []
+        self.pings = 0
+        self.aborted = False
+        self._fail = fail
+        self._block = block
+
+    def send(self, data):
+        if self._block is not None:
+            self._block.wait(5)
+        if self._fail:
+            raise OSError("broken pipe")
+        self.sent.append(data)
+
+    def ping(self):
+        self.pings += 1
+
+    def abort(self):
+        self.aborted = True
+
+    def ids(self):
+        """Message ids of the sent frames, in send order."""
+        return [json.loads(data)["id"] for data in self.sent]
+
+    def paths(self):
+        """Last path segment (e.g. setSwitchState) of the sent frames, in send order."""
+        return [json.loads(data)["body"]["path"].rsplit("/", 1)[-1] for data in self.sent]
@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_ack_wait.py – Tests for ?wait=ms on control endpoints (ACK futures)
+
+import json
+import threading
+
+import app.state as state
+from app.adapters.hmip_websocket import _cleanup_pending, _drop_pending, _handle_frame, _register_pending
+from app.adapters.hmip_writer import WsWriter
+
+
+def _ack_next(writer, code, delay=0.02):
+    """Simuliert die HCU: nimmt die nächste gesendete Nachricht und beantwortet sie."""
+    def _run():
+        payload = json.loads(writer._queue.get(timeout=2).data)
+        _handle_frame(json.dumps({"type": "HMIP_SYSTEM_RESPONSE", "id": payload["id"], "body": {"code": code}}))
+    t = threading.Timer(delay, _run)
+    t.start()
+    return t
+
+
+class TestAckFutures:
+    def test_future_resolved_by_response(self):
+        future = _register_pending("f-1", "/test", with_future=True)
+        _handle_frame(json.dumps({"type": "HMIP_SYSTEM_RESPONSE", "id": "f-1", "body": {"code": 200}}))
+        result = future.result(timeout=1)
+        assert result["code"] == 200
+        assert result["latency_ms"] >= 0
+
+    def test_future_resolved_on_expiry(self):
+        future = _register_pending("f-2", "/test", with_future=True)
+        with state.pending_lock:
+            state.pending["f-2"]["ts"] -= 1000
+        _cleanup_pending()
+        assert future.result(timeout=1)["error"] == "expired"
+
+    def test_future_resolved_on_disconnect(self):
+        future = _register_pending("f-3", "/test", with_future=True)
+        _drop_pending()
+        assert future.result(timeout=1)["error"] == "disconnected"
+
+
+class TestWaitParameter:
+    def test_switch_waits_for_ack(self, flask_client, writer):
+        _ack_next(writer, 200)
+        r = flask_client.post("/hmipSwitch?wait=2000", json={"device": "d1", "on": True})
+        assert r.status_code == 200
+        body = r.get_json()
+        assert body["ack"] == "ok"
+        assert body["code"] == 200
+        assert "latency_ms" in body
+
+    def test_hcu_error_code_returns_502(self, flask_client, writer):
+        _ack_next(writer, 400)
+        r = flask_client.post("/hmipDimmer?wait=2000", json={"device": "d1", "dimLevel": 50})
+        assert r.status_code == 502
+        assert r.get_json()["code"] == 400
+
+    def test_timeout_returns_202(self, flask_client, writer):
+        r = flask_client.post("/hmipThermostat?wait=20", json={"device": "t1", "temperature": 21})
+        assert r.status_code == 202
+        assert r.get_json()["ack"] == "timeout"
+
+    def test_without_wait_unchanged(self, flask_client, writer):
+        r = flask_client.post("/hmipSwitch", json={"device": "d1", "on": False})
+        assert r.status_code == 200
+        assert "ack" not in r.get_json()
+
+    def test_invalid_wait(self, flask_client, writer):
+        r = flask_client.post("/hmipSwitch?wait=bald", json={"device": "d1", "on": False})
+        assert r.status_code == 400
+
+
+class TestSendQueueFull:
+    def test_full_queue_answers_503(self, flask_client, writer):
+        state.ws_writer = WsWriter(maxsize=1)
+        assert flask_client.post("/hmipSwitch", json={"device": "s1", "on": True}).status_code == 200
+        r = flask_client.post("/hmipSwitch", json={"device": "s2", "on": True})
+        assert r.status_code == 503
+        assert r.get_json()["error"] == "Sendewarteschlange voll"
+        with state.pending_lock:
+            assert len(state.pending) == 1
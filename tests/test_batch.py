@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_batch.py – Tests for the /hmipBatch endpoint and burst sending
+
+import json
+import threading
+
+import app.state as state
+from app.adapters.hmip_websocket import _handle_frame
+from app.adapters.hmip_writer import WsWriter
+
+
+_OPS = [
+    {"op": "switch", "device": "s1", "on": True},
+    {"op": "dim", "device": "d1", "dimLevel": 40},
+    {"op": "rgb", "device": "r1", "rgb": "R=100%,G=0%,B=0%"},
+    {"op": "thermostat", "device": "t1", "temperature": 21.5},
+    {"op": "alarm", "device": "a1", "mode": "both"},
+]
+
+
+class TestHmipBatch:
+    def test_all_ops_enqueued_as_one_entry(self, flask_client, writer):
+        r = flask_client.post("/hmipBatch", json={"operations": _OPS})
+        assert r.status_code == 200
+        body = r.get_json()
+        assert body["count"] == 6  # alarm "both" → optisch + akustisch
+        assert [x["index"] for x in body["results"]] == [0, 1, 2, 3, 4, 4]
+        assert writer.depth() == 1
+        batch = writer._queue.get_nowait()
+        paths = [m.path for m in batch]
+        assert paths[0] == "/hmip/device/control/setSwitchState"
+        assert paths[-1] == "/hmip/device/control/setAlarmSignalAcoustic"
+        with state.pending_lock:
+            assert all(x["request_id"] in state.pending for x in body["results"])
+
+    def test_plain_list_body(self, flask_client, writer):
+        r = flask_client.post("/hmipBatch", json=[{"op": "switch", "device": "s1", "on": False}])
+        assert r.status_code == 200
+
+    def test_invalid_op_sends_nothing(self, flask_client, writer):
+        ops = [{"op": "switch", "device": "s1", "on": True}, {"op": "dim", "device": "d1", "dimLevel": 500}]
+        r = flask_client.post("/hmipBatch", json=ops)
+        assert r.status_code == 400
+        assert r.get_json()["details"][0]["index"] == 1
+        assert writer.depth() == 0
+
+    def test_wait_collects_ack_codes(self, flask_client, writer):
+        def _hcu():
+            for msg in writer._queue.get(timeout=2):
+                _handle_frame(json.dumps({"type": "HMIP_SYSTEM_RESPONSE", "id": msg.rid, "body": {"code": 200}}))
+        threading.Timer(0.02, _hcu).start()
+        r = flask_client.post("/hmipBatch?wait=2000", json=_OPS[:2])
+        assert r.status_code == 200
+        assert [x["ack"] for x in r.get_json()["results"]] == ["ok", "ok"]
+
+
+class TestBurstSending:
+    def test_batch_sent_under_single_lock(self):
+        class Conn:
+            def __init__(self):
+                self.sent = []
+
+            def send(self, data):
+                # während des Bursts hält der Writer send_lock durchgehend
+                assert not state.send_lock.acquire(blocking=False)
+                self.sent.append(data)
+
+        saved = state.conn
+        state.conn = Conn()
+        try:
+            writer = WsWriter()
+            writer.send_batch(["a", "b"])
+            writer.send("c")
+            writer.start()
+            writer.stop()
+            assert state.conn.sent == ["a", "b", "c"]
+        finally:
+            state.conn = saved
@@ -0,0 +1,129 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_change_feed.py – Tests for the change feed and the /events SSE stream
+
+import json
+import threading
+
+import pytest
+
+import app.routes as routes
+import app.state as state
+from app.adapters.hmip_store import HmIPStateStore
+from app.change_feed import ChangeFeed
+
+
+def _snapshot():
+    return {"type": "HMIP_SYSTEM_RESPONSE", "body": {"body": {"devices": {
+        "d1": {"id": "d1", "label": "Licht", "functionalChannels": {"1": {"on": True, "dimLevel": 0.5}}},
+        "d2": {"id": "d2", "label": "Fenster", "functionalChannels": {"1": {"windowState": "CLOSED"}}},
+    }}}}
+
+
+def _event(dev):
+    return {"type": "HMIP_SYSTEM_EVENT", "body": {"eventTransaction": {"events": {"0": {"device": dev}}}}}
+
+
+class TestChangeFeed:
+    def test_read_returns_newer_entries(self):
+        feed = ChangeFeed()
+        feed.publish([{"n": 1}, {"n": 2}])
+        changes, gap = feed.read(1)
+        assert [c["n"] for _, c in changes] == [2]
+        assert gap is False
+
+    def test_gap_when_reader_fell_out_of_ring(self):
+        feed = ChangeFeed(maxlen=2)
+        feed.publish([{"n": i} for i in range(5)])
+        changes, gap = feed.read(0)
+        assert gap is True
+        assert [seq for seq, _ in changes] == [4, 5]
+
+    def test_sequence_from_previous_run_is_gap(self):
+        feed = ChangeFeed()
+        assert feed.read(42, timeout=5) == ([], True)
+
+    def test_notify_wakes_only_opted_in_readers(self):
+        feed = ChangeFeed()
+        threading.Timer(0.05, feed.notify).start()
+        assert feed.read(0, timeout=5, wake_on_notify=True) == ([], False)
+        threading.Timer(0.05, feed.notify).start()
+        assert feed.read(0, timeout=0.2) == ([], False)
+
+    def test_read_wakes_on_publish(self):
+        feed = ChangeFeed()
+        threading.Timer(0.05, feed.publish, args=([{"n": 1}],)).start()
+        changes, _ = feed.read(0, timeout=5)
+        assert changes[0][1] == {"n": 1}
+
+
+class TestStorePublishesChanges:
+    def test_only_changed_fields_published(self, tmp_snapshot):
+        feed = ChangeFeed()
+        store = HmIPStateStore(tmp_snapshot, feed=feed)
+        store.replace(_snapshot())
+        seq = feed.last_seq
+        store.apply_event(_event({"id": "d1", "functionalChannels": {"1": {"on": False, "dimLevel": 0.5}}}))
+        changes = [c for _, c in feed.read(seq)[0]]
+        assert len(changes) == 1
+        assert changes[0]["id"] == "d1"
+        assert changes[0]["channel"] == "1"
+        assert changes[0]["field"] == "on"
+        assert changes[0]["value"] is False
+        assert changes[0]["revision"] == store.revision()
+
+    def test_replace_publishes_snapshot_marker(self, tmp_snapshot):
+        feed = ChangeFeed()
+        HmIPStateStore(tmp_snapshot, feed=feed).replace(_snapshot())
+        (_, change), = feed.read(0)[0]
+        assert change["kind"] == "snapshot"
+
+
+class TestEventsEndpoint:
+    @pytest.fixture()
+    def store(self, tmp_snapshot):
+        state.change_feed = ChangeFeed()
+        store = HmIPStateStore(tmp_snapshot, feed=state.change_feed)
+        store.replace(_snapshot())
+        state.hmip_store = store
+        state.REQUIRE_API_KEY = False
+        return store
+
+    def _read_events(self, resp, count):
+        events, buf = [], ""
+        for chunk in resp.response:
+            buf += chunk.decode() if isinstance(chunk, bytes) else chunk
+            while "\n\n" in buf:
+                block, buf = buf.split("\n\n", 1)
+                lines = dict(l.split(": ", 1) for l in block.splitlines() if not l.startswith(":"))
+                if lines.get("event"):
+                    events.append(lines)
+            if len(events) >= count:
+                break
+        resp.close()
+        return events
+
+    def test_filtered_stream_with_resume(self, flask_client, store):
+        store.apply_event(_event({"id": "d2", "functionalChannels": {"1": {"windowState": "OPEN"}}}))
+        store.apply_event(_event({"id": "d1", "label": "Decke"}))
+        resp = flask_client.get("/events?device=d1", headers={"Last-Event-ID": "1"}, buffered=False)
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/event-stream"
+        (ev,) = self._read_events(resp, 1)
+        assert ev["event"] == "change"
+        assert json.loads(ev["data"])["value"] == "Decke"
+
+    def test_client_limit(self, flask_client, store):
+        state.config_internal = {**state.config_internal, "sse_max_clients": 0}
+        assert flask_client.get("/events").status_code == 503
+
+    def test_shared_budget_with_long_poll(self, flask_client, store):
+        state.config_internal = {**state.config_internal, "http_threads": 4, "http_reserved_threads": 0}
+        assert routes._blocking_budget() == 2
+        assert routes._acquire_blocking_slot("longpoll")
+        assert routes._acquire_blocking_slot("longpoll")
+        try:
+            assert flask_client.get("/events").status_code == 503
+            assert not routes._wait_for_device_revision(store, "d1", 10**9, timeout=5)
+        finally:
+            routes._release_blocking_slot("longpoll")
+            routes._release_blocking_slot("longpoll")
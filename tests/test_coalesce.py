@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_coalesce.py – Tests for last-write-wins coalescing of outbound commands
+
+import json
+
+import app.state as state
+from app.adapters.hmip_coalesce import CommandCoalescer
+from app.adapters.hmip_scheduler import OutboundMessage
+from app.adapters.hmip_messages import send_hmip_set_dim_level, send_hmip_set_switch
+from app.adapters.hmip_websocket import _handle_frame, _register_pending
+from app.adapters.hmip_writer import WsWriter
+from tests.helpers import wait_for
+
+
+def _drain(writer):
+    out = []
+    while not writer._queue.empty():
+        out.append(json.loads(writer._queue.get_nowait().data))
+    return out
+
+
+class TestCoalescer:
+    def test_first_command_passes_immediately(self):
+        writer = WsWriter(coalesce_window_ms=50)
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        assert writer.depth() == 1
+
+    def test_burst_forwards_only_latest(self):
+        writer = WsWriter(coalesce_window_ms=50)
+        for level in (0.1, 0.2, 0.3, 0.4):
+            send_hmip_set_dim_level(writer, "D1", level, 1)
+        assert writer.depth() == 1
+        assert wait_for(lambda: writer.depth() == 2)
+        sent = _drain(writer)
+        assert [m["body"]["body"]["dimLevel"] for m in sent] == [0.1, 0.4]
+        assert writer.coalesce_stats()["coalesced"] == 2
+
+    def test_keys_are_independent(self):
+        writer = WsWriter(coalesce_window_ms=50)
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        send_hmip_set_dim_level(writer, "D1", 0.2, 2)
+        send_hmip_set_dim_level(writer, "D2", 0.3, 1)
+        assert writer.depth() == 3
+
+    def test_switch_never_coalesced(self):
+        writer = WsWriter(coalesce_window_ms=50)
+        send_hmip_set_switch(writer, "S1", True, 0)
+        send_hmip_set_switch(writer, "S1", False, 0)
+        assert writer.depth() == 2
+
+    def test_held_dim_released_before_later_switch(self):
+        writer = WsWriter(coalesce_window_ms=10_000)
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        send_hmip_set_dim_level(writer, "D1", 0.5, 1)
+        send_hmip_set_switch(writer, "D1", False, 1)
+        sent = _drain(writer)
+        assert [m["body"]["path"].rsplit("/", 1)[-1] for m in sent] == ["setDimLevel", "setDimLevel", "setSwitchState"]
+        assert sent[1]["body"]["body"]["dimLevel"] == 0.5
+
+    def test_disabled_without_window(self):
+        writer = WsWriter()
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        send_hmip_set_dim_level(writer, "D1", 0.2, 1)
+        assert writer.depth() == 2
+        assert writer.coalesce_stats() is None
+
+    def test_flush_all_releases_held_commands(self):
+        writer = WsWriter(coalesce_window_ms=10_000)
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        send_hmip_set_dim_level(writer, "D1", 0.9, 1)
+        writer._coalescer.flush_all()
+        assert [m["body"]["body"]["dimLevel"] for m in _drain(writer)] == [0.1, 0.9]
+
+    def test_superseded_callers_share_ack(self):
+        writer = WsWriter(coalesce_window_ms=50)
+        first = send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        _register_pending(first, "/hmip/device/control/setDimLevel")
+        futures = {}
+        for level in (0.2, 0.3):
+            with state.pending_lock:
+                rid = send_hmip_set_dim_level(writer, "D1", level, 1)
+                futures[rid] = _register_pending(rid, "/hmip/device/control/setDimLevel", with_future=True)
+        assert wait_for(lambda: writer.depth() == 2)
+        final = _drain(writer)[-1]["id"]
+        _handle_frame(json.dumps({"type": "HMIP_SYSTEM_RESPONSE", "id": final, "body": {"code": 200}}))
+        for future in futures.values():
+            assert future.result(timeout=1)["code"] == 200
+        assert not any(rid in state.pending for rid in futures)
+
+    def test_released_command_on_full_queue_fails_pending(self):
+        writer = WsWriter(maxsize=1, coalesce_window_ms=20)
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)  # belegt die Schlange
+        futures = {}
+        for level in (0.2, 0.3):
+            with state.pending_lock:
+                rid = send_hmip_set_dim_level(writer, "D1", level, 1)
+                futures[rid] = _register_pending(rid, "/hmip/device/control/setDimLevel", with_future=True)
+        for future in futures.values():
+            assert future.result(timeout=2)["error"] == "dropped"
+        assert not any(rid in state.pending for rid in futures)
+        assert writer.dropped == 1
+
+    def test_nothing_held_after_flush_all(self):
+        writer = WsWriter(coalesce_window_ms=10_000)
+        send_hmip_set_dim_level(writer, "D1", 0.1, 1)
+        writer._coalescer.flush_all()
+        send_hmip_set_dim_level(writer, "D1", 0.2, 1)
+        assert writer._coalescer.held_count() == 0
+        assert [m["body"]["body"]["dimLevel"] for m in _drain(writer)] == [0.1, 0.2]
+
+    def test_unparseable_payload_passed_through(self):
+        c = CommandCoalescer(50, lambda msg: None)
+        assert c.offer(OutboundMessage.parse("kein json")) is False
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_conditional_get.py – ETag / If-None-Match on the state endpoints
+
+import threading
+import time
+
+import pytest
+
+import app.state as state
+from app.adapters.hmip_store import HmIPStateStore
+from app.change_feed import ChangeFeed
+
+
+@pytest.fixture()
+def store(tmp_snapshot):
+    state.change_feed = ChangeFeed()
+    store = HmIPStateStore(tmp_snapshot, feed=state.change_feed)
+    store.replace({
+        "type": "HMIP_SYSTEM_RESPONSE",
+        "body": {"body": {"devices": {
+            "d1": {"id": "d1", "label": "Licht", "type": "PLUGGABLE_SWITCH",
+                   "functionalChannels": {"1": {"on": True}}},
+            "d2": {"id": "d2", "label": "Fenster", "functionalChannels": {}},
+        }}},
+    })
+    state.hmip_store = store
+    state.REQUIRE_API_KEY = False
+    return store
+
+
+def _event(dev):
+    return {"type": "HMIP_SYSTEM_EVENT", "body": {"eventTransaction": {"events": {"0": {"device": dev}}}}}
+
+
+class TestHmipStateETag:
+    def test_304_when_unchanged(self, flask_client, store):
+        r = flask_client.get("/hmipState?device=d1&channelIndex=1")
+        assert r.status_code == 200
+        etag = r.headers["ETag"]
+        r2 = flask_client.get("/hmipState?device=d1&channelIndex=1", headers={"If-None-Match": etag})
+        assert r2.status_code == 304
+        assert r2.data == b""
+
+    def test_other_device_change_keeps_etag(self, flask_client, store):
+        etag = flask_client.get("/hmipState?device=d1&channelIndex=1").headers["ETag"]
+        store.apply_event(_event({"id": "d2", "label": "Tür"}))
+        r = flask_client.get("/hmipState?device=d1&channelIndex=1", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+
+    def test_own_change_returns_200(self, flask_client, store):
+        etag = flask_client.get("/hmipState?device=d1&channelIndex=1").headers["ETag"]
+        store.apply_event(_event({"id": "d1", "functionalChannels": {"1": {"on": False}}}))
+        r = flask_client.get("/hmipState?device=d1&channelIndex=1", headers={"If-None-Match": etag})
+        assert r.status_code == 200
+        assert r.get_json() == {"on": False}
+        assert r.headers["ETag"] != etag
+
+
+class TestHmipDevices:
+    def test_list_and_304(self, flask_client, store):
+        r = flask_client.get("/hmipDevices")
+        assert r.status_code == 200
+        body = r.get_json()
+        assert {d["id"] for d in body["devices"]} == {"d1", "d2"}
+        r2 = flask_client.get("/hmipDevices", headers={"If-None-Match": r.headers["ETag"]})
+        assert r2.status_code == 304
+        store.apply_event(_event({"id": "d2", "label": "Tür"}))
+        r3 = flask_client.get("/hmipDevices", headers={"If-None-Match": r.headers["ETag"]})
+        assert r3.status_code == 200
+
+
+class TestHealthz:
+    def test_never_conditional(self, flask_client, store):
+        state.config_internal = {**state.config_internal, "system_state_path": store.path}
+        r = flask_client.get("/healthz")
+        assert r.status_code == 200
+        assert "ETag" not in r.headers
+        assert r.headers["Cache-Control"] == "no-store"
+        assert flask_client.get("/healthz", headers={"If-None-Match": "*"}).status_code == 200
+
+
+class TestLongPoll:
+    def test_returns_immediately_when_already_newer(self, flask_client, store):
+        r = flask_client.get("/hmipState?device=d1&channelIndex=1&since=0&wait=10")
+        assert r.status_code == 200
+        assert int(r.headers["X-Revision"]) == store.device_revision("d1")
+
+    def test_blocks_until_device_changes(self, flask_client, store):
+        rev = store.device_revision("d1")
+        # fremdes Device weckt den Wartenden, beendet ihn aber nicht
+        threading.Timer(0.05, store.apply_event, args=(_event({"id": "d2", "label": "x"}),)).start()
+        threading.Timer(0.15, store.apply_event,
+                        args=(_event({"id": "d1", "functionalChannels": {"1": {"on": False}}}),)).start()
+        r = flask_client.get(f"/hmipState?device=d1&channelIndex=1&since={rev}&wait=5")
+        assert r.status_code == 200
+        assert r.get_json() == {"on": False}
+        assert int(r.headers["X-Revision"]) > rev
+
+    def test_timeout_returns_current_state(self, flask_client, store):
+        rev = store.device_revision("d1")
+        r = flask_client.get(f"/hmipState?device=d1&channelIndex=1&since={rev}&wait=0.05")
+        assert r.status_code == 200
+        assert int(r.headers["X-Revision"]) == rev
+
+    def test_invalid_since(self, flask_client, store):
+        assert flask_client.get("/hmipState?device=d1&since=abc").status_code == 400
+
+
+@pytest.mark.usefixtures("writer")
+class TestMinRevision:
+    def test_control_returns_pre_send_revision(self, flask_client, store):
+        rev = store.revision()
+        body = flask_client.post("/hmipSwitch", json={"device": "d1", "on": False, "channelIndex": 1}).get_json()
+        assert body["revision"] == rev
+        assert store.revision() > rev  # optimistisches Update zählt lokal
+
+    def test_waits_for_hcu_confirmation_not_optimistic_update(self, flask_client, store):
+        token = flask_client.post("/hmipSwitch",
+                                  json={"device": "d1", "on": False, "channelIndex": 1}).get_json()["revision"]
+        r = flask_client.get(f"/hmipState?device=d1&channelIndex=1&min_revision={token}&wait=0.05")
+        assert r.headers["X-Min-Revision-Met"] == "false"
+        assert r.headers["X-Pending"] == "on"
+        threading.Timer(0.05, store.apply_event,
+                        args=(_event({"id": "d1", "type": "PLUGGABLE_SWITCH",
+                                      "functionalChannels": {"1": {"on": False}}}),)).start()
+        r = flask_client.get(f"/hmipState?device=d1&channelIndex=1&min_revision={token}&wait=5")
+        assert r.headers["X-Min-Revision-Met"] == "true"
+        assert int(r.headers["X-Confirmed-Revision"]) > token
+        assert "X-Pending" not in r.headers
+        assert store.confirm_latency()["PLUGGABLE_SWITCH"]["count"] == 1
+
+    def test_idempotent_command_confirmed_by_unchanged_event(self, flask_client, store):
+        token = flask_client.post("/hmipSwitch",
+                                  json={"device": "d1", "on": True, "channelIndex": 1}).get_json()["revision"]
+        threading.Timer(0.05, store.apply_event,
+                        args=(_event({"id": "d1", "functionalChannels": {"1": {"on": True}}}),)).start()
+        started = time.monotonic()
+        r = flask_client.get(f"/hmipState?device=d1&channelIndex=1&min_revision={token}&wait=5")
+        assert r.headers["X-Min-Revision-Met"] == "true"
+        assert time.monotonic() - started < 2  # geweckt, nicht erst nach Ablauf
+
+    def test_batch_returns_revision(self, flask_client, store):
+        rev = store.revision()
+        body = flask_client.post("/hmipBatch", json=[{"op": "switch", "device": "d1", "on": True}]).get_json()
+        assert body["revision"] == rev
+
+    def test_min_revision_and_since_share_one_deadline(self, flask_client, store):
+        rev = store.revision()
+        started = time.monotonic()
+        r = flask_client.get(f"/hmipState?device=d1&channelIndex=1&min_revision={rev}&since={rev}&wait=0.2")
+        assert r.headers["X-Min-Revision-Met"] == "false"
+        assert time.monotonic() - started < 0.35
+
+    def test_invalid_min_revision(self, flask_client, store):
+        assert flask_client.get("/hmipState?device=d1&min_revision=x").status_code == 400
@@ -47,6 +47,47 @@ class TestValidateConfig:
         errors = validate_config(cfg)
         assert any("loxone.udp_port" in e for e in errors)
 
+    def test_loxone_deadbands(self):
+        cfg = _valid_config()
+        cfg["loxone"] = {"deadbands": {"actualTemperature": 0.1, "currentPowerConsumption": {"abs": 1, "rel": 0.02}}}
+        assert validate_config(cfg) == []
+        cfg["loxone"] = {"deadbands": {"actualTemperature": "viel"}}
+        assert any("loxone.deadbands.actualTemperature" in e for e in validate_config(cfg))
+
+    def test_loxone_min_intervals(self):
+        cfg = _valid_config()
+        cfg["loxone"] = {"min_interval_s": {"fields": {"currentPowerConsumption": 5}, "devices": {"D1": 0.5}}}
+        assert validate_config(cfg) == []
+        cfg["loxone"] = {"min_interval_s": {"devices": {"D1": "schnell"}}}
+        assert any("loxone.min_interval_s.devices.D1" in e for e in validate_config(cfg))
+
+    def test_loxone_sinks(self):
+        cfg = _valid_config()
+        cfg["loxone"] = {"sinks": [{"host": "10.0.0.2", "port": 7777, "include_fields": ["current*"]},
+                                   {"host": "log", "protocol": "tcp"}]}
+        assert validate_config(cfg) == []
+        cfg["loxone"] = {"sinks": [{"port": 7777, "protocol": "http", "exclude_devices": "abc"}]}
+        errors = validate_config(cfg)
+        assert any("loxone.sinks[0].host" in e for e in errors)
+        assert any("loxone.sinks[0].protocol" in e for e in errors)
+        assert any("loxone.sinks[0].exclude_devices" in e for e in errors)
+
+    def test_loxone_resync(self):
+        cfg = _valid_config()
+        cfg["loxone"] = {"resync_packets_per_s": 20, "resync_interval_min": 30, "resync_on_snapshot": True}
+        assert validate_config(cfg) == []
+        cfg["loxone"] = {"resync_on_snapshot": "ja"}
+        assert any("loxone.resync_on_snapshot" in e for e in validate_config(cfg))
+
+    def test_loxone_command_listener(self):
+        cfg = _valid_config()
+        cfg["loxone"] = {"command_listener": {"enabled": True, "port": 7778, "allow": ["192.168.1.0/24"]}}
+        assert validate_config(cfg) == []
+        cfg["loxone"] = {"command_listener": {"enabled": "ja", "allow": "192.168.1.10"}}
+        errors = validate_config(cfg)
+        assert any("loxone.command_listener.enabled" in e for e in errors)
+        assert any("loxone.command_listener.allow" in e for e in errors)
+
     def test_shelly_section_invalid_type(self):
         cfg = _valid_config()
         cfg["shelly"] = True
@@ -93,3 +134,11 @@ class TestValidateInternalConfig:
     def test_not_a_dict(self):
         errors = validate_internal_config("string")
         assert len(errors) == 1
+
+    def test_snapshot_flush_settings(self):
+        cfg = {"system_state_path": "x", "snapshot_flush_interval_ms": 500,
+               "snapshot_flush_max_dirty": 50, "snapshot_fsync": True}
+        assert validate_internal_config(cfg) == []
+        cfg["snapshot_fsync"] = "yes"
+        errors = validate_internal_config(cfg)
+        assert any("snapshot_fsync" in e for e in errors)
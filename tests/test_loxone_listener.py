@@ -0,0 +1,94 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_loxone_listener.py – Tests for the inbound Loxone UDP command listener
+
+import socket
+import time
+
+import pytest
+
+import app.state as state
+from app.adapters.hmip_messages import send_hmip_set_switch
+from app.adapters.hmip_writer import WsWriter
+from app.loxone_listener import CommandListener, parse_command, start_command_listener
+
+
+class TestParseCommand:
+    def test_switch(self):
+        send_fn, path, args = parse_command("hmip_3014F711A0000000000001_ch2_on@1\r\n")
+        assert send_fn is send_hmip_set_switch
+        assert path == "/hmip/device/control/setSwitchState"
+        assert args == ("3014F711A0000000000001", True, 2)
+
+    def test_dim_level_mirrors_push_scale(self):
+        assert parse_command("hmip_D1_ch1_dimLevel@0.456")[2] == ("D1", 0.46, 1)
+        with pytest.raises(ValueError):
+            parse_command("hmip_D1_ch1_dimLevel@50")
+
+    @pytest.mark.parametrize("line", ["hmip_D1_on@1", "hmip_D1_ch1_lowBat@1", "hmip_D1_ch1_on@yes",
+                                      "hmip_D1_ch1_setPointTemperature@40"])
+    def test_invalid(self, line):
+        with pytest.raises(ValueError):
+            parse_command(line)
+
+
+class TestCommandListener:
+    def test_allowed_command_reaches_writer_and_pending(self, writer):
+        listener = CommandListener(0, ["192.168.1.0/24"])
+        assert listener.handle(b"hmip_D1_ch1_on@1\r\nhmip_D1_ch1_setPointTemperature@21.5\r\n", "192.168.1.10") == 2
+        assert writer.depth() == 2
+        paths = sorted(meta["path"] for meta in state.pending.values())
+        assert paths == ["/hmip/device/control/setSetPointTemperature", "/hmip/device/control/setSwitchState"]
+        assert listener.stats()["senders"]["192.168.1.10"]["commands"] == 2
+
+    def test_sender_outside_allow_list_rejected(self, writer):
+        listener = CommandListener(0, ["192.168.1.10"])
+        assert listener.handle(b"hmip_D1_ch1_on@1", "192.168.1.11") == 0
+        assert writer.depth() == 0
+        stats = listener.stats()
+        assert stats["rejected"] == 1
+        assert stats["senders"] == {}
+
+    def test_counts_invalid_and_unavailable(self, writer):
+        listener = CommandListener(0, ["127.0.0.1"])
+        listener.handle(b"kaputt\nhmip_D1_ch1_on@1", "127.0.0.1")
+        state.conn = None
+        listener.handle(b"hmip_D1_ch1_on@0", "127.0.0.1")
+        sender = listener.stats()["senders"]["127.0.0.1"]
+        assert (sender["received"], sender["invalid"], sender["commands"], sender["unavailable"]) == (2, 1, 1, 1)
+
+    def test_full_queue_counted_per_line(self, writer):
+        state.ws_writer = WsWriter(maxsize=1)
+        listener = CommandListener(0, ["127.0.0.1"])
+        assert listener.handle(b"hmip_D1_ch1_on@1\nhmip_D2_ch1_on@1\nhmip_D3_ch1_on@1", "127.0.0.1") == 1
+        stats = listener.stats()
+        assert (stats["commands"], stats["queue_full"]) == (1, 2)
+        assert len(state.pending) == 1
+
+    def test_udp_roundtrip(self, writer):
+        listener = CommandListener(0, ["127.0.0.1"], bind="127.0.0.1")
+        listener.start()
+        try:
+            port = listener._sock.getsockname()[1]
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"hmip_D1_ch1_on@1", ("127.0.0.1", port))
+            deadline = time.monotonic() + 2
+            while writer.depth() == 0 and time.monotonic() < deadline:
+                time.sleep(0.005)
+            assert writer.depth() == 1
+        finally:
+            listener.stop()
+
+
+class TestStartCommandListener:
+    def test_disabled_by_default(self):
+        assert start_command_listener({"miniserver_ip": "127.0.0.1"}) is None
+
+    def test_allow_defaults_to_miniserver(self):
+        listener = start_command_listener({"miniserver_ip": "127.0.0.1",
+                                           "command_listener": {"enabled": True, "port": 0, "bind": "127.0.0.1"}})
+        try:
+            assert listener.allowed("127.0.0.1")
+            assert not listener.allowed("10.0.0.1")
+        finally:
+            listener.stop()
+            state.loxone_listener = None
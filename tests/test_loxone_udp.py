@@ -0,0 +1,440 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_loxone_udp.py – Tests for the persistent, batching Loxone UDP sender
+
+import json
+import socket
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+import app.loxone_udp as loxone_udp
+import app.state as state
+from app.adapters.hmip_websocket import _handle_frame
+from app.adapters.hmip_store import HmIPStateStore
+from app.loxone_udp import (_MAX_DATAGRAM, ChangeFilter, PushWorker, RateLimiter, ResyncJob, TcpSender, UdpSender,
+                            configure_push, get_sender, pack_datagrams, push_event_devices, push_stats,
+                            trigger_resync)
+from tests.helpers import wait_for
+
+
+@pytest.fixture(autouse=True)
+def _fresh_senders():
+    loxone_udp._senders.clear()
+    loxone_udp._sinks = []
+    loxone_udp._change_filter = ChangeFilter()
+    saved_limiter, saved_resync = loxone_udp._rate_limiter, loxone_udp._resync
+    loxone_udp._resync = ResyncJob()
+    yield
+    loxone_udp._rate_limiter.stop()
+    loxone_udp._rate_limiter = saved_limiter
+    loxone_udp._resync.stop()
+    loxone_udp._resync = saved_resync
+    for sender in loxone_udp._senders.values():
+        sender.close()
+    loxone_udp._senders.clear()
+
+
+@pytest.fixture()
+def sent():
+    out = []
+    with patch.object(socket.socket, "sendto", lambda self, data, addr: out.append((data, addr))):
+        yield out
+
+
+def _event(devices):
+    return {"body": {"eventTransaction": {"events": {
+        str(i): {"device": dev} for i, dev in enumerate(devices)}}}}
+
+
+class TestPackDatagrams:
+    def test_lines_never_split_and_size_bounded(self):
+        lines = [f"hmip_DEV{i:04d}_ch1_currentPowerConsumption@{i}.5\r\n" for i in range(200)]
+        packets = pack_datagrams(lines)
+        assert len(packets) > 1
+        assert all(len(p) <= _MAX_DATAGRAM for p in packets)
+        assert b"".join(packets).decode() == "".join(lines)
+        assert all(p.endswith(b"\r\n") for p in packets)
+
+    def test_empty(self):
+        assert pack_datagrams([]) == []
+
+
+class TestUdpSender:
+    def test_socket_reused_across_sends(self, sent):
+        with patch("app.loxone_udp.socket.socket", wraps=socket.socket) as factory:
+            sender = UdpSender("127.0.0.1", 7777)
+            sender.send_lines(["a@1\r\n"])
+            sender.send_lines(["b@2\r\n"])
+            assert factory.call_count == 1
+        sender.close()
+        assert sender.datagrams == 2
+
+    def test_error_drops_socket(self):
+        sender = UdpSender("127.0.0.1", 7777)
+        with patch.object(socket.socket, "sendto", side_effect=OSError("unreachable")):
+            assert sender.send_lines(["a@1\r\n"]) == 0
+        assert sender.errors == 1
+        assert sender._sock is None
+
+    def test_address_resolved_once(self, sent):
+        sender = UdpSender("localhost", 7777)
+        with patch("app.loxone_udp.socket.getaddrinfo", wraps=socket.getaddrinfo) as resolve:
+            sender.send_lines(["a@1\r\n"])
+            sender.send_lines(["b@2\r\n"])
+            sender.refresh_address(max_age_s=300)
+            assert resolve.call_count == 1
+            sender.refresh_address(max_age_s=0)
+            assert resolve.call_count == 2
+        sender.close()
+
+    def test_failed_refresh_keeps_previous_address(self):
+        sender = UdpSender("127.0.0.1", 7777)
+        addr = sender.refresh_address()
+        with patch("app.loxone_udp.socket.getaddrinfo", side_effect=socket.gaierror("dns down")):
+            assert sender.refresh_address() == addr
+        assert sender.resolve_errors == 1
+
+    def test_get_sender_is_per_target(self):
+        assert get_sender("127.0.0.1", 7777) is get_sender("127.0.0.1", 7777)
+        assert get_sender("127.0.0.1", 7777) is not get_sender("127.0.0.1", 7778)
+
+
+class TestPushEventDevices:
+    def test_whole_transaction_in_one_datagram(self, sent):
+        push_event_devices("127.0.0.1", 7777, _event([
+            {"id": "D1", "functionalChannels": {"0": {"lowBat": False}, "1": {"on": True}}},
+            {"id": "D2", "functionalChannels": {"1": {"dimLevel": 0.5}}},
+        ]))
+        assert len(sent) == 1
+        payload, addr = sent[0]
+        assert addr == ("127.0.0.1", 7777)
+        assert payload.decode() == "hmip_D1_ch0_lowBat@0\r\nhmip_D1_ch1_on@1\r\nhmip_D2_ch1_dimLevel@0.5\r\n"
+
+    def test_nothing_relevant_sends_nothing(self, sent):
+        push_event_devices("127.0.0.1", 7777, _event([{"id": "D1", "functionalChannels": {"0": {"x": 1}}}]))
+        assert sent == []
+
+
+def _offer(f, name, field, value):
+    if not f.changed(name, field, value):
+        return False
+    f.record(name, value)
+    return True
+
+
+class TestChangeFilter:
+    def test_unchanged_values_suppressed(self, sent):
+        event = _event([{"id": "D1", "functionalChannels": {"1": {"on": True, "dimLevel": 0.5}}}])
+        push_event_devices("127.0.0.1", 7777, event)
+        push_event_devices("127.0.0.1", 7777, event)
+        assert len(sent) == 1
+        push_event_devices("127.0.0.1", 7777,
+                           _event([{"id": "D1", "functionalChannels": {"1": {"on": True, "dimLevel": 0.6}}}]))
+        assert sent[-1][0].decode() == "hmip_D1_ch1_dimLevel@0.6\r\n"
+        stats = push_stats()
+        assert stats["values_sent"] == 3
+        assert stats["values_suppressed"] == 3
+
+    def test_absolute_deadband_measured_from_last_sent(self):
+        f = ChangeFilter()
+        f.configure(deadbands={"actualTemperature": 0.5})
+        assert _offer(f, "t", "actualTemperature", 20.0)
+        assert not _offer(f, "t", "actualTemperature", 20.3)
+        assert not _offer(f, "t", "actualTemperature", 20.4)
+        assert _offer(f, "t", "actualTemperature", 20.5)
+
+    def test_relative_deadband(self):
+        f = ChangeFilter()
+        f.configure(deadbands={"currentPowerConsumption": {"abs": 0.5, "rel": 0.1}})
+        assert _offer(f, "p", "currentPowerConsumption", 100.0)
+        assert not _offer(f, "p", "currentPowerConsumption", 109.0)
+        assert _offer(f, "p", "currentPowerConsumption", 111.0)
+
+    def test_deadband_only_for_configured_fields(self):
+        f = ChangeFilter()
+        f.configure(deadbands={"actualTemperature": 5})
+        assert _offer(f, "s", "dimLevel", 0.5)
+        assert _offer(f, "s", "dimLevel", 0.51)
+
+    def test_disabled_sends_everything(self):
+        f = ChangeFilter()
+        f.configure(enabled=False)
+        assert _offer(f, "x", "on", 1)
+        assert _offer(f, "x", "on", 1)
+
+    def test_check_does_not_record(self):
+        f = ChangeFilter()
+        assert f.changed("x", "on", 1)
+        assert f.changed("x", "on", 1)
+
+    def test_failed_send_is_retried(self):
+        event = _event([{"id": "D1", "functionalChannels": {"1": {"on": True}}}])
+        with patch.object(socket.socket, "sendto", side_effect=OSError("unreachable")):
+            push_event_devices("127.0.0.1", 7777, event)
+        out = []
+        with patch.object(socket.socket, "sendto", lambda self, data, addr: out.append(data)):
+            push_event_devices("127.0.0.1", 7777, event)
+        assert out == [b"hmip_D1_ch1_on@1\r\n"]
+
+    def test_configure_push_from_config(self, sent):
+        configure_push({"change_only": False})
+        event = _event([{"id": "D1", "functionalChannels": {"1": {"on": True}}}])
+        push_event_devices("127.0.0.1", 7777, event)
+        push_event_devices("127.0.0.1", 7777, event)
+        assert len(sent) == 2
+
+    def test_reset_forgets_last_values(self):
+        f = ChangeFilter()
+        _offer(f, "x", "on", 1)
+        f.reset()
+        assert _offer(f, "x", "on", 1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter:
+    @pytest.fixture()
+    def limiter(self):
+        delivered = []
+        clock = FakeClock()
+        limiter = RateLimiter(delivered.extend, tick_s=0.1, slots=16, clock=clock)
+        limiter._ensure_thread = lambda: None
+        limiter.configure(fields={"currentPowerConsumption": 5})
+        limiter.delivered, limiter.clock = delivered, clock
+        return limiter
+
+    def _admit(self, limiter, value, name="p", device="D1", field="currentPowerConsumption"):
+        return limiter.admit(name, device, field, ("h", 1, f"{name}@{value}\r\n"))
+
+    def test_first_value_immediate_then_trailing_latest(self, limiter):
+        assert self._admit(limiter, 1)
+        limiter.clock.now += 1
+        assert not self._admit(limiter, 2)
+        limiter.clock.now += 1
+        assert not self._admit(limiter, 3)
+        assert limiter.advance(limiter.clock.now + 2.9) == 0
+        assert limiter.advance(limiter.clock.now + 3.1) == 1
+        assert limiter.delivered == [("h", 1, "p@3\r\n")]
+        assert limiter.held() == 0
+
+    def test_interval_restarts_after_trailing_delivery(self, limiter):
+        self._admit(limiter, 1)
+        limiter.clock.now += 1
+        self._admit(limiter, 2)
+        limiter.clock.now += 4.1
+        limiter.advance()
+        limiter.clock.now += 1
+        assert not self._admit(limiter, 3)
+
+    def test_due_beyond_one_wheel_revolution(self, limiter):
+        limiter.configure(fields={"currentPowerConsumption": 60})
+        self._admit(limiter, 1)
+        self._admit(limiter, 2)
+        limiter.clock.now += 30
+        assert limiter.advance() == 0
+        limiter.clock.now += 30.1
+        assert limiter.advance() == 1
+
+    def test_device_interval_overrides_field(self, limiter):
+        limiter.configure(fields={"currentPowerConsumption": 5}, devices={"D2": 0.5})
+        assert limiter.interval("D2", "currentPowerConsumption") == 0.5
+        assert limiter.interval("D1", "currentPowerConsumption") == 5
+        assert limiter.interval("D1", "on") == 0.0
+        assert self._admit(limiter, 1, name="x", field="on")
+        assert self._admit(limiter, 0, name="x", field="on")
+
+
+class TestPushRateLimited:
+    def test_trailing_value_sent_by_wheel_thread(self, sent):
+        loxone_udp._rate_limiter = RateLimiter(loxone_udp._deliver_held, tick_s=0.01)
+        configure_push({"min_interval_s": {"fields": {"currentPowerConsumption": 0.1}}})
+        for watts in (10, 11, 12):
+            push_event_devices("127.0.0.1", 7777, _event([
+                {"id": "M1", "functionalChannels": {"1": {"currentPowerConsumption": watts}}}]))
+        assert [p.decode() for p, _ in sent] == ["hmip_M1_ch1_currentPowerConsumption@10\r\n"]
+        assert wait_for(lambda: len(sent) == 2)
+        assert sent[1][0].decode() == "hmip_M1_ch1_currentPowerConsumption@12\r\n"
+        assert push_stats()["values_deferred"] == 2
+
+
+class TestPushWorker:
+    def test_push_runs_on_worker_thread(self, sent):
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        worker = PushWorker()
+        worker.start()
+        try:
+            worker.submit(_event([{"id": "D1", "functionalChannels": {"1": {"on": True}}}]))
+            assert wait_for(lambda: worker.stats()["processed"] == 1)
+            assert sent[0][0].decode() == "hmip_D1_ch1_on@1\r\n"
+        finally:
+            worker.stop()
+
+    def test_full_queue_drops_oldest(self):
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        worker = PushWorker(maxsize=2)
+        assert worker.submit({"n": 1})
+        assert worker.submit({"n": 2})
+        assert not worker.submit({"n": 3})
+        assert [item[1]["n"] for item in worker._items] == [2, 3]
+        assert worker.stats()["dropped"] == 1
+
+    def test_frame_handler_only_enqueues(self, sent):
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        state.loxone_push = PushWorker()
+        with patch("app.adapters.hmip_websocket.save_system_state"):
+            _handle_frame(json.dumps({"type": "HMIP_SYSTEM_EVENT", **_event(
+                [{"id": "D1", "functionalChannels": {"1": {"on": True}}}])}))
+        assert sent == []
+        assert state.loxone_push.depth() == 1
+
+
+class TestSinks:
+    def _push(self, devices):
+        loxone_udp.push_event(_event(devices))
+
+    def test_fan_out_with_filters(self, sent):
+        configure_push({"miniserver_ip": "127.0.0.1", "udp_port": 7001, "sinks": [
+            {"host": "127.0.0.1", "port": 7002, "include_fields": ["currentPower*", "energyCounter"]},
+            {"host": "127.0.0.1", "port": 7003, "exclude_devices": ["3014F711*"]},
+        ]})
+        self._push([
+            {"id": "3014F7110000", "functionalChannels": {"1": {"on": True, "currentPowerConsumption": 12.5}}},
+            {"id": "ABC", "functionalChannels": {"1": {"on": False}}},
+        ])
+        by_port = {addr[1]: payload.decode() for payload, addr in sent}
+        assert by_port[7001] == ("hmip_3014F7110000_ch1_on@1\r\n"
+                                 "hmip_3014F7110000_ch1_currentPowerConsumption@12.5\r\nhmip_ABC_ch1_on@0\r\n")
+        assert by_port[7002] == "hmip_3014F7110000_ch1_currentPowerConsumption@12.5\r\n"
+        assert by_port[7003] == "hmip_ABC_ch1_on@0\r\n"
+        assert [s["target"] for s in push_stats()["sinks"]] == [
+            "udp://127.0.0.1:7001", "udp://127.0.0.1:7002", "udp://127.0.0.1:7003"]
+
+    def test_line_formatted_once_for_all_sinks(self, sent):
+        configure_push({"sinks": [{"host": "127.0.0.1", "port": p} for p in (7001, 7002)]})
+        with patch("app.loxone_udp.channel_values", wraps=loxone_udp.channel_values) as values:
+            self._push([{"id": "D1", "functionalChannels": {"1": {"on": True}}}])
+        assert values.call_count == 1
+        assert len(sent) == 2
+
+    def test_tcp_sink(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        try:
+            port = server.getsockname()[1]
+            configure_push({"sinks": [{"host": "127.0.0.1", "port": port, "protocol": "tcp"}]})
+            self._push([{"id": "D1", "functionalChannels": {"1": {"on": True, "dimLevel": 0.5}}}])
+            server.settimeout(2)
+            conn, _ = server.accept()
+            with conn:
+                conn.settimeout(2)
+                assert conn.recv(1024) == b"hmip_D1_ch1_on@1\r\nhmip_D1_ch1_dimLevel@0.5\r\n"
+        finally:
+            server.close()
+
+
+class TestTcpSender:
+    def _free_port(self):
+        probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        return port
+
+    def test_failed_target_skipped_with_backoff(self):
+        sender = TcpSender("127.0.0.1", self._free_port())
+        try:
+            assert sender.send_lines(["a@1\r\n"]) == 1
+            assert wait_for(lambda: sender.errors == 1 and sender.down)
+            assert sender.send_lines(["b@2\r\n"]) == 0
+            assert sender.skipped == 1
+            sender._down_until = 0.0
+            sender.send_lines(["c@3\r\n"])
+            assert wait_for(lambda: sender.errors == 2)
+            assert sender._backoff == 2 * TcpSender.backoff_initial_s
+        finally:
+            sender.close()
+
+    def test_slow_target_does_not_block_caller(self):
+        release = threading.Event()
+        sender = TcpSender("127.0.0.1", 7777)
+
+        def hanging_open(addr):
+            release.wait(5)
+            raise OSError("timeout")
+
+        sender._open = hanging_open
+        try:
+            started = time.monotonic()
+            for i in range(3):
+                sender.send_lines([f"v@{i}\r\n"])
+            assert time.monotonic() - started < 0.5
+        finally:
+            release.set()
+            sender.close()
+
+
+_DEVICES = {
+    "D1": {"id": "D1", "functionalChannels": {"0": {"lowBat": False}, "1": {"on": True, "dimLevel": 0.5}}},
+    "D2": {"id": "D2", "functionalChannels": {"1": {"actualTemperature": 21.5}}},
+}
+
+
+class TestResync:
+    def test_pushes_everything_and_primes_change_filter(self, sent):
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        push_event_devices("127.0.0.1", 7777, _event([_DEVICES["D1"]]))
+        job = ResyncJob(source=lambda: _DEVICES)
+        assert job.run_once("test") == 4
+        assert sent[-1][0].decode() == ("hmip_D1_ch0_lowBat@0\r\nhmip_D1_ch1_on@1\r\n"
+                                        "hmip_D1_ch1_dimLevel@0.5\r\nhmip_D2_ch1_actualTemperature@21.5\r\n")
+        push_event_devices("127.0.0.1", 7777, _event([_DEVICES["D2"]]))
+        assert len(sent) == 2
+
+    def test_paced_between_packets(self, sent, monkeypatch):
+        monkeypatch.setattr(loxone_udp, "_MAX_DATAGRAM", 60)
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        sleeps = []
+        job = ResyncJob(source=lambda: _DEVICES, packets_per_s=4, sleep=sleeps.append)
+        job.run_once()
+        assert len(sent) == 3
+        assert sleeps == [0.25] * 2
+        assert job.stats()["packets"] == 3
+
+    def test_respects_sink_filters(self, sent):
+        configure_push({"sinks": [{"host": "127.0.0.1", "port": 7001, "include_devices": ["D2"]}]})
+        ResyncJob(source=lambda: _DEVICES).run_once()
+        assert sent[0][0].decode() == "hmip_D2_ch1_actualTemperature@21.5\r\n"
+
+    def test_trigger_runs_on_thread_and_coalesces(self, sent):
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        assert trigger_resync("api")
+        assert not trigger_resync("api")
+        loxone_udp._resync.start(lambda: _DEVICES)
+        assert wait_for(lambda: loxone_udp._resync.runs == 1)
+        assert loxone_udp._resync.last_reason == "api"
+
+    def test_snapshot_trigger_can_be_disabled(self):
+        configure_push({"miniserver_ip": "127.0.0.1", "resync_on_snapshot": False})
+        assert not trigger_resync("snapshot")
+        assert trigger_resync("api")
+
+    def test_api_endpoint(self, flask_client, tmp_snapshot):
+        state.REQUIRE_API_KEY = False
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace({"type": "HMIP_SYSTEM_RESPONSE", "body": {"body": {"devices": _DEVICES}}})
+        state.hmip_store = store
+        assert flask_client.post("/loxone/resync").status_code == 409
+        configure_push({"miniserver_ip": "127.0.0.1"})
+        r = flask_client.post("/loxone/resync")
+        assert r.status_code == 202
+        assert r.get_json()["status"] == "queued"
+        assert loxone_udp._resync.stats()["requested"] == "api"
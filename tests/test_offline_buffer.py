@@ -0,0 +1,132 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_offline_buffer.py – Tests for buffering HCU commands across WebSocket reconnects
+
+import pytest
+
+import app.state as state
+from app.adapters.hmip_messages import send_hmip_set_switch
+from app.adapters.hmip_websocket import _drop_pending, _register_pending
+from app.adapters.hmip_writer import WsWriter
+from tests.helpers import FakeConn, wait_for
+
+
+@pytest.fixture()
+def offline():
+    saved = state.conn
+    state.conn = None
+    yield
+    state.conn = saved
+
+
+def _queue_switch(writer, device, wait=False):
+    with state.pending_lock:
+        rid = send_hmip_set_switch(writer, device, True, 0)
+        future = _register_pending(rid, "/hmip/device/control/setSwitchState", with_future=wait)
+    return rid, future
+
+
+class TestOfflineBuffer:
+    def test_buffered_while_disconnected_and_flushed_after_resume(self, offline):
+        writer = WsWriter(offline_buffer_size=10)
+        writer.start()
+        try:
+            rids = [_queue_switch(writer, f"d{i}")[0] for i in range(3)]
+            assert wait_for(lambda: writer.offline_stats()["depth"] == 3)
+            state.conn = FakeConn()
+            writer.resume()
+            assert wait_for(lambda: len(state.conn.ids()) == 3)
+            assert state.conn.ids() == rids
+            assert writer.offline_stats()["flushed"] == 3
+        finally:
+            writer.stop()
+
+    def test_new_commands_wait_behind_buffer_until_resume(self, offline):
+        writer = WsWriter(offline_buffer_size=10)
+        writer.start()
+        try:
+            first, _ = _queue_switch(writer, "d1")
+            assert wait_for(lambda: writer.offline_stats()["depth"] == 1)
+            state.conn = FakeConn()
+            second, _ = _queue_switch(writer, "d2")
+            assert wait_for(lambda: writer.offline_stats()["depth"] == 2)
+            assert state.conn.ids() == []
+            writer.resume()
+            assert wait_for(lambda: state.conn.ids() == [first, second])
+        finally:
+            writer.stop()
+
+    def test_expired_while_still_disconnected(self, offline, monkeypatch):
+        monkeypatch.setattr("app.adapters.hmip_writer._OFFLINE_EXPIRE_S", 0.01)
+        writer = WsWriter(offline_buffer_size=10, offline_ttl_s=0.05)
+        writer.start()
+        try:
+            rid, future = _queue_switch(writer, "d1", wait=True)
+            assert future.result(timeout=1)["error"] == "expired"
+            assert writer.offline_stats()["depth"] == 0
+            assert rid not in state.pending
+        finally:
+            writer.stop()
+
+    def test_expired_commands_reported(self, offline):
+        writer = WsWriter(offline_buffer_size=10, offline_ttl_s=0)
+        writer.start()
+        try:
+            rid, future = _queue_switch(writer, "d1", wait=True)
+            assert wait_for(lambda: writer.offline_stats()["depth"] == 1)
+            state.conn = FakeConn()
+            writer.resume()
+            assert future.result(timeout=1)["error"] == "expired"
+            stats = writer.offline_stats()
+            assert stats["expired"] == 1
+            assert stats["last_expired"][0]["id"] == rid
+            assert rid not in state.pending
+            assert state.conn.ids() == []
+        finally:
+            writer.stop()
+
+    def test_overflow_evicts_oldest(self, offline):
+        writer = WsWriter(offline_buffer_size=2)
+        writer.start()
+        try:
+            rids = [_queue_switch(writer, f"d{i}")[0] for i in range(3)]
+            assert wait_for(lambda: writer.offline_stats()["expired"] == 1)
+            assert writer.offline_stats()["last_expired"][0] == {
+                "id": rids[0], "path": "/hmip/device/control/setSwitchState",
+                "age_s": 0.0, "reason": "overflow"}
+        finally:
+            writer.stop()
+
+    def test_disabled_drops_without_connection(self, offline):
+        writer = WsWriter()
+        writer.start()
+        try:
+            writer.send("x")
+            assert wait_for(lambda: writer.dropped == 1)
+            assert writer.offline_stats() is None
+        finally:
+            writer.stop()
+
+
+class TestDropPendingKeepsUnsent:
+    def test_unsent_commands_stay_pending(self, offline):
+        writer = WsWriter(offline_buffer_size=10)
+        queued, _ = _queue_switch(writer, "d1")
+        _register_pending("in-flight", "/test")
+        _drop_pending(writer.unsent_ids())
+        assert queued in state.pending
+        assert "in-flight" not in state.pending
+
+
+class TestRoutesAcceptWhileBuffering:
+    def test_switch_accepted_without_connection(self, flask_client, offline):
+        state.REQUIRE_API_KEY = False
+        state.ws_writer = WsWriter(offline_buffer_size=10)
+        r = flask_client.post("/hmipSwitch", json={"device": "d1", "on": True})
+        assert r.status_code == 200
+        assert state.ws_writer.depth() == 1
+
+    def test_switch_rejected_without_buffer(self, flask_client, offline):
+        state.REQUIRE_API_KEY = False
+        state.ws_writer = WsWriter()
+        r = flask_client.post("/hmipSwitch", json={"device": "d1", "on": True})
+        assert r.status_code == 503
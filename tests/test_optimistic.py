@@ -0,0 +1,176 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_optimistic.py – Tests for optimistic local state updates and their reconciliation
+
+import json
+import time
+
+import pytest
+
+import app.state as state
+from app.adapters.hmip_store import HmIPStateStore
+from app.adapters.hmip_websocket import _cleanup_pending, _handle_frame, _register_pending
+from app.change_feed import ChangeFeed
+
+
+@pytest.fixture()
+def store(tmp_snapshot):
+    state.change_feed = ChangeFeed()
+    store = HmIPStateStore(tmp_snapshot, feed=state.change_feed)
+    store.replace({
+        "type": "HMIP_SYSTEM_RESPONSE",
+        "body": {"body": {"devices": {
+            "d1": {"id": "d1", "functionalChannels": {"1": {"on": False, "dimLevel": 0.0}}},
+        }}},
+    })
+    state.hmip_store = store
+    return store
+
+
+def _channel(store):
+    return store.get_device("d1")["functionalChannels"]["1"]
+
+
+def _event(channel):
+    return {"type": "HMIP_SYSTEM_EVENT", "body": {"eventTransaction": {"events": {
+        "0": {"device": {"id": "d1", "functionalChannels": {"1": channel}}}}}}}
+
+
+class TestStoreOptimistic:
+    def test_apply_changes_value_and_revision(self, store):
+        rev = store.revision()
+        assert store.apply_optimistic("r1", "d1", 1, {"on": True}) == rev + 1
+        assert _channel(store)["on"] is True
+        assert store.pending_fields("d1", 1) == ["on"]
+        _, change = state.change_feed.read(0)[0][-1]
+        assert change["pending"] is True
+
+    def test_overlay_not_persisted(self, store, tmp_snapshot):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        store.apply_event({"type": "HMIP_SYSTEM_EVENT", "body": {"eventTransaction": {"events": {
+            "0": {"device": {"id": "d1", "label": "Flur"}}}}}})
+        store.flush()
+        with open(tmp_snapshot, "r", encoding="utf-8") as f:
+            persisted = json.load(f)["body"]["body"]["devices"]["d1"]
+        assert persisted["label"] == "Flur"
+        assert persisted["functionalChannels"]["1"]["on"] is False
+        assert store.snapshot()["body"]["body"]["devices"]["d1"]["functionalChannels"]["1"]["on"] is False
+        assert store.get_device("d1")["label"] == "Flur"
+        assert _channel(store)["on"] is True
+
+    def test_confirmed_devices_exclude_overlay(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        assert _channel(store)["on"] is True
+        assert store.confirmed_devices()["d1"]["functionalChannels"]["1"]["on"] is False
+
+    def test_noop_and_unknown_fields_ignored(self, store):
+        assert store.apply_optimistic("r1", "d1", 1, {"on": False}) is None
+        assert store.apply_optimistic("r2", "d1", 1, {"unknownField": 1}) is None
+        assert store.apply_optimistic("r3", "dX", 1, {"on": True}) is None
+
+    def test_event_confirms_and_bumps_revision(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        rev = store.device_revision("d1")
+        store.apply_event(_event({"on": True, "dimLevel": 0.0}))
+        assert store.pending_fields("d1", 1) == []
+        assert store.device_revision("d1") > rev
+        assert store.optimistic_stats()["confirmed"] == 1
+
+    def test_event_with_other_value_wins_after_ack(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"dimLevel": 0.8})
+        store.ack_optimistic("r1")
+        store.apply_event(_event({"on": True, "dimLevel": 0.5}))
+        assert _channel(store)["dimLevel"] == 0.5
+        assert store.optimistic_stats()["overridden"] == 1
+
+    def test_stale_event_before_ack_keeps_newest(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"dimLevel": 0.8})
+        store.apply_event(_event({"dimLevel": 0.5}))
+        assert _channel(store)["dimLevel"] == 0.8
+        assert store.pending_fields("d1", 1) == ["dimLevel"]
+
+    def test_event_settles_only_matching_command(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"dimLevel": 0.3})
+        store.apply_optimistic("r2", "d1", 1, {"dimLevel": 0.9})
+        store.apply_event(_event({"dimLevel": 0.3}))
+        assert _channel(store)["dimLevel"] == 0.9
+        assert store.pending_fields("d1", 1) == ["dimLevel"]
+        assert store.optimistic_stats()["confirmed"] == 1
+
+    def test_event_without_field_does_not_confirm(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        store.apply_event(_event({"dimLevel": 0.2}))
+        assert store.pending_fields("d1", 1) == ["on"]
+        assert store.optimistic_stats()["confirmed"] == 0
+
+    def test_event_revision_ignores_optimistic_updates(self, store):
+        rev = store.device_event_revision("d1")
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        store.replace({"type": "HMIP_SYSTEM_RESPONSE", "body": {"body": {"devices": {
+            "d1": {"id": "d1", "functionalChannels": {"1": {"on": False, "dimLevel": 0.0}}}}}}})
+        assert store.device_event_revision("d1") == rev
+        assert store.device_revision("d1") == store.revision()
+
+    def test_rollback_restores_previous_value(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        assert store.rollback_optimistic("r1")
+        assert _channel(store)["on"] is False
+        assert store.pending_fields("d1", 1) == []
+
+    def test_rollback_keeps_newer_command(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        store.apply_optimistic("r2", "d1", 1, {"dimLevel": 0.4})
+        store.apply_optimistic("r3", "d1", 1, {"on": False})
+        store.rollback_optimistic("r1")
+        assert _channel(store)["on"] is False
+        assert store.pending_fields("d1", 1) == ["dimLevel", "on"]
+
+    def test_expire(self, store):
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        assert store.expire_optimistic(60) == 0
+        assert store.expire_optimistic(0) == 1
+        assert _channel(store)["on"] is False
+        assert store.optimistic_stats()["expired"] == 1
+
+
+class TestAckReconciliation:
+    def test_error_ack_rolls_back(self, store):
+        _register_pending("r1", "/hmip/device/control/setSwitchState")
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        state.pending["r1"]["optimistic"] = True
+        _handle_frame(json.dumps({"type": "HMIP_SYSTEM_RESPONSE", "id": "r1", "body": {"code": 400}}))
+        assert _channel(store)["on"] is False
+
+    def test_ok_ack_keeps_pending_until_event(self, store):
+        _register_pending("r1", "/hmip/device/control/setSwitchState")
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        state.pending["r1"]["optimistic"] = True
+        _handle_frame(json.dumps({"type": "HMIP_SYSTEM_RESPONSE", "id": "r1", "body": {"code": 200}}))
+        assert store.pending_fields("d1", 1) == ["on"]
+        store.apply_event(_event({"on": False}))
+        assert _channel(store)["on"] is False
+
+    def test_pending_expiry_rolls_back(self, store):
+        _register_pending("r1", "/hmip/device/control/setSwitchState")
+        store.apply_optimistic("r1", "d1", 1, {"on": True})
+        state.pending["r1"]["optimistic"] = True
+        state.pending["r1"]["ts"] = time.time() - state.PENDING_TTL - 1
+        _cleanup_pending()
+        assert _channel(store)["on"] is False
+
+
+@pytest.mark.usefixtures("writer")
+class TestRoutes:
+    def test_switch_is_visible_immediately(self, flask_client, store):
+        r = flask_client.post("/hmipSwitch", json={"device": "d1", "on": True, "channelIndex": 1})
+        rid = r.get_json()["request_id"]
+        assert state.pending[rid]["optimistic"] is True
+        r = flask_client.get("/hmipState?device=d1&channelIndex=1")
+        assert r.get_json()["on"] is True
+        assert r.headers["X-Pending"] == "on"
+
+    def test_disabled_by_config(self, flask_client, store):
+        state.config_internal = {**state.config_internal, "optimistic_updates": False}
+        flask_client.post("/hmipDimmer", json={"device": "d1", "dimLevel": 50})
+        r = flask_client.get("/hmipState?device=d1&channelIndex=1")
+        assert r.get_json()["dimLevel"] == 0.0
+        assert "X-Pending" not in r.headers
@@ -53,3 +53,37 @@ class TestCleanupPending:
         with state.pending_lock:
             assert "old" not in state.pending
             assert "new" in state.pending
+
+
+class TestPendingOrderAndStats:
+    def test_cleanup_stops_at_first_live_entry(self):
+        _register_pending("live", "/a")
+        with state.pending_lock:
+            # hinter einem gültigen Eintrag wird nicht mehr gesucht
+            state.pending["late-old"] = {"path": "/b", "ts": time.time() - 200}
+        _cleanup_pending()
+        with state.pending_lock:
+            assert list(state.pending) == ["live", "late-old"]
+
+    def test_counters(self):
+        before = dict(state.pending_stats)
+        _register_pending("c1", "/a")
+        _resolve_pending("c1")
+        _resolve_pending("unbekannt")
+        with state.pending_lock:
+            state.pending["c2"] = {"path": "/b", "ts": time.time() - 200}
+        _cleanup_pending()
+        stats = state.pending_stats
+        assert stats["registered"] - before["registered"] == 1
+        assert stats["resolved"] - before["resolved"] == 1
+        assert stats["uncorrelated"] - before["uncorrelated"] == 1
+        assert stats["expired"] - before["expired"] == 1
+
+    def test_many_entries_expire_in_order(self):
+        with state.pending_lock:
+            for i in range(500):
+                state.pending[f"old-{i}"] = {"path": "/x", "ts": time.time() - 200}
+        _register_pending("fresh", "/y")
+        _cleanup_pending()
+        with state.pending_lock:
+            assert list(state.pending) == ["fresh"]
@@ -0,0 +1,134 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_send_scheduler.py – Tests for the prioritised, duty-cycle-aware send scheduler
+
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.adapters.hmip_messages import (send_hmip_set_alarm_signal_optical, send_hmip_set_dim_level,
+                                       send_hmip_set_point_temperature, send_hmip_set_switch)
+from app.adapters.hmip_scheduler import PRIO_DEFAULT, PRIO_SWITCH, OutboundMessage, TokenBucket, duty_cycle_factor
+from app.adapters.hmip_writer import BatchSink, WsWriter
+from tests.helpers import wait_for
+
+
+class TestPriorityOrder:
+    def test_queued_commands_leave_by_priority(self, conn):
+        writer = WsWriter()
+        send_hmip_set_point_temperature(writer, "T1", 21.0, 1)
+        send_hmip_set_dim_level(writer, "D1", 0.5, 1)
+        send_hmip_set_switch(writer, "S1", True, 0)
+        send_hmip_set_alarm_signal_optical(writer, "A1", "FULL_ALARM", 2)
+        writer.start()
+        try:
+            assert wait_for(lambda: len(conn.paths()) == 4)
+        finally:
+            writer.stop()
+        assert conn.paths() == ["setAlarmSignalOptical", "setSwitchState",
+                             "setDimLevel", "setSetPointTemperature"]
+
+    def test_same_device_keeps_fifo_order(self, conn):
+        writer = WsWriter()
+        send_hmip_set_dim_level(writer, "D1", 0.5, 1)
+        send_hmip_set_switch(writer, "D1", False, 1)
+        send_hmip_set_switch(writer, "S2", True, 0)
+        writer.start()
+        try:
+            assert wait_for(lambda: len(conn.paths()) == 3)
+        finally:
+            writer.stop()
+        # S2 darf den Dimmer überholen, das „Aus“ für D1 nicht
+        assert conn.paths() == ["setSwitchState", "setDimLevel", "setSwitchState"]
+
+    def test_alarm_still_overtakes_same_device(self, conn):
+        writer = WsWriter()
+        send_hmip_set_dim_level(writer, "A1", 0.5, 2)
+        send_hmip_set_alarm_signal_optical(writer, "A1", "FULL_ALARM", 2)
+        writer.start()
+        try:
+            assert wait_for(lambda: len(conn.paths()) == 2)
+        finally:
+            writer.stop()
+        assert conn.paths() == ["setAlarmSignalOptical", "setDimLevel"]
+
+    def test_alarm_overtakes_throttled_dimmer_burst(self, conn):
+        writer = WsWriter(rate=5, burst=1, duty_source=lambda: None)
+        for i in range(5):
+            send_hmip_set_dim_level(writer, f"D{i}", 0.5, 1)
+        writer.start()
+        try:
+            assert wait_for(lambda: len(conn.paths()) >= 1)
+            send_hmip_set_alarm_signal_optical(writer, "A1", "FULL_ALARM", 2)
+            assert wait_for(lambda: "setAlarmSignalOptical" in conn.paths(), timeout=0.15)
+            assert conn.paths().index("setAlarmSignalOptical") < 3
+        finally:
+            writer.stop()
+
+
+class TestOutboundMessage:
+    def test_fields_from_message(self):
+        sink = BatchSink()
+        rid = send_hmip_set_switch(sink, "S1", True, 2)
+        msg = OutboundMessage.parse(sink.messages[0])
+        assert (msg.rid, msg.path, msg.target, msg.priority) == (
+            rid, "/hmip/device/control/setSwitchState", ("S1", 2), PRIO_SWITCH)
+        assert msg.data == sink.messages[0]
+
+    def test_unparseable_payload(self):
+        assert OutboundMessage.parse("kein json") == OutboundMessage("kein json", priority=PRIO_DEFAULT)
+
+    def test_writer_parses_each_message_once(self, conn):
+        writer = WsWriter(coalesce_window_ms=50)
+        with patch.object(OutboundMessage, "parse", wraps=OutboundMessage.parse) as parse:
+            send_hmip_set_dim_level(writer, "D1", 0.5, 1)
+            send_hmip_set_switch(writer, "D1", False, 1)
+        assert parse.call_count == 2
+
+
+class TestTokenBucket:
+    def test_disabled_never_waits(self):
+        bucket = TokenBucket(0, 1)
+        bucket.take(100)
+        assert bucket.wait_time() == 0.0
+
+    def test_waits_after_burst(self):
+        bucket = TokenBucket(10, 2)
+        bucket.take(2)
+        assert 0.05 < bucket.wait_time() <= 0.1
+
+    def test_batch_may_go_into_debt(self):
+        bucket = TokenBucket(10, 2)
+        bucket.take(5)
+        assert bucket.wait_time() > 0.3
+
+    def test_concurrent_take_and_read(self):
+        bucket = TokenBucket(0.001, 1000)
+        stop = threading.Event()
+        reader = threading.Thread(target=lambda: [bucket.tokens() for _ in iter(stop.is_set, True)])
+        reader.start()
+        workers = [threading.Thread(target=lambda: [bucket.take(1) for _ in range(500)]) for _ in range(4)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        stop.set()
+        reader.join()
+        assert bucket.tokens() == pytest.approx(-1000, abs=0.1)
+
+
+class TestDutyCycle:
+    def test_factor_curve(self):
+        assert duty_cycle_factor(None, 50, 90, 0.1) == 1.0
+        assert duty_cycle_factor(30, 50, 90, 0.1) == 1.0
+        assert duty_cycle_factor(70, 50, 90, 0.1) == pytest.approx(0.55)
+        assert duty_cycle_factor(95, 50, 90, 0.1) == 0.1
+
+    def test_writer_adapts_rate_to_duty_cycle(self):
+        writer = WsWriter(rate=10, duty_source=lambda: 90.0)
+        send_hmip_set_dim_level(writer, "D1", 0.5, 1)
+        writer._ready(2)
+        stats = writer.scheduler_stats()
+        assert stats["duty_cycle"] == 90.0
+        assert stats["rate"] == pytest.approx(1.0)
+        assert stats["queued_by_priority"] == {"2": 1}
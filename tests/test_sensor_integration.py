@@ -8,6 +8,8 @@ import pytest
 from flask import Flask
 
 import app.state as state
+from app.adapters.hmip_store import SystemView
+from app.adapters.hmip_writer import WsWriter
 from app.routes import bp
 
 
@@ -20,6 +22,7 @@ def client():
     app.register_blueprint(bp)
     state.REQUIRE_API_KEY = True
     state.API_KEY = "test-key"
+    state.ws_writer = WsWriter()  # nicht gestartet – send_* sind in den Tests gemockt
     with app.test_client() as c:
         with app.app_context():
             yield c
@@ -83,14 +86,14 @@ class TestHmipAlarm:
     def test_no_devices_in_snapshot_returns_404(self, client):
         state.conn = MagicMock()
         empty_snap = {"body": {"devices": {}}}
-        with patch("app.routes._load_snapshot", return_value=empty_snap):
+        with patch("app.routes._load_view", return_value=SystemView.from_snapshot(empty_snap)):
             r = client.post("/hmipAlarm", data=json.dumps({"mode": "optical"}), headers=_headers())
         assert r.status_code == 404
 
     def test_optical_alarm_all_devices(self, client):
         state.conn = MagicMock()
         snap = _snap_with_smoke_detector()
-        with patch("app.routes._load_snapshot", return_value=snap), \
+        with patch("app.routes._load_view", return_value=SystemView.from_snapshot(snap)), \
              patch("app.routes.send_hmip_set_alarm_signal_optical", return_value="rid-1") as mock_optical, \
              patch("app.routes._register_pending"):
             r = client.post("/hmipAlarm",
@@ -103,12 +106,12 @@ class TestHmipAlarm:
         # Nur SD001 hat ALARM_SIREN_CHANNEL
         assert len(body["sent"]) == 1
         assert body["sent"][0]["device"] == "SD001"
-        mock_optical.assert_called_once_with(state.conn, "SD001", "FULL_ALARM", 2)
+        mock_optical.assert_called_once_with(state.ws_writer, "SD001", "FULL_ALARM", 2)
 
     def test_both_sends_optical_and_acoustic(self, client):
         state.conn = MagicMock()
         snap = _snap_with_smoke_detector()
-        with patch("app.routes._load_snapshot", return_value=snap), \
+        with patch("app.routes._load_view", return_value=SystemView.from_snapshot(snap)), \
              patch("app.routes.send_hmip_set_alarm_signal_optical", return_value="rid-o") as mock_o, \
              patch("app.routes.send_hmip_set_alarm_signal_acoustic", return_value="rid-a") as mock_a, \
              patch("app.routes._register_pending"):
@@ -123,7 +126,7 @@ class TestHmipAlarm:
     def test_off_sends_no_alarm_signal(self, client):
         state.conn = MagicMock()
         snap = _snap_with_smoke_detector()
-        with patch("app.routes._load_snapshot", return_value=snap), \
+        with patch("app.routes._load_view", return_value=SystemView.from_snapshot(snap)), \
              patch("app.routes.send_hmip_set_alarm_signal_optical", return_value="rid-o") as mock_o, \
              patch("app.routes.send_hmip_set_alarm_signal_acoustic", return_value="rid-a") as mock_a, \
              patch("app.routes._register_pending"):
@@ -131,19 +134,19 @@ class TestHmipAlarm:
                             data=json.dumps({"mode": "off"}),
                             headers=_headers())
         assert r.status_code == 200
-        mock_o.assert_called_once_with(state.conn, "SD001", "NO_ALARM", 2)
-        mock_a.assert_called_once_with(state.conn, "SD001", "NO_ALARM", 2)
+        mock_o.assert_called_once_with(state.ws_writer, "SD001", "NO_ALARM", 2)
+        mock_a.assert_called_once_with(state.ws_writer, "SD001", "NO_ALARM", 2)
 
     def test_single_device_with_channel_override(self, client):
         state.conn = MagicMock()
-        with patch("app.routes._load_snapshot", return_value=_snap_with_smoke_detector()), \
+        with patch("app.routes._load_view", return_value=SystemView.from_snapshot(_snap_with_smoke_detector())), \
              patch("app.routes.send_hmip_set_alarm_signal_optical", return_value="rid") as mock_o, \
              patch("app.routes._register_pending"):
             r = client.post("/hmipAlarm",
                             data=json.dumps({"mode": "optical", "device": "SD001", "channelIndex": 3}),
                             headers=_headers())
         assert r.status_code == 200
-        mock_o.assert_called_once_with(state.conn, "SD001", "FULL_ALARM", 3)
+        mock_o.assert_called_once_with(state.ws_writer, "SD001", "FULL_ALARM", 3)
 
 
 # ── Thermostat-Endpoint ────────────────────────────────────────────────────────
@@ -171,7 +174,7 @@ class TestHmipThermostat:
                             data=json.dumps({"device": "TRV001", "temperature": 22.5}),
                             headers=_headers())
         assert r.status_code == 200
-        mock_t.assert_called_once_with(state.conn, "TRV001", 22.5, 1)
+        mock_t.assert_called_once_with(state.ws_writer, "TRV001", 22.5, 1)
 
     def test_custom_channel_index(self, client):
         state.conn = MagicMock()
@@ -180,7 +183,7 @@ class TestHmipThermostat:
             client.post("/hmipThermostat",
                         data=json.dumps({"device": "TRV001", "temperature": 20.0, "channelIndex": 2}),
                         headers=_headers())
-        mock_t.assert_called_once_with(state.conn, "TRV001", 20.0, 2)
+        mock_t.assert_called_once_with(state.ws_writer, "TRV001", 20.0, 2)
 
 
 # ── Bewässerungs-Endpoint ─────────────────────────────────────────────────────
@@ -201,7 +204,7 @@ class TestHmipIrrigation:
                             data=json.dumps({"device": "WHS001", "on": True}),
                             headers=_headers())
         assert r.status_code == 200
-        mock_sw.assert_called_once_with(state.conn, "WHS001", True, 1)
+        mock_sw.assert_called_once_with(state.ws_writer, "WHS001", True, 1)
         assert "geöffnet" in r.get_json()["status"]
 
     def test_close_valve(self, client):
@@ -0,0 +1,332 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_state_store.py – Tests for the in-memory HmIP state store
+
+import json
+import os
+import threading
+import time
+
+import app.adapters.hmip_store as hmip_store
+from app.adapters.hmip_store import HmIPStateStore
+
+
+def _full_snapshot():
+    return {
+        "type": "HMIP_SYSTEM_RESPONSE",
+        "body": {
+            "body": {
+                "devices": {"d1": {"id": "d1", "label": "Old", "functionalChannels": {"0": {"on": True}}}},
+                "groups": {"g1": {"id": "g1", "label": "Wohnzimmer"}},
+            },
+        },
+    }
+
+
+def _event(*entries):
+    return {
+        "type": "HMIP_SYSTEM_EVENT",
+        "body": {"eventTransaction": {"events": {str(i): e for i, e in enumerate(entries)}}},
+    }
+
+
+class TestHmIPStateStore:
+    def test_snapshot_none_without_file(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        assert store.snapshot() is None
+        assert store.age_ms() is None
+
+    def test_warm_start_from_file(self, tmp_snapshot):
+        with open(tmp_snapshot, "w", encoding="utf-8") as f:
+            json.dump(_full_snapshot(), f)
+        store = HmIPStateStore(tmp_snapshot)
+        assert store.snapshot()["body"]["body"]["devices"]["d1"]["label"] == "Old"
+
+    def test_old_layout_migrated_on_load(self, tmp_snapshot):
+        with open(tmp_snapshot, "w", encoding="utf-8") as f:
+            json.dump({"type": "HMIP_SYSTEM_RESPONSE", "body": {"home": {"id": "h", "devices": [{"id": "d1"}]}}}, f)
+        HmIPStateStore(tmp_snapshot).snapshot()
+        with open(tmp_snapshot, "r", encoding="utf-8") as f:
+            inner = json.load(f)["body"]["body"]
+        assert inner == {"home": {"id": "h"}, "devices": {"d1": {"id": "d1"}}, "groups": {}}
+
+    def test_canonical_layout_not_rewritten(self, tmp_snapshot, monkeypatch):
+        HmIPStateStore(tmp_snapshot).replace(_full_snapshot())
+        writes = []
+        monkeypatch.setattr(hmip_store, "_atomic_write", lambda *a, **kw: writes.append(a))
+        HmIPStateStore(tmp_snapshot).snapshot()
+        assert writes == []
+
+    def test_replace_persists(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        with open(tmp_snapshot, "r", encoding="utf-8") as f:
+            assert json.load(f)["type"] == "HMIP_SYSTEM_RESPONSE"
+        assert store.age_ms() is not None
+
+    def test_event_merged_in_memory_without_reading_file(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        os.remove(tmp_snapshot)  # Store darf die Datei nicht mehr lesen
+        ok = store.apply_event(_event({"device": {"id": "d1", "functionalChannels": {"0": {"on": False}}}}))
+        assert ok is True
+        dev = store.snapshot()["body"]["body"]["devices"]["d1"]
+        assert dev["functionalChannels"]["0"]["on"] is False
+        assert dev["label"] == "Old"
+
+    def test_event_without_snapshot_is_ignored(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        assert store.apply_event(_event({"device": {"id": "d1"}})) is False
+
+    def test_new_device_copy_on_write(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        before = store.snapshot()["body"]["body"]["devices"]
+        store.apply_event(_event({"device": {"id": "d2", "label": "Neu"}}))
+        after = store.snapshot()["body"]["body"]["devices"]
+        assert "d2" not in before  # Leser mit alter Referenz sehen keinen Größenwechsel
+        assert after["d2"]["label"] == "Neu"
+
+    def test_group_event_merged(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"group": {"id": "g1", "label": "Küche"}}))
+        assert store.snapshot()["body"]["body"]["groups"]["g1"]["label"] == "Küche"
+
+    def test_list_container_normalized(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace({"body": {"devices": [{"id": "d1", "label": "A"}]}})
+        store.apply_event(_event({"device": {"id": "d1", "label": "B"}}, {"device": {"id": "d2"}}))
+        devices = store.snapshot()["body"]["body"]["devices"]
+        assert devices["d1"]["label"] == "B"
+        assert devices["d2"]["id"] == "d2"
+
+
+class TestWriteBehind:
+    def _read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def test_events_coalesced_until_flush(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        store.start_flusher(interval_ms=60_000, max_dirty=1000)
+        try:
+            for label in ("A", "B", "C"):
+                store.apply_event(_event({"device": {"id": "d1", "label": label}}))
+            assert self._read(tmp_snapshot)["body"]["body"]["devices"]["d1"]["label"] == "Old"
+            assert store.flush_lag_ms() >= 0
+            assert store.flush() is True
+            assert self._read(tmp_snapshot)["body"]["body"]["devices"]["d1"]["label"] == "C"
+            assert store.flush_lag_ms() == 0
+            assert store.flush() is False  # nichts mehr zu schreiben
+        finally:
+            store.stop_flusher()
+
+    def test_max_dirty_triggers_write(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        store.start_flusher(interval_ms=60_000, max_dirty=2)
+        try:
+            first_flush = store.last_flush_ts()
+            store.apply_event(_event({"device": {"id": "d1", "label": "A"}}))
+            store.apply_event(_event({"device": {"id": "d1", "label": "B"}}))
+            for _ in range(200):
+                if store.last_flush_ts() != first_flush:
+                    break
+                time.sleep(0.01)
+            assert self._read(tmp_snapshot)["body"]["body"]["devices"]["d1"]["label"] == "B"
+        finally:
+            store.stop_flusher()
+
+    def test_stop_flusher_writes_pending_changes(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        store.start_flusher(interval_ms=60_000, max_dirty=1000, fsync=True)
+        store.apply_event(_event({"device": {"id": "d1", "label": "Shutdown"}}))
+        store.stop_flusher()
+        assert self._read(tmp_snapshot)["body"]["body"]["devices"]["d1"]["label"] == "Shutdown"
+
+    def test_sync_flush_not_under_store_lock(self, tmp_snapshot, monkeypatch):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "A"}}))
+        merge = store._merge_transaction
+
+        def slow_merge(*args, **kwargs):
+            time.sleep(0.1)  # Fenster, in dem ein paralleler flush() _write_lock hält
+            return merge(*args, **kwargs)
+
+        monkeypatch.setattr(store, "_merge_transaction", slow_merge)
+        writer = threading.Thread(target=store.apply_event, args=(_event({"device": {"id": "d1", "label": "B"}}),),
+                                  daemon=True)
+        writer.start()
+        time.sleep(0.02)
+        flusher = threading.Thread(target=store.flush, daemon=True)
+        flusher.start()
+        writer.join(3)
+        flusher.join(3)
+        assert not writer.is_alive() and not flusher.is_alive()
+        assert self._read(tmp_snapshot)["body"]["body"]["devices"]["d1"]["label"] == "B"
+
+
+class TestJournal:
+    def _store(self, tmp_path, **kw):
+        return HmIPStateStore(str(tmp_path / "state.json"), journal_path=str(tmp_path / "state.journal"), **kw)
+
+    def test_event_appended_instead_of_snapshot_rewrite(self, tmp_path):
+        store = self._store(tmp_path)
+        store.replace(_full_snapshot())
+        mtime = os.path.getmtime(tmp_path / "state.json")
+        store.apply_event(_event({"device": {"id": "d1", "label": "A"}}))
+        store.apply_event(_event({"device": {"id": "d1", "label": "B"}}))
+        with open(tmp_path / "state.journal", "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 2
+        assert os.path.getmtime(tmp_path / "state.json") == mtime
+        assert store.journal_bytes() > 0
+        assert store.flush_lag_ms() == 0  # Journal-Einträge sind bereits dauerhaft
+
+    def test_warm_start_replays_journal(self, tmp_path):
+        store = self._store(tmp_path)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "Journal"}}))
+        store.apply_event(_event({"device": {"id": "d2", "label": "Neu"}}))
+
+        restarted = self._store(tmp_path)
+        devices = restarted.snapshot()["body"]["body"]["devices"]
+        assert devices["d1"]["label"] == "Journal"
+        assert devices["d2"]["label"] == "Neu"
+
+    def test_compaction_truncates_journal(self, tmp_path):
+        store = self._store(tmp_path)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "Kompakt"}}))
+        assert store.flush() is True
+        assert store.journal_bytes() == 0
+        with open(tmp_path / "state.json", "r", encoding="utf-8") as f:
+            assert json.load(f)["body"]["body"]["devices"]["d1"]["label"] == "Kompakt"
+
+    def test_size_threshold_triggers_compaction(self, tmp_path):
+        store = self._store(tmp_path, journal_max_bytes=1)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "Groß"}}))
+        assert store.journal_bytes() == 0
+
+    def test_events_not_blocked_during_compaction(self, tmp_path, monkeypatch):
+        store = self._store(tmp_path)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "Vorher"}}))
+        writing, release = threading.Event(), threading.Event()
+        real_write = hmip_store._atomic_write
+
+        def slow_write(*args, **kw):
+            writing.set()
+            release.wait(5)
+            real_write(*args, **kw)
+
+        monkeypatch.setattr(hmip_store, "_atomic_write", slow_write)
+        flusher = threading.Thread(target=store.flush, daemon=True)
+        flusher.start()
+        try:
+            assert writing.wait(2)
+            done = threading.Event()
+            threading.Thread(target=lambda: (store.apply_event(_event({"device": {"id": "d1", "label": "Währenddessen"}})),
+                                             done.set())).start()
+            assert done.wait(1)
+        finally:
+            release.set()
+            flusher.join(5)
+        with open(tmp_path / "state.json", "r", encoding="utf-8") as f:
+            assert json.load(f)["body"]["body"]["devices"]["d1"]["label"] == "Vorher"
+        assert not os.path.exists(tmp_path / "state.journal.1")
+        restarted = self._store(tmp_path)
+        assert restarted.snapshot()["body"]["body"]["devices"]["d1"]["label"] == "Währenddessen"
+
+    def test_failed_compaction_keeps_rotated_segment(self, tmp_path, monkeypatch):
+        store = self._store(tmp_path)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "A"}}))
+
+        def failing_write(*args, **kw):
+            raise OSError("Platte voll")
+
+        monkeypatch.setattr(hmip_store, "_atomic_write", failing_write)
+        assert store.flush() is False
+        store.apply_event(_event({"device": {"id": "d1", "label": "B"}}))
+        restarted = self._store(tmp_path)
+        assert restarted.snapshot()["body"]["body"]["devices"]["d1"]["label"] == "B"
+        monkeypatch.undo()
+        assert store.flush() is True
+        assert not os.path.exists(tmp_path / "state.journal.1")
+
+    def test_truncated_last_line_is_skipped(self, tmp_path):
+        store = self._store(tmp_path)
+        store.replace(_full_snapshot())
+        store.apply_event(_event({"device": {"id": "d1", "label": "OK"}}))
+        with open(tmp_path / "state.journal", "a", encoding="utf-8") as f:
+            f.write('{"events":{"0":{"device":{"id":"d1","lab')
+        restarted = self._store(tmp_path)
+        assert restarted.snapshot()["body"]["body"]["devices"]["d1"]["label"] == "OK"
+
+
+class TestSystemView:
+    def test_get_device_dict_container(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        assert store.get_device("d1")["label"] == "Old"
+        assert store.get_device("nope") is None
+
+    def test_view_exposes_canonical_containers(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace({"body": {"home": {"id": "h1", "devices": {}}, "devices": [{"id": f"d{i}"} for i in range(300)]}})
+        view = store.view()
+        assert view.devices["d250"] == {"id": "d250"}
+        assert view.home == {"id": "h1"}
+        assert view.groups == {}
+
+    def test_view_follows_new_device(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace({"body": {"devices": [{"id": "d1", "label": "A"}]}})
+        store.apply_event(_event({"device": {"id": "d2", "label": "Neu"}}))
+        store.apply_event(_event({"device": {"id": "d2", "label": "Neu2"}}))
+        assert store.view().devices["d2"]["label"] == "Neu2"
+        assert store.view().devices is store.snapshot()["body"]["body"]["devices"]
+
+    def test_view_rebuilt_after_replace(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace({"body": {"devices": [{"id": "d1"}, {"id": "d2"}]}})
+        store.replace({"body": {"devices": [{"id": "d2", "label": "vorne"}]}})
+        assert store.get_device("d2")["label"] == "vorne"
+        assert store.get_device("d1") is None
+
+
+class TestRevisions:
+    def test_change_bumps_device_and_global_revision(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        base = store.revision()
+        assert store.device_revision("d1") == base
+        store.apply_event(_event({"device": {"id": "d1", "label": "Neu"}}))
+        assert store.revision() == base + 1
+        assert store.device_revision("d1") == base + 1
+        assert store.group_revision("g1") == base
+
+    def test_identical_event_keeps_device_revision(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        base = store.revision()
+        store.apply_event(_event({"device": {"id": "d1", "label": "Old"}}))
+        assert store.device_revision("d1") == base
+        # Bestätigung durch die HCU zählt trotzdem (min_revision bei idempotenten Befehlen)
+        assert store.revision() == base + 1
+        assert store.device_event_revision("d1") == base + 1
+
+    def test_replace_keeps_revision_of_unchanged_devices(self, tmp_snapshot):
+        store = HmIPStateStore(tmp_snapshot)
+        store.replace(_full_snapshot())
+        base = store.revision()
+        snap = _full_snapshot()
+        snap["body"]["body"]["devices"]["d2"] = {"id": "d2"}
+        store.replace(snap)
+        assert store.device_revision("d1") == base
+        assert store.device_revision("d2") == base + 1
@@ -5,11 +5,11 @@ import json
 from unittest.mock import patch
 
 from app.utils import (
-    _find_device_in_list,
     _locate_devices_container,
     _merge_device,
     _merge_functional_channels,
     _merge_group,
+    normalize_snapshot,
     save_system_state,
 )
 
@@ -135,20 +135,30 @@ class TestLocateDevicesContainer:
         assert hint == "not found"
 
 
-# ── _find_device_in_list ─────────────────────────────────────────────────────
+# ── normalize_snapshot ───────────────────────────────────────────────────────
 
-class TestFindDeviceInList:
-    def test_found(self):
-        devs = [{"id": "d1"}, {"id": "d2"}, {"id": "d3"}]
-        dev, idx = _find_device_in_list(devs, "d2")
-        assert dev == {"id": "d2"}
-        assert idx == 1
+class TestNormalizeSnapshot:
+    def test_flat_body_moved_to_canonical_layout(self):
+        snap = {"type": "HMIP_SYSTEM_RESPONSE", "body": {"devices": {"d1": {"id": "d1"}}, "groups": {}}}
+        out = normalize_snapshot(snap)
+        assert out["type"] == "HMIP_SYSTEM_RESPONSE"
+        assert out["body"]["body"]["devices"] == {"d1": {"id": "d1"}}
+        assert out["body"]["body"]["home"] == {}
 
-    def test_not_found(self):
-        devs = [{"id": "d1"}]
-        dev, idx = _find_device_in_list(devs, "d99")
-        assert dev is None
-        assert idx is None
+    def test_device_list_becomes_dict(self):
+        out = normalize_snapshot({"body": {"body": {"devices": [{"id": "d1"}, {"id": "d2"}, "junk"]}}})
+        assert list(out["body"]["body"]["devices"]) == ["d1", "d2"]
+
+    def test_home_devices_lifted(self):
+        out = normalize_snapshot({"body": {"body": {"home": {"id": "h", "devices": {"d1": {"id": "d1"}}}}}})
+        inner = out["body"]["body"]
+        assert inner["devices"] == {"d1": {"id": "d1"}}
+        assert inner["home"] == {"id": "h"}
+
+    def test_outer_fields_preserved(self):
+        out = normalize_snapshot({"body": {"clientId": "c", "body": {"groups": [{"id": "g1"}]}}})
+        assert out["body"]["clientId"] == "c"
+        assert out["body"]["body"]["groups"] == {"g1": {"id": "g1"}}
 
 
 # ── save_system_state ────────────────────────────────────────────────────────
@@ -161,7 +171,7 @@ class TestSaveSystemState:
         with open(tmp_snapshot, "r", encoding="utf-8") as f:
             saved = json.load(f)
         assert saved["type"] == "HMIP_SYSTEM_RESPONSE"
-        assert saved["body"]["devices"]["d1"] == {}
+        assert saved["body"]["body"]["devices"]["d1"] == {}
 
     def test_delta_merge(self, tmp_snapshot):
         # Write base snapshot first
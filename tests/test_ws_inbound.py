@@ -0,0 +1,117 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_ws_inbound.py – Tests for the reader/processor split in ws_loop
+
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from app.adapters.hmip_inbound import FrameQueue
+from app.adapters.hmip_websocket import _handle_frame, _process_loop
+from tests.helpers import wait_for
+
+
+class TestFrameQueue:
+    def test_fifo_and_stats(self):
+        q = FrameQueue(maxsize=10)
+        q.put("a")
+        q.put("b")
+        stats = q.stats()
+        assert stats["depth"] == 2
+        assert stats["received"] == 2
+        ts, frame = q.get()
+        assert frame == "a"
+        q.done(ts)
+        assert q.stats()["processed"] == 1
+
+    def test_get_timeout_returns_none(self):
+        assert FrameQueue().get(timeout=0.01) is None
+
+    def test_put_blocks_when_full(self):
+        q = FrameQueue(maxsize=1)
+        q.put("a")
+        done = threading.Event()
+        threading.Thread(target=lambda: (q.put("b"), done.set()), daemon=True).start()
+        assert not done.wait(0.05)
+        q.get()
+        assert done.wait(1.0)
+        assert q.stats()["full_waits"] == 1
+
+    def test_close_drains_then_stops(self):
+        q = FrameQueue(maxsize=1)
+        q.put("a")
+        blocked = threading.Thread(target=q.put, args=("b",), daemon=True)
+        blocked.start()
+        q.close()
+        blocked.join(1.0)
+        assert not blocked.is_alive()
+        assert q.get()[1] == "a"
+        assert q.get() is None
+
+    def test_oldest_age_grows(self):
+        q = FrameQueue()
+        q.put("a")
+        time.sleep(0.02)
+        assert q.oldest_age_ms() >= 10
+
+
+class TestProcessor:
+    def test_event_frame_merged_and_pushed(self):
+        msg = {"type": "HMIP_SYSTEM_EVENT", "body": {"eventTransaction": {"events": {}}}}
+        with patch("app.adapters.hmip_websocket.save_system_state") as save, \
+             patch("app.adapters.hmip_websocket.push_event") as push:
+            _handle_frame(json.dumps(msg))
+        save.assert_called_once_with(msg)
+        push.assert_called_once()
+
+    def test_invalid_json_does_not_raise(self):
+        _handle_frame("{kaputt")
+
+    def test_process_loop_drains_queue(self):
+        q = FrameQueue()
+        handled = []
+        with patch("app.adapters.hmip_websocket._handle_frame", side_effect=handled.append):
+            threading.Thread(target=_process_loop, args=(q,), daemon=True).start()
+            q.put("x")
+            q.put("y")
+            deadline = time.monotonic() + 2
+            while q.stats()["processed"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.005)
+        assert handled == ["x", "y"]
+
+    def test_process_loop_ends_after_close(self):
+        q = FrameQueue()
+        handled = []
+        with patch("app.adapters.hmip_websocket._handle_frame", side_effect=handled.append):
+            q.put("x")
+            q.close()
+            worker = threading.Thread(target=_process_loop, args=(q,), daemon=True)
+            worker.start()
+            worker.join(2)
+        assert not worker.is_alive()
+        assert handled == ["x"]
+
+    def test_housekeeping_error_does_not_kill_processor(self, monkeypatch):
+        monkeypatch.setattr("app.adapters.hmip_websocket._HOUSEKEEPING_INTERVAL_S", 0.01)
+        q = FrameQueue()
+        handled = []
+        with patch("app.adapters.hmip_websocket._handle_frame", side_effect=handled.append), \
+             patch("app.adapters.hmip_websocket._cleanup_pending", side_effect=RuntimeError("kaputt")) as cleanup:
+            worker = threading.Thread(target=_process_loop, args=(q,), daemon=True)
+            worker.start()
+            assert wait_for(lambda: cleanup.call_count >= 2)
+            q.put("x")
+            assert wait_for(lambda: handled == ["x"])
+            q.close()
+            worker.join(2)
+        assert not worker.is_alive()
+
+    def test_housekeeping_not_run_per_frame(self):
+        q = FrameQueue()
+        with patch("app.adapters.hmip_websocket._handle_frame"), \
+             patch("app.adapters.hmip_websocket._cleanup_pending") as cleanup:
+            for i in range(50):
+                q.put(i)
+            q.close()
+            _process_loop(q)
+        assert cleanup.call_count <= 1
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: Apache-2.0
+# tests/test_ws_writer.py – Tests for the outbound WebSocket writer thread
+
+import threading
+import time
+
+import pytest
+
+import app.state as state
+from app.adapters.hmip_messages import send_hmip_set_switch
+from app.adapters.hmip_writer import SendQueueFull, WsWriter
+from tests.helpers import wait_for
+
+
+class TestWsWriter:
+    def test_messages_sent_in_order(self, conn):
+        writer = WsWriter()
+        writer.start()
+        try:
+            for i in range(5):
+                writer.send(f"m{i}")
+            assert wait_for(lambda: len(conn.sent) == 5)
+            assert conn.sent == [f"m{i}" for i in range(5)]
+            assert writer.sent == 5
+        finally:
+            writer.stop()
+
+    def test_send_does_not_block_on_slow_socket(self, conn):
+        gate = threading.Event()
+        conn._block = gate
+        writer = WsWriter()
+        writer.start()
+        try:
+            start = time.monotonic()
+            rid = send_hmip_set_switch(writer, "d1", True, 0)
+            assert rid
+            assert time.monotonic() - start < 0.5
+        finally:
+            gate.set()
+            writer.stop()
+        assert '"deviceId": "d1"' in conn.sent[0]
+
+    def test_full_queue_rejects(self):
+        writer = WsWriter(maxsize=1)
+        writer.send("a")
+        assert writer.full()
+        with pytest.raises(SendQueueFull):
+            writer.send("b")
+        assert writer.dropped == 1
+
+    def test_ping_goes_through_writer(self, conn):
+        writer = WsWriter()
+        writer.start()
+        try:
+            writer.ping()
+            assert wait_for(lambda: conn.pings == 1)
+        finally:
+            writer.stop()
+
+    def test_send_failure_aborts_connection(self, conn):
+        conn._fail = True
+        writer = WsWriter()
+        writer.start()
+        try:
+            writer.send("x")
+            assert wait_for(lambda: conn.aborted)
+        finally:
+            writer.stop()
+
+
+class TestRoutesUseWriter:
+    def test_full_queue_returns_503(self, flask_client, conn):
+        state.REQUIRE_API_KEY = False
+        state.ws_writer = WsWriter(maxsize=1)
+        state.ws_writer.send("belegt")
+        r = flask_client.post("/hmipSwitch", json={"device": "d1", "on": True})
+        assert r.status_code == 503
+
+    def test_switch_is_enqueued(self, flask_client, conn):
+        state.REQUIRE_API_KEY = False
+        state.ws_writer = WsWriter()
+        r = flask_client.post("/hmipSwitch", json={"device": "d1", "on": True})
+        assert r.status_code == 200
+        assert state.ws_writer.depth() == 1
+        assert conn.sent == []